@@ -0,0 +1,577 @@
+"""
+Headless HTTP API for the document assistant (asyncio / aiohttp).
+
+    python -m api.server --port 8080
+
+Endpoints:
+
+    GET  /health     status, corpus size, backends, cache stats
+    GET  /documents  indexed documents
+    POST /ingest     multipart upload, field "file" (a PDF); ?document_id=
+                     keys it (default: derived from the file name and
+                     ?key=, e.g. the folder or user it comes from)
+    POST /search     {"query", "k", "document_ids", "reranker"}
+    POST /answer     {"query", "backend", "document_ids", "stream", "use_cache"}
+
+With "stream": true, /answer returns NDJSON lines as they are produced:
+
+    {"type": "meta", "intent": ..., "pages": [...], ...}
+    {"type": "token", "text": "..."}   (repeated)
+    {"type": "done", "cached": false}
+
+The event loop never does blocking work. Query encoding, Chroma queries
+and reranking run on a CPU-sized thread pool; LLM calls on a larger
+I/O pool; ingests on their own pool, one at a time. The embedding
+model and Chroma handles are the process-wide ones from
+embeddings/registry.py, loaded once at startup.
+
+Every endpoint has a concurrency limit (excess callers wait, beyond a
+queue length they get 503) and a timeout (504). A timed-out call is no
+longer awaited but its worker thread cannot be interrupted; it finishes
+in the background.
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from aiohttp import web
+
+from embeddings.registry import get_embedding_model, registry_metrics
+from indexing.corpus import document_versions, is_indexed, load_corpus
+from indexing.index_chunks import CHROMA_DIR, EMBEDDING_MODEL
+from indexing.pipeline import DocumentConflict, ingest_pdf
+from ingest.pdf_loader import RAW_DIR, compute_document_id, compute_document_version
+from llm.answer_cache import CachedLLM, get_answer_cache
+from llm.base import BackendBusyError
+from llm.registry import available_backends, get_backend
+from observability.tracing import start_trace
+from retrieval.aggregation import aggregate_global, aggregate_section
+from retrieval.query_intent import QueryIntent, detect_intent, section_id_from_query
+from retrieval.rerankers import RERANKERS, get_reranker
+from retrieval.retriever import CANDIDATE_FANOUT, Retriever, cache_stats
+
+# ---------------- CONFIG ---------------- #
+
+HOST = os.getenv("API_HOST", "127.0.0.1")
+PORT = int(os.getenv("API_PORT", "8080"))
+DEFAULT_BACKEND = os.getenv("API_BACKEND", "ollama")
+
+CPU_WORKERS = os.cpu_count() or 1   # query encoding, vector / BM25 search, rerank
+LLM_WORKERS = 16                    # blocking LLM calls and streams (mostly waiting)
+INGEST_WORKERS = os.cpu_count() or 1
+
+# Concurrency limits: (running, waiting); beyond that -> 503
+SEARCH_LIMITS = (CPU_WORKERS * 2, 64)
+ANSWER_LIMITS = (LLM_WORKERS, 64)
+INGEST_LIMITS = (1, 4)              # one writer to the index at a time
+
+# Timeouts (seconds) -> 504
+SEARCH_TIMEOUT = 30
+ANSWER_TIMEOUT = 180                # whole answer, including a stream
+FIRST_TOKEN_TIMEOUT = 60            # stream: until the first token
+INGEST_TIMEOUT = 1800
+
+MAX_K = 100
+SEARCH_K = 25                       # results packed into an answer's context (as app.py)
+MAX_UPLOAD_BYTES = 200 * 2**20
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+# ---------------------------------------- #
+
+CPU_POOL = web.AppKey("cpu_pool", ThreadPoolExecutor)
+LLM_POOL = web.AppKey("llm_pool", ThreadPoolExecutor)
+INGEST_POOL = web.AppKey("ingest_pool", ThreadPoolExecutor)
+LIMITERS = web.AppKey("limiters", dict)
+VECTOR_DIR = web.AppKey("vector_dir", str)
+
+# Caller-supplied document ids are used as chunk id prefixes: keep them plain
+DOCUMENT_ID_RE = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+_json_dumps = functools.partial(json.dumps, ensure_ascii=False, default=str)
+
+
+class _Limiter:
+    """
+    At most `max_concurrent` holders, at most `max_pending` waiting;
+    anyone beyond that is rejected with 503 instead of queueing forever.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_pending: int):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise _error(web.HTTPServiceUnavailable, f"Too many {self.name} requests, retry later",
+                         headers={"Retry-After": "1"})
+
+        self.pending += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.pending -= 1
+
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+
+def _error(status_cls, message: str, headers=None):
+    return status_cls(
+        text=_json_dumps({"error": message}),
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+async def _run(pool, fn, *args, timeout: float = None, **kwargs):
+    """
+    Run blocking `fn` on `pool` without blocking the event loop. The
+    worker runs in a copy of the current context, so its spans land in
+    this request's trace.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    future = loop.run_in_executor(pool, functools.partial(ctx.run, fn, *args, **kwargs))
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        raise _error(web.HTTPGatewayTimeout, f"Timed out after {timeout}s")
+
+
+async def _json_body(request) -> dict:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise _error(web.HTTPBadRequest, "Body must be JSON")
+    if not isinstance(body, dict):
+        raise _error(web.HTTPBadRequest, "Body must be a JSON object")
+
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise _error(web.HTTPBadRequest, "'query' must be a non-empty string")
+
+    document_ids = body.get("document_ids") or []
+    if not isinstance(document_ids, list):
+        raise _error(web.HTTPBadRequest, "'document_ids' must be a list")
+    return body
+
+
+async def _load_corpus(app) -> dict:
+    # Reads and parses corpus.json: file I/O, so not on the event loop
+    return await _run(app[CPU_POOL], load_corpus, app[VECTOR_DIR])
+
+
+async def _require_corpus(request):
+    if not await _load_corpus(request.app):
+        raise _error(web.HTTPConflict, "No documents indexed yet")
+
+
+# ---------------- Blocking work (runs on the pools) ---------------- #
+
+def _retriever(vector_dir, reranker_name: str = "heuristic") -> Retriever:
+    # Cheap: model and Chroma handles come from the process-wide registry
+    return Retriever(reranker=get_reranker(reranker_name), vector_dir=vector_dir)
+
+
+def _search(vector_dir, query, k, document_ids, reranker_name):
+    retriever = _retriever(vector_dir, reranker_name)
+    return retriever.search_with_timings(
+        query, candidate_k=k * CANDIDATE_FANOUT, final_k=k, document_ids=document_ids,
+    )
+
+
+def _build_context(vector_dir, llm, query, document_ids):
+    """
+    Same flow as app.py: section queries read the section index, the
+    rest go through hybrid search; context is packed to the backend's
+    token budget. Returns (intent, agg); agg is None without results.
+    """
+    retriever = _retriever(vector_dir)
+    packing = {"token_budget": llm.context_budget, "count_tokens": llm.count_tokens}
+
+    intent = detect_intent(query)
+    section_id = section_id_from_query(query) if intent == QueryIntent.SECTION else None
+
+    results = retriever.get_section(section_id, document_ids) if section_id else []
+    max_section_chunks = None
+    if not results:
+        results = retriever.search(query, k=SEARCH_K, document_ids=document_ids)
+        max_section_chunks = 8
+
+    if not results:
+        return intent, None
+
+    if intent == QueryIntent.SECTION:
+        agg = aggregate_section(results, section_id, max_chunks=max_section_chunks, **packing)
+    else:
+        agg = aggregate_global(results, **packing)
+
+    if not agg["text"].strip():
+        return intent, None
+
+    agg["index_version"] = document_versions(agg["document_ids"], vector_dir)
+    return intent, agg
+
+
+def _backend(name: str):
+    if name not in available_backends():
+        raise _error(web.HTTPBadRequest, f"Unknown backend: {name}")
+    try:
+        return CachedLLM(get_backend(name))
+    except RuntimeError as e:
+        # Missing API key / model file / optional package
+        raise _error(web.HTTPServiceUnavailable, str(e))
+
+
+# ---------------- Handlers ---------------- #
+
+async def health(request):
+    app = request.app
+    corpus = await _load_corpus(app)
+    return web.json_response({
+        "status": "ok",
+        "documents": len(corpus),
+        "backends": available_backends(),
+        "limits": {name: limiter.stats() for name, limiter in app[LIMITERS].items()},
+        "caches": {
+            "models": registry_metrics(),
+            "retrieval": cache_stats(),
+            "answers": get_answer_cache().stats(),
+        },
+    }, dumps=_json_dumps)
+
+
+async def documents(request):
+    return web.json_response(await _load_corpus(request.app), dumps=_json_dumps)
+
+
+async def search(request):
+    body = await _json_body(request)
+
+    k = body.get("k", 10)
+    if not isinstance(k, int) or not 1 <= k <= MAX_K:
+        raise _error(web.HTTPBadRequest, f"'k' must be an integer in [1, {MAX_K}]")
+
+    reranker_name = body.get("reranker", "heuristic")
+    if reranker_name not in RERANKERS:
+        raise _error(web.HTTPBadRequest, f"Unknown reranker: {reranker_name}")
+
+    await _require_corpus(request)
+
+    app = request.app
+    async with app[LIMITERS]["search"].slot():
+        out = await _run(
+            app[CPU_POOL], _search,
+            app[VECTOR_DIR], body["query"], k, body.get("document_ids"), reranker_name,
+            timeout=SEARCH_TIMEOUT,
+        )
+
+    return web.json_response(out, dumps=_json_dumps)
+
+
+async def answer(request):
+    body = await _json_body(request)
+    query = body["query"]
+    stream = bool(body.get("stream", False))
+    use_cache = bool(body.get("use_cache", True))
+
+    await _require_corpus(request)
+
+    app = request.app
+    async with app[LIMITERS]["answer"].slot():
+        llm = await _run(app[LLM_POOL], _backend, body.get("backend", DEFAULT_BACKEND))
+
+        async with app[LIMITERS]["search"].slot():
+            intent, agg = await _run(
+                app[CPU_POOL], _build_context,
+                app[VECTOR_DIR], llm, query, body.get("document_ids"),
+                timeout=SEARCH_TIMEOUT,
+            )
+
+        if agg is None:
+            return web.json_response({
+                "answer": "No relevant content found in the document.",
+                "intent": intent.name,
+                "pages": [],
+                "cached": False,
+            })
+
+        meta = {
+            "intent": intent.name,
+            "backend": llm.name,
+            "model": llm.model,
+            "pages": agg["pages"],
+            "document_ids": agg["document_ids"],
+            "context_tokens": agg["tokens"],
+        }
+
+        if not stream:
+            text = await _run(
+                app[LLM_POOL], llm.answer,
+                query, agg["text"], intent.name,
+                index_version=agg["index_version"], use_cache=use_cache,
+                timeout=ANSWER_TIMEOUT,
+            )
+            return web.json_response({"answer": text, **meta, "cached": llm.last_cached},
+                                     dumps=_json_dumps)
+
+        tokens = functools.partial(
+            llm.stream_answer, query, agg["text"], intent.name,
+            index_version=agg["index_version"], use_cache=use_cache,
+        )
+        return await _stream_answer(request, tokens, meta, lambda: llm.last_cached)
+
+
+async def _stream_answer(request, make_stream, meta, was_cached):
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    async def send(item):
+        await response.write((_json_dumps(item) + "\n").encode("utf-8"))
+
+    await send({"type": "meta", **meta})
+    try:
+        async for token in _iterate_in_thread(request.app[LLM_POOL], make_stream):
+            await send({"type": "token", "text": token})
+        await send({"type": "done", "cached": was_cached()})
+    except web.HTTPException as e:
+        # Headers are already sent: report in-band
+        await send({"type": "error", "error": json.loads(e.text)["error"]})
+
+    await response.write_eof()
+    return response
+
+
+_TOKEN, _ERROR, _END = range(3)
+
+
+async def _iterate_in_thread(pool, make_stream):
+    """
+    Consume a blocking token generator on `pool`, yielding tokens on the
+    event loop as they arrive. Enforces FIRST_TOKEN_TIMEOUT and
+    ANSWER_TIMEOUT. If the consumer stops early (client disconnect,
+    timeout) the generator is closed at the next token, so an
+    abandoned answer is not cached.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    stop = threading.Event()
+
+    def emit(kind, value=None):
+        try:
+            loop.call_soon_threadsafe(items.put_nowait, (kind, value))
+        except RuntimeError:   # loop already closed
+            stop.set()
+
+    def produce():
+        stream = make_stream()
+        try:
+            for token in stream:
+                if stop.is_set():
+                    break
+                emit(_TOKEN, token)
+        except Exception as e:
+            emit(_ERROR, e)
+        finally:
+            stream.close()
+            emit(_END)
+
+    ctx = contextvars.copy_context()
+    loop.run_in_executor(pool, ctx.run, produce)
+
+    deadline = loop.time() + ANSWER_TIMEOUT
+    first_deadline = loop.time() + FIRST_TOKEN_TIMEOUT
+    first = True
+    try:
+        while True:
+            timeout = min(deadline, first_deadline) if first else deadline
+            try:
+                kind, value = await asyncio.wait_for(items.get(), timeout - loop.time())
+            except asyncio.TimeoutError:
+                raise _error(web.HTTPGatewayTimeout, "Answer timed out")
+
+            if kind == _END:
+                return
+            if kind == _ERROR:
+                raise _error(web.HTTPBadGateway, f"{type(value).__name__}: {value}")
+            first = False
+            yield value
+    finally:
+        stop.set()
+
+
+async def ingest(request):
+    if not request.content_type.startswith("multipart/"):
+        raise _error(web.HTTPBadRequest, "Upload the PDF as multipart/form-data, field 'file'")
+
+    reader = await request.multipart()
+    field = await reader.next()
+    while field is not None and field.name != "file":
+        field = await reader.next()
+    if field is None or not field.filename:
+        raise _error(web.HTTPBadRequest, "Missing 'file' field")
+
+    filename = Path(field.filename).name
+    if not filename.lower().endswith(".pdf"):
+        raise _error(web.HTTPBadRequest, "Only PDF files are supported")
+
+    # Re-uploading under the same id replaces the previous version
+    document_id = request.query.get("document_id") or compute_document_id(
+        filename, key=request.query.get("key")
+    )
+    if not DOCUMENT_ID_RE.fullmatch(document_id):
+        raise _error(web.HTTPBadRequest, "'document_id' may only use letters, digits, '.', '_' and '-'")
+
+    app = request.app
+    async with app[LIMITERS]["ingest"].slot():
+        pdf_path = await _save_upload(field, RAW_DIR / filename)
+
+        version = await _run(app[CPU_POOL], compute_document_version, pdf_path)
+        indexed = await _run(
+            app[CPU_POOL], is_indexed, document_id, app[VECTOR_DIR], version=version
+        )
+        if indexed:
+            return web.json_response({
+                "document_id": document_id,
+                "source": filename,
+                "version": version,
+                "status": "already_indexed",
+            })
+
+        try:
+            stats = await _run(
+                app[INGEST_POOL], ingest_pdf,
+                pdf_path, document_id=document_id, source=filename, version=version,
+                workers=INGEST_WORKERS, vector_dir=app[VECTOR_DIR],
+                timeout=INGEST_TIMEOUT,
+            )
+        except DocumentConflict as e:
+            raise _error(web.HTTPConflict, str(e))
+
+    status = "replaced" if stats["previous_version"] else "indexed"
+    return web.json_response({**stats, "status": status}, dumps=_json_dumps)
+
+
+async def _save_upload(field, path: Path) -> Path:
+    # Written under a temporary name: a cut-off upload never looks like a PDF
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".part")
+    size = 0
+
+    try:
+        with open(partial, "wb") as f:
+            while True:
+                chunk = await field.read_chunk(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise _error(web.HTTPRequestEntityTooLarge,
+                                 f"Upload exceeds {MAX_UPLOAD_BYTES // 2**20} MB")
+                await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(os.replace, partial, path)
+    finally:
+        partial.unlink(missing_ok=True)
+
+    return path
+
+
+# ---------------- App ---------------- #
+
+@web.middleware
+async def trace_requests(request, handler):
+    """
+    One trace per request (recorded when TRACING=1), with the caller's
+    X-Request-ID if given. Backend overload maps to 503.
+    """
+    with start_trace(f"api {request.path}", request_id=request.headers.get("X-Request-ID"),
+                     method=request.method) as trace:
+        try:
+            response = await handler(request)
+        except BackendBusyError as e:
+            error = _error(web.HTTPServiceUnavailable, str(e), headers={"Retry-After": "1"})
+            _tag(error, trace)
+            raise error
+        except web.HTTPException as e:
+            _tag(e, trace)
+            raise
+
+        _tag(response, trace)
+        return response
+
+
+def _tag(response, trace):
+    # Streamed responses have already sent their headers
+    if trace is not None and not getattr(response, "prepared", False):
+        response.headers["X-Request-ID"] = trace.request_id
+
+
+async def _startup(app):
+    app[CPU_POOL] = ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix="api-cpu")
+    app[LLM_POOL] = ThreadPoolExecutor(LLM_WORKERS, thread_name_prefix="api-llm")
+    app[INGEST_POOL] = ThreadPoolExecutor(1, thread_name_prefix="api-ingest")
+    app[LIMITERS] = {
+        "search": _Limiter("search", *SEARCH_LIMITS),
+        "answer": _Limiter("answer", *ANSWER_LIMITS),
+        "ingest": _Limiter("ingest", *INGEST_LIMITS),
+    }
+
+    # Load the embedding model once, before the first request needs it
+    await _run(app[CPU_POOL], get_embedding_model, EMBEDDING_MODEL)
+
+
+async def _cleanup(app):
+    for key in (CPU_POOL, LLM_POOL, INGEST_POOL):
+        app[key].shutdown(wait=False, cancel_futures=True)
+
+
+def create_app(vector_dir=CHROMA_DIR) -> web.Application:
+    app = web.Application(middlewares=[trace_requests], client_max_size=MAX_UPLOAD_BYTES)
+    app[VECTOR_DIR] = str(vector_dir)
+    app.on_startup.append(_startup)
+    app.on_cleanup.append(_cleanup)
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/documents", documents),
+        web.post("/ingest", ingest),
+        web.post("/search", search),
+        web.post("/answer", answer),
+    ])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document assistant HTTP API")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--vector-dir", default=CHROMA_DIR)
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.vector_dir), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,40 @@
-import shutil
+import os
+import uuid
 from pathlib import Path
 import streamlit as st
-import json
 
-from ingest.pdf_loader import extract_pdf_pages
-from preprocessing.chunker import chunk_pages
-from indexing.index_chunks import main as index_chunks_main
+from ingest.pdf_loader import compute_document_id, compute_document_version
+from indexing.corpus import document_versions, load_corpus
+from indexing.jobs import ACTIVE_STATES, CANCELLED, DONE, get_job_queue
 
-from retrieval.retriever import Retriever
-from retrieval.query_intent import detect_intent, QueryIntent
+from retrieval.retriever import Retriever, cache_stats
+from retrieval.rerankers import RERANKERS, get_reranker
+from embeddings.registry import registry_metrics
+from retrieval.query_intent import detect_intent, section_id_from_query, QueryIntent
 from retrieval.aggregation import aggregate_section, aggregate_global
+from retrieval.context_packer import DEFAULT_TOKEN_BUDGET
 
-from llm.offline_ollama import OfflineLLM
-from llm.online_gemini import OnlineGeminiLLM
+from llm.answer_cache import CachedLLM, get_answer_cache
+from llm.registry import available_backends, get_backend
+from observability.tracing import format_trace, start_trace
 
 # Paths
 RAW_DIR = Path("data/raw")
 PROCESSED_DIR = Path("data/processed")
 VECTOR_DIR = Path("data/vector_db")
+UPLOAD_DIR = RAW_DIR / ".uploads"   # uploads waiting to be indexed (not globbed by pdf_loader)
 
 RAW_DIR.mkdir(parents=True, exist_ok=True)
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
-PAGES_FILE = PROCESSED_DIR / "pages.json"
-CHUNKS_FILE = PROCESSED_DIR / "chunks.json"
+# Ingest
+INGEST_WORKERS = os.cpu_count() or 1
+SAVE_INTERMEDIATE_FILES = False  # write pages.jsonl / chunks.jsonl for debugging
+JOB_POLL_SECONDS = 1.0           # refresh rate of the indexing progress panel
+
+# LLM backends offered in the UI (see llm/registry.py for all of them)
+UI_BACKENDS = ["ollama", "gemini", "llama-cpp", "fake"]
+RETRIEVAL_ONLY = "Retrieval only (Non-LLM)"
 
 # Streamlit config
 st.set_page_config(
@@ -40,13 +51,24 @@ st.caption("Chat with your documents — Non-LLM | Offline LLaMA | Online Gemini
 with st.sidebar:
     st.header("Settings")
 
+    backend_labels = {
+        label: name for name, label in available_backends().items() if name in UI_BACKENDS
+    }
     mode = st.radio(
         "Inference mode",
-        [
-            "Retrieval only (Non-LLM)",
-            "Offline LLM (LLaMA-3 via Ollama)",
-            "Online LLM (Gemini)",
-        ],
+        [RETRIEVAL_ONLY, *backend_labels],
+    )
+
+    reranker_name = st.selectbox(
+        "Reranker",
+        list(RERANKERS),
+        help="cross-encoder is more accurate but slower on CPU",
+    )
+
+    use_answer_cache = st.checkbox(
+        "Reuse cached answers",
+        value=True,
+        help="Untick to always ask the LLM again",
     )
 
     uploaded_file = st.file_uploader(
@@ -54,61 +76,196 @@ with st.sidebar:
         type=["pdf"],
     )
 
+    show_timings = st.checkbox(
+        "Debug: show timings",
+        help="Trace each question and show where the time went",
+    )
+
+    with st.expander("Caches"):
+        st.json({
+            "models": registry_metrics(),
+            "retrieval": cache_stats(),
+            "answers": get_answer_cache().stats(),
+        })
+
     if st.button("Reset chat"):
         st.session_state.chat = []
-        st.session_state.indexed = False
         st.rerun()
 
 # Session state
 if "chat" not in st.session_state:
     st.session_state.chat = []
 
-if "indexed" not in st.session_state:
-    st.session_state.indexed = False
+if "last_upload" not in st.session_state:
+    st.session_state.last_upload = None
+
+if "job_states" not in st.session_state:
+    st.session_state.job_states = {}
+
+# PDF ingestion & indexing
+# Each PDF is keyed by its file name and versioned by its content hash; an
+# upload only adds (or replaces, re-embedding just the changed chunks) that
+# one document in the persistent corpus. Indexing runs as a background
+# job (indexing/jobs.py), so chatting with indexed documents continues.
+
+jobs = get_job_queue()
+upload_key = uploaded_file.file_id if uploaded_file else None
+
+
+def save_upload(uploaded_file):
+    """
+    Write an upload under UPLOAD_DIR, named after its content hash, so a
+    re-upload of the same name never rewrites a file a job is reading.
+    Returns (path, version).
+    """
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    partial = UPLOAD_DIR / f"{uuid.uuid4().hex}.part"
+    partial.write_bytes(uploaded_file.getvalue())
+
+    version = compute_document_version(partial)
+    pdf_path = UPLOAD_DIR / f"{Path(uploaded_file.name).stem}.{version}.pdf"
+    os.replace(partial, pdf_path)
+    return pdf_path, version
+
+
+def index_upload(pdf_path, document_id, source, version):
+    # extract → chunk → embed → upsert, streamed through bounded
+    # queues; pages.jsonl / chunks.jsonl only when debugging. Once
+    # indexed, the file takes its place in data/raw under `source`.
+    jobs.submit(
+        pdf_path,
+        document_id,
+        source=source,
+        version=version,
+        keep_as=RAW_DIR / source,
+        workers=INGEST_WORKERS,
+        debug_dir=PROCESSED_DIR / document_id if SAVE_INTERMEDIATE_FILES else None,
+    )
+    st.toast(f"Indexing {source} in the background…")
 
-# PDF ingestion & indexing 
 
-if uploaded_file and not st.session_state.indexed:
-    with st.spinner("Indexing document… This may take a minute."):
+def drop_pending_replace():
+    pending = st.session_state.get("pending_replace")
+    if pending:
+        pending["pdf_path"].unlink(missing_ok=True)
+    st.session_state.pending_replace = None
 
-        # Clear previous data
-        shutil.rmtree(RAW_DIR, ignore_errors=True)
-        shutil.rmtree(PROCESSED_DIR, ignore_errors=True)
-        shutil.rmtree(VECTOR_DIR, ignore_errors=True)
 
-        RAW_DIR.mkdir(parents=True, exist_ok=True)
-        PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+if uploaded_file and st.session_state.last_upload != upload_key:
+    pdf_path, version = save_upload(uploaded_file)
+    document_id = compute_document_id(uploaded_file.name)
+    indexed = load_corpus(VECTOR_DIR).get(document_id)
 
-        # Save uploaded PDF
-        pdf_path = RAW_DIR / uploaded_file.name
-        with open(pdf_path, "wb") as f:
-            f.write(uploaded_file.read())
+    if indexed is None:
+        index_upload(pdf_path, document_id, uploaded_file.name, version)
+    elif indexed.get("version") == version:
+        st.info(f"{uploaded_file.name} is already indexed.")
+        pdf_path.unlink(missing_ok=True)
+    else:
+        # Same name, other content: an edit, or an unrelated file that
+        # happens to share the name. Only the user knows which.
+        drop_pending_replace()
+        st.session_state.pending_replace = {
+            "pdf_path": pdf_path,
+            "document_id": document_id,
+            "source": uploaded_file.name,
+            "version": version,
+        }
+
+    st.session_state.last_upload = upload_key
+
+pending = st.session_state.get("pending_replace")
+if pending:
+    with st.sidebar:
+        st.warning(
+            f"A different {pending['source']} is already indexed. Replace it "
+            "(only changed chunks are re-embedded) or keep both?"
+        )
+        replace_col, keep_col = st.columns(2)
+        if replace_col.button("Replace"):
+            index_upload(**pending)
+            st.session_state.pending_replace = None
+        if keep_col.button("Keep both"):
+            # A separate document under its own name
+            stem = Path(pending["source"]).stem
+            source = f"{stem} ({pending['version'][:6]}).pdf"
+            index_upload(pending["pdf_path"], compute_document_id(source), source, pending["version"])
+            st.session_state.pending_replace = None
+
+
+def indexing_panel():
+    """
+    Progress of queued / running jobs and the outcome of finished ones.
+    Re-rendered on its own every JOB_POLL_SECONDS while jobs are active;
+    a job that just finished triggers a full rerun so the corpus and the
+    retriever pick up the new document.
+    """
+    seen = st.session_state.job_states
+    finished_now = False
+
+    for job in jobs.jobs():
+        info = job.snapshot()
+        if seen.get(info["id"]) in ACTIVE_STATES and info["state"] not in ACTIVE_STATES:
+            finished_now = True
+        seen[info["id"]] = info["state"]
+
+        if info["state"] in ACTIVE_STATES:
+            p = info["progress"]
+            st.progress(
+                info["fraction"],
+                text=(
+                    f"{info['source']}: {p['stage']}, page {p['pages_done']}/{p['pages_total']}, "
+                    f"{p['vectors']} chunks embedded"
+                ),
+            )
+            if st.button("Cancel", key=f"cancel-job-{info['id']}"):
+                jobs.cancel(info["id"])
+        elif info["state"] == DONE:
+            st.caption(f"✓ {info['source']} indexed ({info['stats']['chunks']} chunks)")
+        elif info["state"] == CANCELLED:
+            st.caption(f"✗ {info['source']}: cancelled")
+        else:
+            st.caption(f"⚠ {info['source']}: {info['error']}")
 
-        # ---- PDF → pages.json ----
-        pages = extract_pdf_pages(pdf_path)
-        with open(PAGES_FILE, "w", encoding="utf-8") as f:
-            json.dump(pages, f, indent=2, ensure_ascii=False)
+    if finished_now:
+        st.rerun()
 
-        # ---- pages → chunks.json ----
-        chunks = chunk_pages(pages)
-        with open(CHUNKS_FILE, "w", encoding="utf-8") as f:
-            json.dump(chunks, f, indent=2, ensure_ascii=False)
 
-        # ---- chunks → vector DB ----
-        index_chunks_main()
+with st.sidebar:
+    if jobs.jobs():
+        st.subheader("Indexing")
+        poll = JOB_POLL_SECONDS if jobs.active_jobs() else None
+        st.fragment(run_every=poll)(indexing_panel)()
 
-        st.session_state.indexed = True
+corpus = load_corpus(VECTOR_DIR)
 
-    st.success("Document indexed successfully. Ask away!")
+with st.sidebar:
+    selected_documents = st.multiselect(
+        "Search in documents (empty = all)",
+        options=list(corpus),
+        format_func=lambda doc_id: corpus[doc_id]["filename"],
+    )
 
 # Load retriever & LLM
-retriever = Retriever()
+# Model and Chroma handles come from the process-wide registry, so this is
+# cheap on every rerun; only the first call pays the load cost.
+retriever = Retriever(reranker=get_reranker(reranker_name)) if corpus else None
 llm = None
 
-if mode == "Offline LLM (LLaMA-3 via Ollama)":
-    llm = OfflineLLM()
-elif mode == "Online LLM (Gemini)":
-    llm = OnlineGeminiLLM()
+if mode != RETRIEVAL_ONLY:
+    try:
+        # Answers are cached per (backend, model, intent, question, context)
+        llm = CachedLLM(get_backend(backend_labels[mode]))
+    except RuntimeError as e:
+        # Missing API key / model file / optional package
+        st.sidebar.error(str(e))
+
+# Context is packed to the answering backend's budget, counted with its
+# own tokenizer, so prompt size (and prefill time) stays bounded
+packing = {
+    "token_budget": llm.context_budget if llm else DEFAULT_TOKEN_BUDGET,
+    "count_tokens": llm.count_tokens if llm else None,
+}
 
 # Render chat history
 for msg in st.session_state.chat:
@@ -119,41 +276,70 @@ for msg in st.session_state.chat:
 query = st.chat_input("Ask a question about the document…")
 
 if query:
-    if not st.session_state.indexed:
+    if not corpus:
         st.warning("Please upload and index a PDF first.")
     else:
-        st.session_state.chat.append({"role": "user", "content": query})
-        with st.chat_message("user"):
-            st.markdown(query)
-
-        intent = detect_intent(query)
-        results = retriever.search(query, k=25)
-
-        if not results:
-            answer = "No relevant content found in the document."
-        else:
-            if intent == QueryIntent.SECTION:
-                section_id = "".join(c for c in query if c.isdigit() or c == ".").strip(".")
-                agg = aggregate_section(results, section_id)
-                context = agg["text"]
-
-                if not context.strip():
-                    answer = "No content found for that section."
-                elif llm:
-                    with st.spinner("Thinking…"):
-                        answer = llm.answer(query, context, intent.name)
-                else:
-                    answer = context
+        # One trace per question: request id + span per stage (intent,
+        # retrieval stages, packing, LLM). Free unless enabled.
+        with start_trace("chat", force=show_timings, mode=mode) as trace:
+            st.session_state.chat.append({"role": "user", "content": query})
+            with st.chat_message("user"):
+                st.markdown(query)
+
+            intent = detect_intent(query)
+            section_id = section_id_from_query(query) if intent == QueryIntent.SECTION else None
+
+            # Section queries read the whole section from the section index;
+            # semantic search is only the fallback for indexes built without it
+            results = retriever.get_section(section_id, selected_documents) if section_id else []
+            max_section_chunks = None
+            if not results:
+                results = retriever.search(query, k=25, document_ids=selected_documents)
+                max_section_chunks = 8
+
+            answer, answer_stream = None, None
+
+            if not results:
+                answer = "No relevant content found in the document."
             else:
-                agg = aggregate_global(results)
-                context = agg["text"]
-
-                if llm:
-                    with st.spinner("Thinking…"):
-                        answer = llm.answer(query, context, intent.name)
+                if intent == QueryIntent.SECTION:
+                    agg = aggregate_section(results, section_id, max_chunks=max_section_chunks, **packing)
+                    context = agg["text"]
+
+                    if not context.strip():
+                        answer = "No content found for that section."
+                    elif llm:
+                        answer_stream = llm.stream_answer(
+                            query, context, intent.name,
+                            index_version=document_versions(agg["document_ids"], VECTOR_DIR),
+                            use_cache=use_answer_cache,
+                        )
+                    else:
+                        answer = context
                 else:
-                    answer = context
+                    agg = aggregate_global(results, **packing)
+                    context = agg["text"]
+
+                    if llm:
+                        answer_stream = llm.stream_answer(
+                            query, context, intent.name,
+                            index_version=document_versions(agg["document_ids"], VECTOR_DIR),
+                            use_cache=use_answer_cache,
+                        )
+                    else:
+                        answer = context
+
+            with st.chat_message("assistant"):
+                if answer_stream is not None:
+                    # Render tokens as they arrive instead of waiting for the full answer
+                    answer = st.write_stream(answer_stream)
+                    if llm.last_cached:
+                        st.caption("Cached answer")
+                else:
+                    st.markdown(answer)
 
         st.session_state.chat.append({"role": "assistant", "content": answer})
-        with st.chat_message("assistant"):
-            st.markdown(answer)
+
+        if show_timings and trace is not None:
+            with st.expander(f"Timings (request {trace.request_id})"):
+                st.code(format_trace(trace), language=None)
@@ -1,9 +1,9 @@
-from sentence_transformers import SentenceTransformer
+from embeddings.registry import get_embedding_model
 
 
 class Embedder:
     def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+        self.model = get_embedding_model(model_name)
 
     def embed_texts(self, texts):
         return self.model.encode(texts, show_progress_bar=True)
@@ -0,0 +1,318 @@
+import hashlib
+import json
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+
+# ---------------- CONFIG ---------------- #
+
+CACHE_DIR = Path("data/embedding_cache")
+MAX_ENTRIES = 200_000
+
+INITIAL_CAPACITY = 1024
+EVICT_FRACTION = 0.1  # evict in batches so a full cache is not rewritten per insert
+FLUSH_EVERY = 4096    # buffered new vectors that trigger a flush
+
+# ---------------------------------------- #
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache for one model, keyed by normalized text hash.
+
+    Layout (one directory per model):
+        vectors.f32  raw float32 matrix (capacity x dim), memory-mapped
+        index.json   {"dim", "capacity", "tick", "entries": {key: [slot, last_used]}}
+        index.lock   advisory file lock shared by every process using the dir
+
+    Vectors are stored L2-normalized, i.e. as produced by
+    encode(..., normalize_embeddings=True). When `max_entries` is reached the
+    least recently used entries are evicted and their slots reused.
+
+    Several processes (the app, the API, an index_chunks run) may share the
+    directory. New vectors are buffered in memory and written by flush()
+    (or every FLUSH_EVERY new entries) as one transaction under an
+    exclusive lock: re-read index.json, merge, allocate slots, write the
+    vectors, then the index. Lookups hold a shared lock and reload the
+    index if another process committed, so a slot reused elsewhere is
+    never read through a stale index. Without fcntl (Windows) there is no
+    cross-process lock: use one writer per cache dir there.
+    """
+
+    def __init__(self, model_name: str, cache_dir=CACHE_DIR, max_entries: int = MAX_ENTRIES):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dir = Path(cache_dir) / re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.vectors_file = self.dir / "vectors.f32"
+        self.index_file = self.dir / "index.json"
+        self.lock_file = self.dir / "index.lock"
+
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._index_stamp = None
+        self.dim = None
+        self.capacity = 0
+        self.tick = 0
+        self.entries = {}
+        self.free_slots = []
+
+        # Not yet on disk: new vectors, and entries used since the last flush
+        self._pending = {}
+        self._touched = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        with self._file_lock(exclusive=False):
+            self._sync()
+
+    # ---------------- persistence ---------------- #
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _stamp(self):
+        try:
+            st = self.index_file.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _sync(self):
+        """
+        Reload index.json if another writer replaced it. Call with the
+        file lock held.
+        """
+        stamp = self._stamp()
+        if stamp == self._index_stamp:
+            return
+        self._index_stamp = stamp
+        if stamp is None or not self.vectors_file.exists():
+            return
+
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.dim = index["dim"]
+        self.capacity = index["capacity"]
+        self.tick = max(self.tick, index["tick"])
+        self.entries = {k: list(v) for k, v in index["entries"].items()}
+
+        self._vectors = None
+        self._open_vectors()
+
+        used = {slot for slot, _ in self.entries.values()}
+        self.free_slots = [s for s in range(self.capacity) if s not in used]
+
+    def _open_vectors(self):
+        self._vectors = np.memmap(
+            self.vectors_file, dtype=np.float32, mode="r+",
+            shape=(self.capacity, self.dim)
+        )
+
+    def _grow(self, needed: int):
+        new_capacity = max(self.capacity, INITIAL_CAPACITY)
+        while new_capacity < needed:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self.max_entries)
+        if new_capacity <= self.capacity:
+            return
+
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.vectors_file, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+
+        self.free_slots.extend(range(self.capacity, new_capacity))
+        self.capacity = new_capacity
+        self._open_vectors()
+
+    def _evict(self, needed: int):
+        count = max(needed, int(self.max_entries * EVICT_FRACTION))
+        oldest = sorted(self.entries.items(), key=lambda kv: kv[1][1])[:count]
+        for key, (slot, _) in oldest:
+            del self.entries[key]
+            self.free_slots.append(slot)
+        self.evictions += len(oldest)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending and not self._touched:
+            return
+
+        with self._file_lock(exclusive=True):
+            # Merge onto whatever other writers committed meanwhile
+            self._sync()
+            self.tick += 1
+
+            for key in self._touched:
+                if key in self.entries:
+                    self.entries[key][1] = self.tick
+
+            new_keys = [(k, v) for k, v in self._pending.items() if k not in self.entries]
+            # Never keep more than max_entries: newest texts win
+            new_keys = new_keys[-self.max_entries:]
+
+            if new_keys:
+                if self.dim is None:
+                    self.dim = len(new_keys[0][1])
+
+                missing = len(new_keys) - len(self.free_slots)
+                if missing > 0:
+                    self._grow(len(self.entries) + len(new_keys))
+                    missing = len(new_keys) - len(self.free_slots)
+                if missing > 0:
+                    self._evict(missing)
+
+                for key, vector in new_keys:
+                    slot = self.free_slots.pop()
+                    self._vectors[slot] = vector
+                    self.entries[key] = [slot, self.tick]
+
+            if self._vectors is not None:
+                # Vectors reach the disk before the index that points at them
+                self._vectors.flush()
+
+                tmp = self.index_file.with_suffix(".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "model": self.model_name,
+                        "dim": self.dim,
+                        "capacity": self.capacity,
+                        "tick": self.tick,
+                        "entries": self.entries,
+                    }, f)
+                tmp.replace(self.index_file)
+                self._index_stamp = self._stamp()
+
+        self._pending.clear()
+        self._touched.clear()
+
+    # ---------------- lookups ---------------- #
+
+    def lookup(self, texts):
+        """
+        Returns a list aligned with `texts`: a float32 vector on hit, None on miss.
+        """
+        with self._lock, self._file_lock(exclusive=False):
+            self._sync()
+            found = []
+            for text in texts:
+                key = text_key(text)
+                pending = self._pending.get(key)
+                if pending is not None:
+                    self.hits += 1
+                    found.append(pending.copy())
+                    continue
+
+                entry = self.entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                    found.append(None)
+                    continue
+
+                self._touched.add(key)
+                self.hits += 1
+                found.append(np.array(self._vectors[entry[0]]))
+            return found
+
+    def store(self, texts, vectors):
+        """
+        Buffer new vectors; they are written (and visible to other
+        processes) on the next flush.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}"
+                )
+
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                if key in self.entries:
+                    self._touched.add(key)
+                else:
+                    self._pending[key] = vector.copy()
+
+            if len(self._pending) >= FLUSH_EVERY:
+                self._flush()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": len(self.entries) + len(self._pending),
+            "capacity": self.capacity,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def cached_encode(model, texts, cache: EmbeddingCache, **encode_kwargs):
+    """
+    Encode `texts`, only running the model on cache misses.
+    Always returns normalized float32 embeddings, shape (len(texts), dim).
+    """
+    found = cache.lookup(texts)
+    missing = [i for i, v in enumerate(found) if v is None]
+
+    if missing:
+        encode_kwargs.setdefault("show_progress_bar", False)
+        fresh = model.encode(
+            [texts[i] for i in missing],
+            normalize_embeddings=True,
+            **encode_kwargs
+        )
+        fresh = np.asarray(fresh, dtype=np.float32)
+        cache.store([texts[i] for i in missing], fresh)
+        for i, vector in zip(missing, fresh):
+            found[i] = vector
+
+    if not found:
+        return np.zeros((0, cache.dim or 0), dtype=np.float32)
+    return np.vstack(found)
@@ -0,0 +1,161 @@
+import time
+
+import numpy as np
+
+from embeddings.registry import DEFAULT_EMBEDDING_MODEL, get_embedding_model
+
+# ---------------- CONFIG ---------------- #
+
+INITIAL_BATCH_SIZE = 32
+MIN_BATCH_SIZE = 4
+MAX_BATCH_SIZE = 512
+
+TARGET_BATCH_SECONDS = 0.5   # latency budget per encode call
+MAX_BATCH_TOKENS = 16_384    # memory budget: batch_size x padded length
+
+CHARS_PER_TOKEN = 4          # rough estimate, good enough for budgeting
+
+# ---------------------------------------- #
+
+
+class EmbeddingEngine:
+    """
+    Throughput-oriented chunk encoder.
+
+    - texts are encoded longest-first, so every batch holds texts of
+      similar length and little compute is wasted on padding
+    - the batch size adapts after every call to stay near
+      TARGET_BATCH_SECONDS, and is capped so batch_size x padded length
+      stays under MAX_BATCH_TOKENS
+    - with processes > 1 each batch is sharded across a
+      sentence-transformers multi-process pool (one worker per core)
+    - an optional EmbeddingCache skips texts that were encoded before
+
+    Output is always L2-normalized float32 in the original input order.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, cache=None,
+                 processes: int = 1,
+                 target_batch_seconds: float = TARGET_BATCH_SECONDS,
+                 max_batch_tokens: int = MAX_BATCH_TOKENS,
+                 initial_batch_size: int = INITIAL_BATCH_SIZE):
+        self.model = get_embedding_model(model_name)
+        self.cache = cache
+        self.processes = processes
+        self.target_batch_seconds = target_batch_seconds
+        self.max_batch_tokens = max_batch_tokens
+        self.batch_size = initial_batch_size
+
+        self.max_seq_tokens = getattr(self.model, "max_seq_length", None) or 512
+
+        self._pool = None
+        if processes > 1:
+            self._pool = self.model.start_multi_process_pool(
+                target_devices=["cpu"] * processes
+            )
+
+        self.texts_encoded = 0
+        self.encode_seconds = 0.0
+        self.batches = 0
+
+    # ---------------- lifecycle ---------------- #
+
+    def close(self):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------- encoding ---------------- #
+
+    def _estimate_tokens(self, text: str) -> int:
+        return min(len(text) // CHARS_PER_TOKEN + 2, self.max_seq_tokens)
+
+    def _encode_batch(self, texts):
+        if self._pool is not None:
+            vectors = self.model.encode_multi_process(
+                texts, self._pool,
+                batch_size=max(1, len(texts) // self.processes),
+            )
+        else:
+            vectors = self.model.encode(
+                texts, batch_size=len(texts), show_progress_bar=False
+            )
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _adapt(self, batch_len: int, elapsed: float):
+        if elapsed <= 0 or batch_len == 0:
+            return
+
+        per_text = elapsed / batch_len
+        wanted = self.target_batch_seconds / per_text
+
+        # Move halfway (geometrically) towards the target to avoid oscillation
+        new_size = int(np.sqrt(self.batch_size * wanted))
+        self.batch_size = int(np.clip(new_size, MIN_BATCH_SIZE, MAX_BATCH_SIZE))
+
+    def _encode_uncached(self, texts):
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        out = [None] * len(texts)
+
+        pos = 0
+        while pos < len(order):
+            # Longest text in the batch is the first one (descending order)
+            padded = self._estimate_tokens(texts[order[pos]])
+            size = min(self.batch_size, max(1, self.max_batch_tokens // padded))
+            if self._pool is not None:
+                size *= self.processes
+
+            batch_idx = order[pos:pos + size]
+            start = time.perf_counter()
+            vectors = self._encode_batch([texts[i] for i in batch_idx])
+            elapsed = time.perf_counter() - start
+
+            for i, vector in zip(batch_idx, vectors):
+                out[i] = vector
+
+            self._adapt(len(batch_idx) // (self.processes if self._pool else 1), elapsed)
+            self.encode_seconds += elapsed
+            self.texts_encoded += len(batch_idx)
+            self.batches += 1
+            pos += size
+
+        return out
+
+    def encode(self, texts) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        if self.cache is None:
+            return np.vstack(self._encode_uncached(texts))
+
+        found = self.cache.lookup(texts)
+        missing = [i for i, v in enumerate(found) if v is None]
+
+        if missing:
+            fresh = self._encode_uncached([texts[i] for i in missing])
+            self.cache.store([texts[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                found[i] = vector
+
+        return np.vstack(found)
+
+    def stats(self) -> dict:
+        return {
+            "texts_encoded": self.texts_encoded,
+            "encode_seconds": round(self.encode_seconds, 3),
+            "chunks_per_sec": round(self.texts_encoded / self.encode_seconds, 1)
+            if self.encode_seconds else 0.0,
+            "batches": self.batches,
+            "batch_size": self.batch_size,
+            "processes": self.processes,
+        }
@@ -0,0 +1,608 @@
+"""
+Pure-NumPy vector store with the subset of the Chroma collection API
+this project uses (add / upsert / update / delete / get / query / count).
+
+Selected per vector directory through embeddings/registry.py
+(VECTOR_BACKEND=numpy, or use_vector_backend(dir, "numpy")); the rest of
+the code keeps calling get_collection() and sees no difference.
+
+Layout of one collection, under <vector dir>/numpy/<name>/:
+
+    manifest.json           dtype, dim, current generation
+    vectors.<gen>.bin       row-major matrix, float32 or int8, memory-mapped
+    scales.<gen>.bin        int8 only: one float32 scale per row
+    records.<gen>.jsonl     append-only log: put / update / delete per id
+
+Writes append rows and log lines, so ingest cost does not grow with the
+collection; replaced and deleted rows stay in the file as dead rows until
+they outnumber the live ones, then the collection is rewritten as the
+next generation. Readers in other processes pick up appended records on
+their next call. One writing process per collection.
+
+Search is exact: one matrix product of the (normalized) stored vectors
+with all query vectors, top-k by argpartition. Metadata filters are
+boolean row masks built from per-field value columns, cached until the
+next write.
+"""
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# ---------------- CONFIG ---------------- #
+
+NUMPY_STORE_DIR = "numpy"                             # under the vector dir
+DEFAULT_DTYPE = os.getenv("VECTOR_DTYPE", "float32")  # "float32" or "int8"
+
+SCORE_BLOCK_ROWS = 65_536   # int8 rows dequantized at a time while scoring
+GATHER_BELOW = 0.25         # filters keeping fewer rows than this score only those rows
+COMPACT_MIN_DEAD = 1024     # rewrite once dead rows exceed this and the live rows
+
+# ---------------------------------------- #
+
+DTYPES = {"float32": np.float32, "int8": np.int8}
+
+DEFAULT_GET_INCLUDE = ("documents", "metadatas")
+DEFAULT_QUERY_INCLUDE = ("documents", "metadatas", "distances")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """
+    Symmetric per-row quantization: row ~= codes * scale.
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+class NumpyCollection:
+    def __init__(self, path: Path, name: str, dtype: str = DEFAULT_DTYPE, metadata=None):
+        self.path = Path(path)
+        self.name = name
+        self._lock = threading.RLock()
+
+        if (self.path / "manifest.json").exists():
+            self._load()
+            return
+
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self.dim = None
+        self.generation = 0
+        self.metadata = metadata or {}
+        self._write_manifest()
+        self._reset_state()
+        self._files(self.generation)["records"].touch()
+
+    # ---------------- state ---------------- #
+
+    def _files(self, generation):
+        return {
+            "vectors": self.path / f"vectors.{generation}.bin",
+            "scales": self.path / f"scales.{generation}.bin",
+            "records": self.path / f"records.{generation}.jsonl",
+        }
+
+    def _write_manifest(self):
+        manifest = {
+            "name": self.name,
+            "dtype": self.dtype,
+            "dim": self.dim,
+            "generation": self.generation,
+            "metadata": self.metadata,
+        }
+        tmp = self.path / "manifest.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.path / "manifest.json")
+
+    def _reset_state(self):
+        self._ids = []          # per row, dead rows included
+        self._documents = []
+        self._metadatas = []
+        self._row_of = {}       # id -> live row
+        self._alive = np.zeros(0, dtype=bool)
+        self._log_offset = 0
+        self._invalidate()
+
+    def _invalidate(self):
+        self._matrix = None
+        self._scales = None
+        self._columns = {}
+        self._masks = {}
+
+    def _load(self):
+        with open(self.path / "manifest.json", "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.dtype = manifest["dtype"]
+        self.dim = manifest["dim"]
+        self.generation = manifest["generation"]
+        self.metadata = manifest.get("metadata", {})
+        self._reset_state()
+        self._replay()
+
+    def _refresh(self):
+        """
+        Catch up with writes from other processes: a new generation means
+        a full reload, a longer log means records to replay.
+        """
+        records = self._files(self.generation)["records"]
+        try:
+            size = records.stat().st_size
+        except FileNotFoundError:
+            self._load()
+            return
+        if size > self._log_offset:
+            self._replay()
+
+    def _replay(self):
+        with open(self._files(self.generation)["records"], "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+
+        # A line being written concurrently is picked up next time
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return
+        records = [json.loads(line) for line in data[:end].splitlines() if line]
+        self._log_offset += end
+
+        if self.dim is None:
+            with open(self.path / "manifest.json", "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        self._apply(records)
+
+    def _apply(self, records):
+        puts = sum(1 for r in records if r["op"] == "put")
+        # Copy-on-write: concurrent readers keep the arrays they started with
+        alive = np.concatenate([self._alive, np.zeros(puts, dtype=bool)])
+
+        for r in records:
+            op, chunk_id = r["op"], r["id"]
+            old = self._row_of.get(chunk_id)
+
+            if op == "put":
+                row = len(self._ids)
+                self._ids.append(chunk_id)
+                self._documents.append(r.get("document"))
+                self._metadatas.append(r.get("metadata") or {})
+                if old is not None:
+                    alive[old] = False
+                alive[row] = True
+                self._row_of[chunk_id] = row
+
+            elif op == "update" and old is not None:
+                if "document" in r:
+                    self._documents[old] = r["document"]
+                if "metadata" in r:
+                    self._metadatas[old] = {**self._metadatas[old], **r["metadata"]}
+
+            elif op == "delete" and old is not None:
+                alive[old] = False
+                del self._row_of[chunk_id]
+
+        self._alive = alive
+        self._invalidate()
+
+    @property
+    def _rows(self) -> int:
+        return len(self._ids)
+
+    # ---------------- writes ---------------- #
+
+    def _append(self, records, vectors=None):
+        """
+        Vectors first, log second: a crash in between leaves unreferenced
+        bytes past the last logged row, overwritten by the next append.
+        """
+        files = self._files(self.generation)
+
+        if vectors is not None and len(vectors):
+            if self.dtype == "int8":
+                codes, scales = quantize_int8(vectors)
+                self._write_rows(files["vectors"], codes, self._rows * self.dim)
+                self._write_rows(files["scales"], scales, self._rows * 4)
+            else:
+                self._write_rows(files["vectors"], vectors.astype(np.float32),
+                                 self._rows * self.dim * 4)
+
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with open(files["records"], "ab") as f:
+            f.write(lines.encode("utf-8"))
+
+        self._apply(records)
+        self._log_offset = files["records"].stat().st_size
+
+    @staticmethod
+    def _write_rows(path: Path, array: np.ndarray, offset: int):
+        mode = "r+b" if path.exists() else "wb"
+        with open(path, mode) as f:
+            f.seek(offset)
+            f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate()
+
+    def _prepare_vectors(self, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            self._write_manifest()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} != collection dimension {self.dim}")
+
+        # Stored normalized: cosine distance is 1 - dot product
+        return _normalize(vectors)
+
+    def _put(self, ids, embeddings, metadatas, documents, skip_existing):
+        if embeddings is None:
+            raise ValueError("NumpyCollection stores precomputed embeddings only")
+        if not ids:
+            return
+
+        with self._lock:
+            self._refresh()
+            vectors = self._prepare_vectors(embeddings)
+            metadatas = metadatas or [None] * len(ids)
+            documents = documents or [None] * len(ids)
+
+            keep = list(range(len(ids)))
+            if skip_existing:
+                # Chroma's add(): ids already present are ignored
+                seen = set(self._row_of)
+                keep = []
+                for i, chunk_id in enumerate(ids):
+                    if chunk_id not in seen:
+                        seen.add(chunk_id)
+                        keep.append(i)
+                if not keep:
+                    return
+
+            records = [
+                {"op": "put", "id": ids[i], "document": documents[i], "metadata": metadatas[i] or {}}
+                for i in keep
+            ]
+            self._append(records, vectors[keep])
+            self._maybe_compact()
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None):
+        self._put(ids, embeddings, metadatas, documents, skip_existing=True)
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None):
+        self._put(ids, embeddings, metadatas, documents, skip_existing=False)
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None):
+        """
+        Existing ids only. Metadata is merged into the stored metadata;
+        new embeddings rewrite the row.
+        """
+        with self._lock:
+            self._refresh()
+            present = [i for i, chunk_id in enumerate(ids) if chunk_id in self._row_of]
+            if not present:
+                return
+
+            if embeddings is not None:
+                rows = [self._row_of[ids[i]] for i in present]
+                records = []
+                for i, row in zip(present, rows):
+                    metadata = dict(self._metadatas[row])
+                    if metadatas and metadatas[i]:
+                        metadata.update(metadatas[i])
+                    document = documents[i] if documents else self._documents[row]
+                    records.append({"op": "put", "id": ids[i], "document": document, "metadata": metadata})
+                vectors = self._prepare_vectors(embeddings)[present]
+                self._append(records, vectors)
+                self._maybe_compact()
+                return
+
+            records = []
+            for i in present:
+                record = {"op": "update", "id": ids[i]}
+                if metadatas and metadatas[i] is not None:
+                    record["metadata"] = metadatas[i]
+                if documents and documents[i] is not None:
+                    record["document"] = documents[i]
+                records.append(record)
+            self._append(records)
+
+    def delete(self, ids=None, where=None):
+        if ids is None and not where:
+            raise ValueError("delete() needs ids or a where filter")
+
+        with self._lock:
+            self._refresh()
+            rows = self._select(ids, where)
+            if not len(rows):
+                return
+            self._append([{"op": "delete", "id": self._ids[row]} for row in rows])
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        live = len(self._row_of)
+        dead = self._rows - live
+        if dead > COMPACT_MIN_DEAD and dead > live:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite live rows only as the next generation. The manifest
+        switches generations atomically; old files are removed after.
+        """
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._alive)
+            old_files = self._files(self.generation)
+            new_files = self._files(self.generation + 1)
+
+            if self.dim is not None:
+                matrix, scales = self._open()
+                with open(new_files["vectors"], "wb") as f:
+                    for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+                        f.write(np.ascontiguousarray(matrix[rows[start:start + SCORE_BLOCK_ROWS]]).tobytes())
+                if scales is not None:
+                    with open(new_files["scales"], "wb") as f:
+                        f.write(np.ascontiguousarray(scales[rows]).tobytes())
+
+            with open(new_files["records"], "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({
+                        "op": "put",
+                        "id": self._ids[row],
+                        "document": self._documents[row],
+                        "metadata": self._metadatas[row],
+                    }, ensure_ascii=False) + "\n")
+
+            self._matrix = self._scales = None   # release the old memmap before deleting
+            self.generation += 1
+            self._write_manifest()
+            for path in old_files.values():
+                path.unlink(missing_ok=True)
+            self._load()
+
+    # ---------------- reads ---------------- #
+
+    def _open(self):
+        """
+        (matrix, scales) memory maps over the current rows; scales is None
+        for float32.
+        """
+        if self._matrix is None or len(self._matrix) != self._rows:
+            if self._rows == 0 or self.dim is None:
+                self._matrix = np.zeros((0, self.dim or 0), dtype=DTYPES[self.dtype])
+                self._scales = np.zeros(0, dtype=np.float32) if self.dtype == "int8" else None
+            else:
+                files = self._files(self.generation)
+                self._matrix = np.memmap(files["vectors"], dtype=DTYPES[self.dtype], mode="r",
+                                         shape=(self._rows, self.dim))
+                self._scales = (
+                    np.memmap(files["scales"], dtype=np.float32, mode="r", shape=(self._rows,))
+                    if self.dtype == "int8" else None
+                )
+        return self._matrix, self._scales
+
+    def _column(self, field):
+        # Value codes per row for one metadata field, shared by every filter on it
+        column = self._columns.get(field)
+        if column is None:
+            codes_of = {}
+            codes = np.fromiter(
+                (codes_of.setdefault(m.get(field), len(codes_of)) for m in self._metadatas),
+                dtype=np.int32, count=self._rows,
+            )
+            column = (codes, codes_of)
+            self._columns[field] = column
+        return column
+
+    def _build_mask(self, where) -> np.ndarray:
+        if "$and" in where:
+            return np.logical_and.reduce([self._build_mask(w) for w in where["$and"]])
+        if "$or" in where:
+            return np.logical_or.reduce([self._build_mask(w) for w in where["$or"]])
+
+        masks = []
+        for field, condition in where.items():
+            codes, codes_of = self._column(field)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+
+            for op, value in condition.items():
+                if op in ("$eq", "$ne"):
+                    code = codes_of.get(value, -1)
+                    masks.append(codes == code if op == "$eq" else codes != code)
+                elif op in ("$in", "$nin"):
+                    wanted = [codes_of[v] for v in value if v in codes_of]
+                    masks.append(np.isin(codes, wanted, invert=op == "$nin"))
+                else:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+
+        return np.logical_and.reduce(masks) if masks else np.ones(self._rows, dtype=bool)
+
+    def _mask(self, where) -> np.ndarray:
+        """
+        Live rows matching `where`; cached per filter until the next write.
+        """
+        if not where:
+            return self._alive
+        key = json.dumps(where, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._build_mask(where) & self._alive
+            self._masks[key] = mask
+        return mask
+
+    def _select(self, ids, where) -> np.ndarray:
+        if ids is None:
+            return np.flatnonzero(self._mask(where))
+
+        rows = [self._row_of[chunk_id] for chunk_id in ids if chunk_id in self._row_of]
+        rows = np.asarray(rows, dtype=np.int64)
+        if where and len(rows):
+            rows = rows[self._mask(where)[rows]]
+        return rows
+
+    def _vectors(self, matrix, scales, rows) -> np.ndarray:
+        vectors = np.asarray(matrix[rows], dtype=np.float32)
+        if scales is not None:
+            vectors *= scales[rows][:, None]
+        return vectors
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=DEFAULT_GET_INCLUDE):
+        with self._lock:
+            self._refresh()
+            rows = self._select(ids, where)
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+
+            out = {"ids": [self._ids[row] for row in rows], "included": list(include)}
+            if "documents" in include:
+                out["documents"] = [self._documents[row] for row in rows]
+            if "metadatas" in include:
+                out["metadatas"] = [self._metadatas[row] for row in rows]
+            if "embeddings" in include:
+                matrix, scales = self._open()
+                out["embeddings"] = self._vectors(matrix, scales, rows)
+            return out
+
+    def query(self, query_embeddings, n_results: int = 10, where=None,
+              include=DEFAULT_QUERY_INCLUDE):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        queries = _normalize(queries)
+
+        with self._lock:
+            self._refresh()
+            matrix, scales = self._open()
+            mask = self._mask(where)
+            ids, documents, metadatas = self._ids, self._documents, self._metadatas
+
+        # Scoring runs outside the lock on the snapshot taken above
+        candidates = np.flatnonzero(mask)
+        k = min(n_results, len(candidates))
+        out = {"ids": [], "distances": [], "included": list(include)}
+        if "documents" in include:
+            out["documents"] = []
+        if "metadatas" in include:
+            out["metadatas"] = []
+        if "embeddings" in include:
+            out["embeddings"] = []
+
+        if k == 0:
+            for key in out:
+                if key != "included":
+                    out[key] = [[] for _ in queries]
+            return out
+
+        if len(candidates) < GATHER_BELOW * len(matrix):
+            # Selective filter: score just the matching rows
+            scores = self._scores(matrix, scales, queries, candidates)
+            row_of_column = candidates
+        else:
+            scores = self._scores(matrix, scales, queries)
+            scores[:, ~mask] = -np.inf
+            row_of_column = None
+
+        # Exact top-k per query: argpartition, then sort only the k winners
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        rows = row_of_column[top] if row_of_column is not None else top
+
+        for q_rows, q_scores in zip(rows, top_scores):
+            out["ids"].append([ids[row] for row in q_rows])
+            out["distances"].append((1.0 - q_scores).tolist())
+            if "documents" in include:
+                out["documents"].append([documents[row] for row in q_rows])
+            if "metadatas" in include:
+                out["metadatas"].append([metadatas[row] for row in q_rows])
+            if "embeddings" in include:
+                out["embeddings"].append(self._vectors(matrix, scales, q_rows))
+        return out
+
+    @staticmethod
+    def _scores(matrix, scales, queries, rows=None) -> np.ndarray:
+        """
+        (queries, rows) cosine similarities. float32: one matrix product
+        over the memmap; int8: the same product, dequantized in blocks
+        to bound memory.
+        """
+        if scales is None:
+            block = matrix if rows is None else matrix[rows]
+            return queries @ np.asarray(block).T
+
+        n = len(matrix) if rows is None else len(rows)
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, n)
+            index = slice(start, stop) if rows is None else rows[start:stop]
+            block = np.asarray(matrix[index], dtype=np.float32)
+            scores[:, start:stop] = (queries @ block.T) * scales[index]
+        return scores
+
+
+class NumpyClient:
+    """
+    Stand-in for chromadb.PersistentClient: collections live under
+    <path>/numpy/<name>/.
+    """
+
+    def __init__(self, path, dtype: str = DEFAULT_DTYPE):
+        self.root = Path(path) / NUMPY_STORE_DIR
+        self.dtype = dtype
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _exists(self, name) -> bool:
+        return (self.root / name / "manifest.json").exists()
+
+    def get_collection(self, name: str):
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                if not self._exists(name):
+                    raise ValueError(f"Collection {name} does not exist.")
+                collection = NumpyCollection(self.root / name, name)
+                self._collections[name] = collection
+            return collection
+
+    def get_or_create_collection(self, name: str, metadata=None):
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = NumpyCollection(self.root / name, name, self.dtype, metadata)
+                self._collections[name] = collection
+            return collection
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+            if not self._exists(name):
+                raise ValueError(f"Collection {name} does not exist.")
+            shutil.rmtree(self.root / name)
+
+    def list_collections(self):
+        if not self.root.exists():
+            return []
+        return [self.get_collection(p.name) for p in sorted(self.root.iterdir()) if self._exists(p.name)]
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+# ---------------- CONFIG ---------------- #
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Vector store for directories that do not have one yet: "chroma" or
+# "numpy" (embeddings/numpy_store.py). An existing directory keeps the
+# backend it was built with.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# ---------------------------------------- #
+
+# Process-wide handles. Streamlit reruns the whole script on every
+# interaction but keeps imported modules alive, so anything cached here
+# survives across reruns and is shared by every Retriever / Embedder.
+_lock = threading.RLock()
+_models = {}
+_clients = {}
+_collections = {}
+_versions = {}
+_vector_backends = {}   # name -> (client factory(path), marker(path) -> bool)
+_dir_backends = {}      # vector dir -> backend name chosen explicitly
+
+_metrics = {
+    "model_loads": 0,
+    "model_hits": 0,
+    "model_load_seconds": 0.0,
+    "client_opens": 0,
+    "client_hits": 0,
+    "client_open_seconds": 0.0,
+    "collection_opens": 0,
+    "collection_hits": 0,
+    "invalidations": 0,
+}
+
+
+def canonical_model_name(model_name: str) -> str:
+    """
+    'all-MiniLM-L6-v2' and 'sentence-transformers/all-MiniLM-L6-v2'
+    are the same weights, so they share one cache entry.
+    """
+    if "/" not in model_name:
+        return f"sentence-transformers/{model_name}"
+    return model_name
+
+
+def _dir_key(persist_dir) -> str:
+    return str(Path(persist_dir).resolve())
+
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    key = canonical_model_name(model_name)
+
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            _metrics["model_hits"] += 1
+            return model
+
+        # Imported on first load: code paths that never encode (or get a
+        # model injected, as the tests do) do not need the package
+        from sentence_transformers import SentenceTransformer
+
+        start = time.perf_counter()
+        model = SentenceTransformer(key)
+        _metrics["model_load_seconds"] += time.perf_counter() - start
+        _metrics["model_loads"] += 1
+
+        _models[key] = model
+        return model
+
+
+def get_cross_encoder(model_name: str = DEFAULT_CROSS_ENCODER):
+    key = ("cross-encoder", model_name)
+
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            _metrics["model_hits"] += 1
+            return model
+
+        from sentence_transformers import CrossEncoder
+
+        start = time.perf_counter()
+        model = CrossEncoder(model_name)
+        _metrics["model_load_seconds"] += time.perf_counter() - start
+        _metrics["model_loads"] += 1
+
+        _models[key] = model
+        return model
+
+
+def register_vector_backend(name: str, factory, marker=None):
+    """
+    factory(path) returns a client with get_collection /
+    get_or_create_collection / delete_collection / list_collections;
+    marker(path) tells whether a directory already holds this backend's data.
+    """
+    with _lock:
+        _vector_backends[name] = (factory, marker or (lambda path: False))
+
+
+def use_vector_backend(persist_dir, name: str):
+    """
+    Pin the backend of one vector directory (benchmarks build the same
+    corpus with both).
+    """
+    if name not in _vector_backends:
+        raise ValueError(f"Unknown vector backend: {name}")
+    with _lock:
+        _dir_backends[_dir_key(persist_dir)] = name
+    invalidate_index(persist_dir)
+
+
+def vector_backend(persist_dir) -> str:
+    key = _dir_key(persist_dir)
+    with _lock:
+        if key in _dir_backends:
+            return _dir_backends[key]
+        for name, (_, marker) in _vector_backends.items():
+            if marker(Path(persist_dir)):
+                return name
+    return VECTOR_BACKEND
+
+
+def get_client(persist_dir):
+    key = _dir_key(persist_dir)
+
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _metrics["client_hits"] += 1
+            return client
+
+        start = time.perf_counter()
+        factory, _ = _vector_backends[vector_backend(persist_dir)]
+        client = factory(persist_dir)
+        _metrics["client_open_seconds"] += time.perf_counter() - start
+        _metrics["client_opens"] += 1
+
+        _clients[key] = client
+        return client
+
+
+def get_collection(persist_dir, collection_name: str, create: bool = False):
+    """
+    Cached collection handle for (vector dir, collection name).
+
+    With create=False a missing collection raises, exactly like
+    client.get_collection; with create=True it is created with the
+    cosine space used everywhere in this project.
+    """
+    key = (_dir_key(persist_dir), collection_name)
+
+    with _lock:
+        collection = _collections.get(key)
+        if collection is not None:
+            _metrics["collection_hits"] += 1
+            return collection
+
+        client = get_client(persist_dir)
+        if create:
+            collection = client.get_or_create_collection(
+                name=collection_name,
+                metadata={"hnsw:space": "cosine"}
+            )
+        else:
+            collection = client.get_collection(collection_name)
+
+        _metrics["collection_opens"] += 1
+        _collections[key] = collection
+        return collection
+
+
+def invalidate_index(persist_dir=None):
+    """
+    Drop cached client / collection handles after an index rebuild.
+
+    Must be called whenever a collection is deleted or the vector
+    directory is removed, otherwise readers keep using a stale handle.
+    Embedding models are never invalidated: they do not depend on the index.
+    """
+    with _lock:
+        if persist_dir is None:
+            _clients.clear()
+            _collections.clear()
+            for key in _versions:
+                _versions[key] += 1
+        else:
+            key = _dir_key(persist_dir)
+            _clients.pop(key, None)
+            for ckey in [k for k in _collections if k[0] == key]:
+                del _collections[ckey]
+            _versions[key] = _versions.get(key, 0) + 1
+
+        _metrics["invalidations"] += 1
+
+
+def index_version(persist_dir) -> int:
+    """
+    Bumped by every invalidate_index() on this vector dir; lets caches
+    keyed on it drop results computed against an older index.
+    """
+    with _lock:
+        return _versions.setdefault(_dir_key(persist_dir), 0)
+
+
+def registry_metrics() -> dict:
+    with _lock:
+        metrics = dict(_metrics)
+        metrics["loaded_models"] = sorted(str(k) for k in _models)
+        metrics["open_vector_dirs"] = sorted(_clients)
+        metrics["vector_backends"] = {key: type(client).__name__ for key, client in _clients.items()}
+        return metrics
+
+
+# ---------------- Built-in vector backends ---------------- #
+
+def _chroma_client(path):
+    import chromadb
+    return chromadb.PersistentClient(path=str(path))
+
+
+def _numpy_client(path):
+    from embeddings.numpy_store import NumpyClient
+    return NumpyClient(path)
+
+
+register_vector_backend("chroma", _chroma_client, lambda path: (path / "chroma.sqlite3").exists())
+register_vector_backend("numpy", _numpy_client, lambda path: (path / "numpy").is_dir())
@@ -1,12 +1,18 @@
-import chromadb
+from embeddings.registry import get_collection, use_vector_backend
+
 
 class VectorStore:
-    def __init__(self, collection_name="documents", persist_dir="data/vector_db"):
-        self.client = chromadb.PersistentClient(
-            path=persist_dir
-        )
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name
+    """
+    Thin wrapper over a collection. `backend` ("chroma" / "numpy") pins
+    the store used for `persist_dir`; by default an existing directory
+    keeps its own and a new one follows VECTOR_BACKEND.
+    """
+
+    def __init__(self, collection_name="documents", persist_dir="data/vector_db", backend=None):
+        if backend:
+            use_vector_backend(persist_dir, backend)
+        self.collection = get_collection(
+            persist_dir, collection_name, create=True
         )
 
     def add_documents(self, ids, texts, embeddings, metadatas):
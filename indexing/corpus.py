@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+# ---------------- CONFIG ---------------- #
+
+CHROMA_DIR = Path("data/vector_db")
+CORPUS_FILENAME = "corpus.json"
+
+# ---------------------------------------- #
+
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def index_write_lock(vector_dir=CHROMA_DIR) -> threading.RLock:
+    """
+    Process-wide lock serializing writers (ingest, re-index, removal) of
+    one vector dir, so two uploads never interleave their updates of the
+    collection, BM25 / ANN / section files and this manifest. Readers
+    never take it.
+    """
+    key = str(Path(vector_dir).resolve())
+    with _write_locks_guard:
+        return _write_locks.setdefault(key, threading.RLock())
+
+
+def corpus_file(vector_dir=CHROMA_DIR) -> Path:
+    return Path(vector_dir) / CORPUS_FILENAME
+
+
+def load_corpus(vector_dir=CHROMA_DIR) -> dict:
+    """
+    Manifest of indexed documents, keyed by document_id (stable across
+    edits of the file); `version` is the content hash of the indexed copy:
+
+        {"3f2a9c1b0d4e": {"filename": "paper.pdf", "version": "9b1c0e7a2f44",
+                          "num_chunks": 42, ...}}
+    """
+    path = corpus_file(vector_dir)
+    if not path.exists():
+        return {}
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_corpus(corpus: dict, vector_dir=CHROMA_DIR):
+    path = corpus_file(vector_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write-then-rename so a crash never leaves a half-written manifest
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(corpus, f, indent=2, ensure_ascii=False)
+    tmp.replace(path)
+
+
+def register_document(document_id: str, filename: str, num_chunks: int,
+                      vector_dir=CHROMA_DIR, version: str = None):
+    corpus = load_corpus(vector_dir)
+    corpus[document_id] = {
+        "filename": filename,
+        "version": version,
+        "num_chunks": num_chunks,
+        "indexed_at": time.time(),
+    }
+    save_corpus(corpus, vector_dir)
+
+
+def unregister_document(document_id: str, vector_dir=CHROMA_DIR):
+    corpus = load_corpus(vector_dir)
+    if corpus.pop(document_id, None) is not None:
+        save_corpus(corpus, vector_dir)
+
+
+def corpus_version(vector_dir=CHROMA_DIR) -> int:
+    """
+    Changes whenever any process adds or removes a document.
+    """
+    path = corpus_file(vector_dir)
+    return path.stat().st_mtime_ns if path.exists() else 0
+
+
+def is_indexed(document_id: str, vector_dir=CHROMA_DIR, version: str = None) -> bool:
+    """
+    Whether the document is in the corpus; with `version`, whether that
+    exact content is.
+    """
+    entry = load_corpus(vector_dir).get(document_id)
+    if entry is None:
+        return False
+    return version is None or entry.get("version") == version
+
+
+def superseded_documents(document_id: str, filename: str, vector_dir=CHROMA_DIR):
+    """
+    Older manifest entries for the same file that `document_id` replaces:
+    corpora built before documents had a stable id keyed each upload by
+    its content hash (entries without a "version"), so every edit of a
+    file left its previous copy searchable.
+    """
+    return [
+        doc_id for doc_id, entry in load_corpus(vector_dir).items()
+        if doc_id != document_id and entry.get("filename") == filename
+        and "version" not in entry
+    ]
+
+
+def document_versions(document_ids, vector_dir=CHROMA_DIR) -> str:
+    """
+    Stable token for the indexed state of some documents. Unlike
+    corpus_version it only changes when one of *these* documents is
+    re-indexed or removed, and it survives restarts.
+    """
+    corpus = load_corpus(vector_dir)
+    return "|".join(
+        f"{doc_id}@{corpus.get(doc_id, {}).get('indexed_at', 0)}"
+        for doc_id in sorted(set(document_ids))
+    )
@@ -128,35 +128,62 @@
 # if __name__ == "__main__":
 #     main()
 
-import json
+import os
+import time
 from pathlib import Path
 
-import chromadb
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
+from embeddings.registry import (
+    get_client,
+    get_collection,
+    invalidate_index,
+)
+from embeddings.embedding_cache import EmbeddingCache
+from embeddings.engine import EmbeddingEngine
+from indexing.corpus import (
+    index_write_lock,
+    load_corpus,
+    register_document,
+    superseded_documents,
+    unregister_document,
+)
+from preprocessing.records import find_records, iter_records
+from preprocessing.section_index import (
+    SectionTreeBuilder,
+    clear_sections,
+    remove_document_sections,
+    save_document_sections,
+)
+from retrieval.ann_index import commit_ann_index, drop_ann_index, load_ann_for_update
+from retrieval.lexical_index import BM25Index, index_path, load_for_update
+
 # ---------------- CONFIG ---------------- #
 
 CHROMA_DIR = Path("data/vector_db")
-CHUNKS_FILE = Path("data/processed/chunks.json")
+CHUNKS_FILE = Path("data/processed/chunks.jsonl")   # or .jsonl.zst / legacy .json
 
 COLLECTION_NAME = "documents"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
-BATCH_SIZE = 32
+# Chunks handed to the embedding engine / Chroma at once. The engine picks
+# its own encode batch size inside each group (see embeddings/engine.py).
+UPSERT_BATCH_SIZE = 256
+ENCODE_PROCESSES = int(os.getenv("EMBED_PROCESSES", "1"))
+
 MIN_CHUNK_LENGTH = 100
 
 # ---------------------------------------- #
 
 
-def load_chunks():
-    if not CHUNKS_FILE.exists():
-        raise FileNotFoundError("chunks.json not found. Run chunker first.")
+def load_chunks(chunks_file=CHUNKS_FILE):
+    path = find_records(chunks_file)
+    if path is None:
+        raise FileNotFoundError(f"{Path(chunks_file).name} not found. Run chunker first.")
 
-    with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
-        chunks = json.load(f)
+    chunks = list(iter_records(path))
 
-    print(f"Loaded {len(chunks)} chunks")
+    print(f"Loaded {len(chunks)} chunks from {path.name}")
     return chunks
 
 
@@ -172,32 +199,127 @@ def normalize_metadata(chunk):
         "section_level": int(section_level),
         "structure_confidence": float(chunk.get("structure_confidence", 0.0)),
         "source": chunk.get("source", "document"),
+        "document_id": chunk.get("document_id") or "",
+        "position": int(chunk.get("position", -1)),
     }
 
 
-def main():
-    chunks = load_chunks()
+def existing_chunks(collection, document_id: str) -> dict:
+    """
+    {chunk_id: metadata} of one document as currently indexed.
+    """
+    raw = collection.get(where={"document_id": document_id}, include=["metadatas"])
+    return dict(zip(raw["ids"], raw["metadatas"]))
+
+
+def diff_chunks(existing: dict, ids, metadatas):
+    """
+    Compare a fresh chunking against what is indexed. Ids are content
+    hashes, so an id present on both sides has the same text and
+    embedding. Returns (indices of `ids` to embed and add, ids to
+    delete, indices whose metadata changed, e.g. a shifted position).
+    """
+    added = []
+    changed = []
+    for i, (chunk_id, meta) in enumerate(zip(ids, metadatas)):
+        old = existing.get(chunk_id)
+        if old is None:
+            added.append(i)
+        elif old != meta:
+            changed.append(i)
+
+    new_ids = set(ids)
+    removed = [chunk_id for chunk_id in existing if chunk_id not in new_ids]
+    return added, removed, changed
+
+
+def remove_document(document_id: str, vector_dir=CHROMA_DIR):
+    """
+    Delete one document's vectors and drop it from the corpus manifest.
+    """
+    with index_write_lock(vector_dir):
+        collection = get_collection(vector_dir, COLLECTION_NAME, create=True)
+        collection.delete(where={"document_id": document_id})
+
+        lexical = load_for_update(vector_dir)
+        lexical.remove_document(document_id)
+        lexical.save(index_path(vector_dir))
+
+        ann = load_ann_for_update(vector_dir)
+        if ann is not None:
+            ann.remove_document(document_id)
+            commit_ann_index(ann, collection, vector_dir)
+
+        remove_document_sections(vector_dir, document_id)
+        unregister_document(document_id, vector_dir)
+        invalidate_index(vector_dir)
+
+
+def main(chunks_file=CHUNKS_FILE, reset=None, vector_dir=CHROMA_DIR, use_cache=True):
+    """
+    Corpus mode (every chunk carries a document_id): the documents present
+    in `chunks_file` are diffed against the collection by chunk id (a
+    content hash, see preprocessing/chunker.py). Only new chunks are
+    embedded, vanished ones deleted and moved ones get a metadata update;
+    everything else in the collection is left untouched.
+
+    Legacy chunks without a document_id fall back to dropping and
+    rebuilding the whole collection. `reset` forces either behaviour.
+
+    Returns per-step timings and counts; use_cache=False skips the
+    embedding cache (benchmarks measure real encoding). Runs under
+    index_write_lock, so it never interleaves with an upload's ingest.
+    """
+    with index_write_lock(vector_dir):
+        return _main(chunks_file, reset, vector_dir, use_cache)
+
+
+def _main(chunks_file, reset, vector_dir, use_cache):
+    start = time.perf_counter()
+    chunks = load_chunks(chunks_file)
+
+    document_ids = sorted({c.get("document_id") or "" for c in chunks})
+    if reset is None:
+        reset = "" in document_ids
 
     # ---- Init Chroma SAFELY ----
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+    client = get_client(vector_dir)
 
-    existing = [c.name for c in client.list_collections()]
-    if COLLECTION_NAME in existing:
-        client.delete_collection(COLLECTION_NAME)
-        print("Existing collection deleted safely")
+    if reset:
+        existing = [c.name for c in client.list_collections()]
+        if COLLECTION_NAME in existing:
+            client.delete_collection(COLLECTION_NAME)
+            print("Existing collection deleted safely")
 
-    collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        metadata={"hnsw:space": "cosine"}
-    )
+        for document_id in load_corpus(vector_dir):
+            unregister_document(document_id, vector_dir)
+        drop_ann_index(vector_dir)
+
+        # Cached handles point at the deleted collection from here on
+        invalidate_index(vector_dir)
+
+    collection = get_collection(vector_dir, COLLECTION_NAME, create=True)
+    lexical = BM25Index() if reset else load_for_update(vector_dir)
+    # An existing ANN index is updated in place; one is only trained below
+    ann = None if reset else load_ann_for_update(vector_dir)
+
+    existing = {}
+    if not reset:
+        for document_id in document_ids:
+            existing.update(existing_chunks(collection, document_id))
+        print(f"Updating {len(document_ids)} document(s) in corpus")
 
     # ---- Load embedding model ----
     print("Loading embedding model...")
-    embedder = SentenceTransformer(EMBEDDING_MODEL)
+    cache = EmbeddingCache(EMBEDDING_MODEL) if use_cache else None
+    engine = EmbeddingEngine(EMBEDDING_MODEL, cache=cache, processes=ENCODE_PROCESSES)
 
     texts = []
     metadatas = []
     ids = []
+    sections = {document_id: SectionTreeBuilder() for document_id in document_ids}
+    # Content hash of each document's PDF, stamped on its chunks by the chunker
+    versions = {}
 
     skipped = 0
 
@@ -210,32 +332,115 @@ def main():
         texts.append(text)
         metadatas.append(normalize_metadata(chunk))
         ids.append(chunk["id"])
+        sections[chunk.get("document_id") or ""].add(chunk)
+        versions.setdefault(chunk.get("document_id") or "", chunk.get("document_version"))
 
-    print(f"Prepared {len(texts)} chunks for embedding")
+    print(f"Prepared {len(texts)} chunks")
     print(f"Skipped {skipped} short chunks")
 
-    print("Embedding chunks...")
+    # ---- Diff against the indexed chunks ----
+    added, removed, changed = diff_chunks(existing, ids, metadatas)
+    unchanged = len(ids) - len(added) - len(changed)
+    print(
+        f"Chunks: {len(added)} new, {len(removed)} removed, "
+        f"{len(changed)} moved, {unchanged} unchanged"
+    )
+
+    t = time.perf_counter()
+    if removed:
+        collection.delete(ids=removed)
+        lexical.remove_ids(removed)
+        if ann is not None:
+            ann.remove_ids(removed)
+    if changed:
+        collection.update(
+            ids=[ids[i] for i in changed],
+            metadatas=[metadatas[i] for i in changed],
+        )
+    upsert_seconds = time.perf_counter() - t
 
-    for i in tqdm(range(0, len(texts), BATCH_SIZE), desc="Batches"):
-        batch_texts = texts[i:i + BATCH_SIZE]
-        batch_ids = ids[i:i + BATCH_SIZE]
-        batch_meta = metadatas[i:i + BATCH_SIZE]
+    print("Embedding new chunks...")
+    embed_seconds = 0.0
+    new_ids = [ids[i] for i in added]
+    new_texts = [texts[i] for i in added]
+    new_metadatas = [metadatas[i] for i in added]
 
-        embeddings = embedder.encode(
-            batch_texts,
-            show_progress_bar=False,
-            normalize_embeddings=True
-        ).tolist()
+    for i in tqdm(range(0, len(new_texts), UPSERT_BATCH_SIZE), desc="Batches"):
+        batch_texts = new_texts[i:i + UPSERT_BATCH_SIZE]
+        batch_ids = new_ids[i:i + UPSERT_BATCH_SIZE]
+        batch_meta = new_metadatas[i:i + UPSERT_BATCH_SIZE]
 
+        t = time.perf_counter()
+        vectors = engine.encode(batch_texts)
+        embed_seconds += time.perf_counter() - t
+
+        t = time.perf_counter()
         collection.add(
             documents=batch_texts,
-            embeddings=embeddings,
+            embeddings=vectors.tolist(),
             metadatas=batch_meta,
             ids=batch_ids
         )
+        if ann is not None:
+            ann.add(batch_ids, vectors, [m["document_id"] for m in batch_meta])
+        upsert_seconds += time.perf_counter() - t
+
+    # ---- Lexical (BM25) index, persisted next to the vector DB ----
+    t = time.perf_counter()
+    lexical.add(new_ids, new_texts, new_metadatas)
+    lexical.save(index_path(vector_dir))
+    lexical_seconds = time.perf_counter() - t
+
+    # ---- IVF-PQ index: updated, or trained once the corpus is large ----
+    t = time.perf_counter()
+    ann_stats = commit_ann_index(ann, collection, vector_dir)
+    ann_seconds = time.perf_counter() - t
+    if ann_stats:
+        print(
+            f"ANN index: {ann_stats['vectors']} vectors, {ann_stats['nlist']} cells, "
+            f"{ann_stats['bytes_per_vector']} bytes/vector"
+        )
+
+    # ---- Section tree: section -> ordered chunk ids / page range ----
+    if reset:
+        clear_sections(vector_dir)
+    for document_id, builder in sections.items():
+        save_document_sections(vector_dir, document_id, builder.tree)
+
+    engine.close()
+    throughput = engine.stats()
 
     print("Indexing complete")
     print(f"Stored {collection.count()} vectors")
+    if cache:
+        cache.flush()
+        stats = cache.stats()
+        print(
+            f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['entries']}/{stats['max_entries']} entries, "
+            f"{stats['evictions']} evicted)"
+        )
+    print(
+        f"Encoded {throughput['texts_encoded']} chunks at "
+        f"{throughput['chunks_per_sec']} chunks/sec "
+        f"(final batch size {throughput['batch_size']}, "
+        f"{throughput['processes']} process(es))"
+    )
+
+    for document_id in document_ids:
+        if not document_id:
+            continue
+        doc_meta = [m for m in metadatas if m["document_id"] == document_id]
+        filename = doc_meta[0]["source"] if doc_meta else document_id
+        register_document(
+            document_id, filename, len(doc_meta), vector_dir,
+            version=versions.get(document_id),
+        )
+        for old_id in superseded_documents(document_id, filename, vector_dir):
+            remove_document(old_id, vector_dir)
+
+    # New index is live: force readers to reopen their handles
+    invalidate_index(vector_dir)
 
     structured = sum(
         1 for m in metadatas if m["structure_confidence"] >= 0.5
@@ -244,6 +449,22 @@ def main():
     print(f"Structured chunks      : {structured}")
     print(f"Unstructured chunks    : {len(metadatas) - structured}")
 
+    return {
+        "chunks": len(texts),
+        "added": len(added),
+        "removed": len(removed),
+        "updated": len(changed),
+        "unchanged": unchanged,
+        "skipped": skipped,
+        "seconds": round(time.perf_counter() - start, 3),
+        "embed_seconds": round(embed_seconds, 3),
+        "upsert_seconds": round(upsert_seconds, 3),
+        "lexical_seconds": round(lexical_seconds, 3),
+        "ann_seconds": round(ann_seconds, 3),
+        "ann": ann_stats,
+        "embedding": throughput,
+    }
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,264 @@
+"""
+Background indexing jobs: uploads are queued and ingested by a worker
+thread so the UI (or any other caller) keeps serving queries meanwhile.
+
+Jobs run one at a time in submission order (ingests of one vector dir
+are serialized anyway, see indexing.corpus.index_write_lock), report
+per-stage progress from the ingest pipeline and can be cancelled while
+queued or running; a cancelled or failed job leaves the index as it was.
+
+A new version of a document that already has a job does not replace or
+join it: it is queued to run after it (a still-queued older version is
+cancelled, it would only be overwritten).
+"""
+import itertools
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from indexing.pipeline import IngestCancelled, ingest_pdf
+
+# ---------------- CONFIG ---------------- #
+
+JOB_WORKERS = 1          # concurrent ingests (they serialize on the write lock)
+KEEP_FINISHED = 20       # finished jobs kept for display
+WAIT_POLL = 0.2          # seconds; how often a job waiting on another checks for cancel
+
+# ---------------------------------------- #
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class IndexingJob:
+    def __init__(self, job_id: int, pdf_path, document_id: str, source: str, version: str,
+                 keep_as, after, ingest_kwargs: dict):
+        self.id = job_id
+        self.pdf_path = pdf_path
+        self.document_id = document_id
+        self.source = source
+        self.version = version
+        self.keep_as = keep_as
+        self.after = after      # jobs of older versions that must finish first
+        self.ingest_kwargs = ingest_kwargs
+
+        self.state = QUEUED
+        self.progress = {"stage": QUEUED, "pages_done": 0, "pages_total": 0,
+                         "chunks": 0, "vectors": 0}
+        self.error = None
+        self.stats = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.state in ACTIVE_STATES
+
+    def cancel(self):
+        """
+        Ask the job to stop; a queued job never starts, a running one
+        stops at its next page / batch and rolls back.
+        """
+        self.cancel_event.set()
+
+    def fraction(self) -> float:
+        """
+        Rough completion in [0, 1]: extraction drives the first 80%,
+        committing the index the rest.
+        """
+        p = self.progress
+        if self.state == DONE:
+            return 1.0
+        if p["stage"] == "commit":
+            return 0.95
+        if not p["pages_total"]:
+            return 0.0
+        return 0.8 * min(p["pages_done"] / p["pages_total"], 1.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "document_id": self.document_id,
+                "source": self.source,
+                "version": self.version,
+                "state": self.state,
+                "progress": dict(self.progress),
+                "fraction": round(self.fraction(), 3),
+                "error": self.error,
+                "stats": self.stats,
+                "submitted_at": self.submitted_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+    def _update(self, progress: dict):
+        with self._lock:
+            self.progress = progress
+
+    def _finish(self, state: str, error: str = None, stats: dict = None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.stats = stats
+            self.finished_at = time.time()
+        self.finished.set()
+
+
+class IndexingJobQueue:
+    """
+    FIFO of IndexingJobs executed by a small thread pool.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, keep_finished: int = KEEP_FINISHED):
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="indexing-job")
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.keep_finished = keep_finished
+
+    def submit(self, pdf_path, document_id: str, source: str = None, version: str = None,
+               keep_as=None, **ingest_kwargs) -> IndexingJob:
+        """
+        Queue an ingest_pdf() run; returns the document's latest queued /
+        running job instead if it indexes this very version.
+
+        `pdf_path` should be private to the job (e.g. named after the
+        version) so a re-upload never rewrites a file being read. With
+        `keep_as`, the file is moved there once indexed and deleted if
+        the job fails or is cancelled.
+        """
+        with self._lock:
+            earlier = [
+                job for job in self._jobs.values()
+                if job.document_id == document_id and job.active
+            ]
+            # Dict order: the last one is the latest submitted
+            latest = earlier[-1] if earlier else None
+            if latest and latest.version == version and not latest.cancel_event.is_set():
+                return latest
+
+            for job in earlier:
+                if job.state == QUEUED:
+                    job.cancel()
+
+            job = IndexingJob(
+                next(self._ids), pdf_path, document_id, source, version,
+                keep_as, earlier, ingest_kwargs,
+            )
+            self._jobs[job.id] = job
+            self._prune()
+
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: int):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: int) -> bool:
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancel()
+        return True
+
+    def jobs(self):
+        """
+        Every known job, oldest first.
+        """
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active_jobs(self):
+        return [job for job in self.jobs() if job.active]
+
+    def shutdown(self, cancel: bool = True):
+        if cancel:
+            for job in self.active_jobs():
+                job.cancel()
+        self._pool.shutdown(wait=True)
+
+    def _run(self, job: IndexingJob):
+        # Versions of one document are indexed in submission order
+        for earlier in job.after:
+            while not earlier.finished.wait(WAIT_POLL) and not job.cancel_event.is_set():
+                pass
+        job.after = []
+
+        if job.cancel_event.is_set():
+            job._finish(CANCELLED, "Cancelled before it started")
+            self._discard_upload(job)
+            return
+
+        with job._lock:
+            job.state = RUNNING
+            job.started_at = time.time()
+
+        try:
+            stats = ingest_pdf(
+                job.pdf_path,
+                document_id=job.document_id,
+                source=job.source,
+                version=job.version,
+                progress=job._update,
+                cancel=job.cancel_event,
+                **job.ingest_kwargs,
+            )
+        except IngestCancelled as e:
+            self._discard_upload(job)
+            job._finish(CANCELLED, str(e))
+        except Exception as e:
+            traceback.print_exc()
+            self._discard_upload(job)
+            job._finish(FAILED, f"{type(e).__name__}: {e}")
+        else:
+            if job.keep_as is not None:
+                try:
+                    os.replace(job.pdf_path, job.keep_as)
+                except OSError:
+                    # Indexed all the same; only the copy under data/raw is stale
+                    traceback.print_exc()
+            job._finish(DONE, stats=stats)
+
+    def _discard_upload(self, job: IndexingJob):
+        if job.keep_as is not None:
+            try:
+                os.remove(job.pdf_path)
+            except FileNotFoundError:
+                pass
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+
+# ---------------- Shared instance ---------------- #
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> IndexingJobQueue:
+    """
+    Process-wide queue: Streamlit reruns and sessions share one worker,
+    so concurrent uploads are queued rather than run side by side.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IndexingJobQueue()
+        return _queue
@@ -0,0 +1,462 @@
+import os
+import queue
+import shutil
+import threading
+import time
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from embeddings.embedding_cache import EmbeddingCache
+from embeddings.engine import EmbeddingEngine
+from embeddings.registry import get_collection, invalidate_index
+from indexing.corpus import index_write_lock, load_corpus, register_document, superseded_documents
+from indexing.index_chunks import (
+    CHROMA_DIR,
+    COLLECTION_NAME,
+    EMBEDDING_MODEL,
+    ENCODE_PROCESSES,
+    MIN_CHUNK_LENGTH,
+    existing_chunks,
+    normalize_metadata,
+    remove_document,
+)
+from ingest.pdf_loader import (
+    RAW_DIR,
+    compute_document_id,
+    compute_document_version,
+    iter_pdf_pages,
+    iter_pdf_pages_parallel,
+    pdf_page_count,
+)
+from preprocessing.chunker import iter_chunks
+from preprocessing.records import RecordWriter, iter_records, record_path
+from preprocessing.section_index import SectionTreeBuilder, save_document_sections
+from retrieval.ann_index import commit_ann_index, load_ann_for_update
+from retrieval.lexical_index import index_path, load_for_update
+
+# ---------------- CONFIG ---------------- #
+
+QUEUE_SIZE = 8       # max items buffered between two stages
+BATCH_SIZE = 64      # chunks per embed/upsert batch; small enough to start early
+PUT_TIMEOUT = 0.2    # seconds; how often a blocked stage checks for abort
+STAGING_DIRNAME = "staging"   # under the vector dir: new chunks until commit
+
+# ---------------------------------------- #
+
+_DONE = object()
+
+
+def _put(q, item, abort):
+    while not abort.is_set():
+        try:
+            q.put(item, timeout=PUT_TIMEOUT)
+            return
+        except queue.Full:
+            continue
+
+
+def _drain(q, abort):
+    while not abort.is_set():
+        try:
+            item = q.get(timeout=PUT_TIMEOUT)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _start_stage(name, work, out_q, abort, errors, stage_seconds):
+    """
+    Run `work()` (a generator) in a thread, forwarding everything it yields
+    to `out_q`. Any exception aborts the whole pipeline.
+    """
+    def run():
+        start = time.perf_counter()
+        try:
+            for item in work():
+                if abort.is_set():
+                    break
+                _put(out_q, item, abort)
+        except BaseException as e:
+            errors.append(e)
+            abort.set()
+        finally:
+            stage_seconds[name] = time.perf_counter() - start
+            _put(out_q, _DONE, abort)
+
+    thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+class _Staging:
+    """
+    New chunks of one run, spilled to disk batch by batch (vectors as
+    .npy, ids / text / metadata as JSONL) and replayed into the
+    collection at commit, so they never reach readers early and memory
+    stays at a few batches whatever the document size. The directory is
+    removed when the run ends, committed or not.
+    """
+
+    def __init__(self, vector_dir):
+        self.dir = Path(vector_dir) / STAGING_DIRNAME / f"{os.getpid()}-{time.time_ns()}"
+        self.dir.mkdir(parents=True)
+        self.batches = 0
+        self._records = RecordWriter(self.dir / "chunks.jsonl")
+        self._closed = False
+
+    def add(self, ids, texts, vectors, metadatas):
+        np.save(self.dir / f"{self.batches:06d}.npy", np.asarray(vectors, dtype=np.float32))
+        for chunk_id, text, meta in zip(ids, texts, metadatas):
+            self._records.write({"id": chunk_id, "text": text, "metadata": meta})
+        self.batches += 1
+
+    def replay(self):
+        """
+        Yield the staged (ids, texts, vectors, metadatas) batches in order.
+        """
+        self._close()
+        records = iter_records(self.dir / "chunks.jsonl")
+        for n in range(self.batches):
+            vectors = np.load(self.dir / f"{n:06d}.npy")
+            batch = list(islice(records, len(vectors)))
+            yield (
+                [r["id"] for r in batch],
+                [r["text"] for r in batch],
+                vectors,
+                [r["metadata"] for r in batch],
+            )
+
+    def _close(self):
+        if not self._closed:
+            self._records.close()
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self._closed:
+            self._records.abort()
+            self._closed = True
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def _clear_stale_staging(vector_dir):
+    # Left behind by runs of processes that died mid-ingest
+    root = Path(vector_dir) / STAGING_DIRNAME
+    if not root.is_dir():
+        return
+    for path in root.iterdir():
+        pid = path.name.split("-", 1)[0]
+        if pid.isdigit() and int(pid) != os.getpid() and not _process_alive(int(pid)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but not ours, or no signal support: leave it alone
+        return True
+    return True
+
+
+class IngestCancelled(Exception):
+    """
+    Raised by ingest_pdf() when its `cancel` event is set; the index is
+    left exactly as it was before the call.
+    """
+
+
+class DocumentConflict(ValueError):
+    """
+    Raised by ingest_pdf() when `document_id` is already indexed for a
+    file with another name: replacing it would silently drop an
+    unrelated document. Nothing is written.
+    """
+
+
+def ingest_pdf(pdf_path, document_id=None, source=None, workers=1,
+               debug_dir=None, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE,
+               encode_processes=ENCODE_PROCESSES, vector_dir=CHROMA_DIR,
+               progress=None, cancel=None, version=None):
+    """
+    Pipelined ingest of one PDF into the corpus:
+
+        extract pages -> chunk -> embed batches -> stage -> commit to the index
+
+    Each stage runs in its own thread connected by bounded queues, so
+    embedding of early chunks overlaps extraction of later pages and peak
+    memory is a few batches regardless of document size.
+
+    `document_id` defaults to one derived from the file name, so an
+    edited PDF replaces its previous version; `version` (default: the
+    content hash) is recorded in the corpus manifest. An id already
+    indexed under another file name raises DocumentConflict. Re-ingesting only
+    embeds chunks whose content-hash id is not indexed yet for this
+    document; chunks that disappeared are deleted at the end and moved
+    ones get a metadata update, as in index_chunks.main.
+
+    Embedded batches are spilled to a staging directory under the vector
+    dir (see _Staging; BM25 / ANN updates go to private copies) and
+    nothing a reader sees changes until the run commits. The commit then
+    writes, back to back: the staged chunks (replayed batch by batch),
+    removals and metadata updates to
+    the collection, BM25 / ANN / section files, the corpus manifest and
+    the index version. It is a short sequence of writes, not a
+    transaction: a reader querying during it can see the new chunks a
+    moment before the BM25 index and manifest. If the run fails or is
+    cancelled (`cancel`, a threading.Event) before the commit, the index
+    is untouched. Ingests of the same vector dir are serialized
+    (indexing.corpus.index_write_lock).
+
+    `progress(snapshot)` is called from the pipeline threads with a dict
+    of stage, pages_done / pages_total, chunks and vectors so far.
+
+    If `debug_dir` is given, pages.jsonl / chunks.jsonl (the format
+    pdf_loader / chunker write) are saved there as debug artifacts;
+    nothing else touches intermediate files. `vector_dir` selects the
+    index (benchmarks build throwaway ones).
+    """
+    with index_write_lock(vector_dir):
+        _clear_stale_staging(vector_dir)
+        with _Staging(vector_dir) as staging:
+            return _ingest_pdf(
+                Path(pdf_path), document_id, source, workers, debug_dir, batch_size,
+                queue_size, encode_processes, vector_dir, progress, cancel, version,
+                staging,
+            )
+
+
+def _ingest_pdf(pdf_path, document_id, source, workers, debug_dir, batch_size,
+                queue_size, encode_processes, vector_dir, progress, cancel, version,
+                staging):
+    document_id = document_id or compute_document_id(pdf_path)
+    version = version or compute_document_version(pdf_path)
+    source = source or pdf_path.name
+
+    previous = load_corpus(vector_dir).get(document_id)
+    if previous is not None and previous.get("filename") != source:
+        raise DocumentConflict(
+            f"Document {document_id} is already indexed from {previous.get('filename')}, "
+            f"not {source}; remove it first or ingest {source} under another id"
+        )
+
+    collection = get_collection(vector_dir, COLLECTION_NAME, create=True)
+    existing = existing_chunks(collection, document_id)
+    seen_ids = []
+    changed = []
+
+    lexical = load_for_update(vector_dir)
+    ann = load_ann_for_update(vector_dir)
+    sections = SectionTreeBuilder()
+
+    cache = EmbeddingCache(EMBEDDING_MODEL)
+    engine = EmbeddingEngine(EMBEDDING_MODEL, cache=cache, processes=encode_processes)
+
+    pages_q = queue.Queue(maxsize=queue_size)
+    batches_q = queue.Queue(maxsize=queue_size)
+    vectors_q = queue.Queue(maxsize=queue_size)
+
+    abort = threading.Event()
+    errors = []
+    stage_seconds = {}
+    counts = {"pages": 0, "chunks": 0, "skipped": 0, "vectors": 0,
+              "removed": 0, "updated": 0}
+    status = {"stage": "extract", "pages_done": 0, "pages_total": pdf_page_count(pdf_path)}
+
+    def report(stage=None):
+        if stage:
+            status["stage"] = stage
+        if progress:
+            progress({**status, "chunks": counts["chunks"], "vectors": counts["vectors"]})
+
+    def check_cancel():
+        if cancel is not None and cancel.is_set():
+            raise IngestCancelled(f"Indexing of {source} was cancelled")
+
+    pages_writer = RecordWriter(record_path(Path(debug_dir) / "pages")) if debug_dir else None
+    chunks_writer = RecordWriter(record_path(Path(debug_dir) / "chunks")) if debug_dir else None
+
+    def extract():
+        if workers == 1:
+            pages = iter_pdf_pages(pdf_path)
+        else:
+            pages = iter_pdf_pages_parallel(pdf_path, workers)
+
+        for page in pages:
+            check_cancel()
+            counts["pages"] += 1
+            status["pages_done"] = page["page"]
+            report()
+            if pages_writer:
+                pages_writer.write({
+                    "document_id": document_id,
+                    "filename": source,
+                    "document_version": version,
+                    **page,
+                })
+            yield page
+
+        status["pages_done"] = status["pages_total"]
+        report("embed")
+
+    def chunk():
+        batch = []
+        for c in iter_chunks(_drain(pages_q, abort), document_id, source, version):
+            if chunks_writer:
+                chunks_writer.write(c)
+
+            c["text"] = c.get("text", "").strip()
+            if len(c["text"]) < MIN_CHUNK_LENGTH:
+                counts["skipped"] += 1
+                continue
+
+            counts["chunks"] += 1
+            sections.add(c)
+            seen_ids.append(c["id"])
+
+            # Already indexed with the same text: no embedding needed
+            old = existing.get(c["id"])
+            if old is not None:
+                meta = normalize_metadata(c)
+                if old != meta:
+                    changed.append((c["id"], meta))
+                continue
+
+            batch.append(c)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def embed():
+        for batch in _drain(batches_q, abort):
+            vectors = engine.encode([c["text"] for c in batch])
+            yield batch, vectors
+
+    start = time.perf_counter()
+    report()
+    threads = [
+        _start_stage("extract", extract, pages_q, abort, errors, stage_seconds),
+        _start_stage("chunk", chunk, batches_q, abort, errors, stage_seconds),
+        _start_stage("embed", embed, vectors_q, abort, errors, stage_seconds),
+    ]
+
+    stage_start = time.perf_counter()
+    try:
+        for batch, vectors in _drain(vectors_q, abort):
+            check_cancel()
+            ids = [c["id"] for c in batch]
+            texts = [c["text"] for c in batch]
+            metadatas = [normalize_metadata(c) for c in batch]
+
+            staging.add(ids, texts, vectors, metadatas)
+            lexical.add(ids, texts, metadatas)
+            if ann is not None:
+                ann.add(ids, vectors, [document_id] * len(ids))
+            counts["vectors"] += len(batch)
+            report()
+        check_cancel()
+    except BaseException as e:
+        abort.set()
+        errors.insert(0, e)
+    finally:
+        stage_seconds["staging"] = time.perf_counter() - stage_start
+        for thread in threads:
+            thread.join()
+        for writer in (pages_writer, chunks_writer):
+            if writer:
+                writer.close()
+        engine.close()
+        cache.flush()
+
+    if errors:
+        # Nothing was written yet: discarding the staging dir is the rollback
+        raise errors[0]
+
+    # ---- Commit ----
+    report("commit")
+    commit_start = time.perf_counter()
+    added_ids = []
+    try:
+        for ids, texts, vectors, metadatas in staging.replay():
+            collection.upsert(
+                ids=ids,
+                documents=texts,
+                embeddings=vectors.tolist(),
+                metadatas=metadatas,
+            )
+            added_ids.extend(ids)
+    except BaseException:
+        if added_ids:
+            collection.delete(ids=added_ids)
+        raise
+
+    seen_ids = set(seen_ids)
+    removed = [chunk_id for chunk_id in existing if chunk_id not in seen_ids]
+    if removed:
+        collection.delete(ids=removed)
+        lexical.remove_ids(removed)
+        if ann is not None:
+            ann.remove_ids(removed)
+    if changed:
+        collection.update(
+            ids=[chunk_id for chunk_id, _ in changed],
+            metadatas=[meta for _, meta in changed],
+        )
+    counts["removed"] = len(removed)
+    counts["updated"] = len(changed)
+
+    lexical.save(index_path(vector_dir))
+    ann_stats = commit_ann_index(ann, collection, vector_dir)
+    save_document_sections(vector_dir, document_id, sections.tree)
+    register_document(document_id, source, counts["chunks"], vector_dir, version=version)
+    invalidate_index(vector_dir)
+    stage_seconds["commit"] = time.perf_counter() - commit_start
+
+    # Copies of this file indexed under a content-hash id by older versions
+    for old_id in superseded_documents(document_id, source, vector_dir):
+        remove_document(old_id, vector_dir)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "document_id": document_id,
+        "source": source,
+        "version": version,
+        "previous_version": previous.get("version") if previous else None,
+        **counts,
+        "seconds": round(elapsed, 3),
+        "stage_seconds": {k: round(v, 3) for k, v in stage_seconds.items()},
+        "embedding_cache": cache.stats(),
+        "embedding": engine.stats(),
+        "ann": ann_stats,
+    }
+
+
+def main():
+    pdf_files = sorted(RAW_DIR.glob("*.pdf"))
+
+    if not pdf_files:
+        print("No PDF found in data/raw/")
+        return
+
+    for pdf_path in pdf_files:
+        print(f"Ingesting: {pdf_path.name}")
+        stats = ingest_pdf(pdf_path)
+        print(
+            f"  {stats['pages']} pages, {stats['vectors']} vectors "
+            f"in {stats['seconds']}s (stages: {stats['stage_seconds']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,39 @@
 import fitz  # PyMuPDF
-import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import hashlib
 
+from preprocessing.records import RecordWriter, record_path
+
 RAW_DIR = Path("data/raw")
 PROCESSED_DIR = Path("data/processed")
 
+PAGES_FILE = PROCESSED_DIR / "pages.jsonl"   # .jsonl.zst with INTERMEDIATE_FORMAT=zstd
+
+PAGES_PER_TASK = 64  # page range handed to one worker in parallel mode
+
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def compute_document_id(pdf_path: Path) -> str:
+def compute_document_id(pdf_path: Path, key: str = None) -> str:
+    """
+    Stable document ID based on the file name, qualified by `key` when the
+    caller knows where the file comes from (a folder, a URL, a user).
+    Same name and key → same ID, so an edited PDF replaces its previous
+    version (see compute_document_version for what changed); same-named
+    PDFs under different keys stay separate documents.
+    """
+    name = Path(pdf_path).name
+    identity = f"{key}/{name}" if key else name
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()[:12]
+
+
+def compute_document_version(pdf_path: Path) -> str:
     """
-    Stable document ID based on file content.
-    Same PDF → same ID.
+    Version stamp based on file content.
+    Same PDF → same version.
     """
     h = hashlib.sha1()
     with open(pdf_path, "rb") as f:
@@ -21,63 +42,135 @@ def compute_document_id(pdf_path: Path) -> str:
     return h.hexdigest()[:12]
 
 
-def extract_pdf_pages(pdf_path: Path):
-    doc = fitz.open(pdf_path)
+def clean_page_text(text: str) -> str:
+    # Normalize whitespace but KEEP line breaks
+    lines = [line.strip() for line in text.split("\n")]
+    lines = [line for line in lines if line]
+    return "\n".join(lines)
+
+
+def _extract_page_range(pdf_path, start: int, stop: int):
+    """
+    Worker for the process pool: opens its own fitz handle (documents
+    cannot be shared across processes) and extracts pages [start, stop).
+    """
     pages = []
+    with fitz.open(pdf_path) as doc:
+        for i in range(start, min(stop, doc.page_count)):
+            cleaned_text = clean_page_text(doc[i].get_text("text"))
 
-    for i, page in enumerate(doc):
-        text = page.get_text("text")
+            if len(cleaned_text) < 100:
+                continue
 
-        # Normalize whitespace but KEEP line breaks
-        lines = [line.strip() for line in text.split("\n")]
-        lines = [line for line in lines if line]
-        cleaned_text = "\n".join(lines)
+            pages.append({
+                "page": i + 1,
+                "text": cleaned_text
+            })
+    return pages
 
-        if len(cleaned_text) < 100:
-            continue
 
-        pages.append({
-            "page": i + 1,
-            "text": cleaned_text
-        })
+def pdf_page_count(pdf_path: Path) -> int:
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
 
-    return pages
 
+def iter_pdf_pages(pdf_path: Path):
+    """
+    Yield pages one at a time as they are extracted, so downstream
+    stages (chunk_pages accepts any iterable) can start immediately.
+    """
+    with fitz.open(pdf_path) as doc:
+        for i, page in enumerate(doc):
+            cleaned_text = clean_page_text(page.get_text("text"))
 
-def main():
-    pdf_files = sorted(RAW_DIR.glob("*.pdf"))
+            if len(cleaned_text) < 100:
+                continue
 
-    if not pdf_files:
-        print("No PDF found in data/raw/")
+            yield {
+                "page": i + 1,
+                "text": cleaned_text
+            }
+
+
+def iter_pdf_pages_parallel(pdf_path: Path, workers: int = None,
+                            pages_per_task: int = PAGES_PER_TASK):
+    """
+    Split the document into page ranges extracted by a process pool and
+    yield pages in document order.
+
+    At most `2 * workers` ranges are in flight, so memory stays bounded
+    and the first pages are yielded long before the last are extracted.
+    Small documents are not worth the pool start-up and run in-process.
+    """
+    workers = workers or os.cpu_count() or 1
+    page_count = pdf_page_count(pdf_path)
+
+    if workers == 1 or page_count <= pages_per_task:
+        yield from iter_pdf_pages(pdf_path)
         return
 
-    all_documents = []
+    ranges = [
+        (start, start + pages_per_task)
+        for start in range(0, page_count, pages_per_task)
+    ]
+    max_in_flight = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        next_range = 0
 
-    for pdf_path in pdf_files:
-        document_id = compute_document_id(pdf_path)
-        print(f"Extracting: {pdf_path.name} (id={document_id})")
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                start, stop = ranges[next_range]
+                pending.append(pool.submit(_extract_page_range, str(pdf_path), start, stop))
+                next_range += 1
 
-        pages = extract_pdf_pages(pdf_path)
+            # Always wait on the oldest range: keeps output order deterministic
+            yield from pending.popleft().result()
 
-        if not pages:
-            print("  ⚠ No valid text extracted, skipping")
-            continue
 
-        all_documents.append({
-            "document_id": document_id,
-            "filename": pdf_path.name,
-            "num_pages": len(pages),
-            "pages": pages
-        })
+def extract_pdf_pages(pdf_path: Path, workers: int = 1):
+    if workers == 1:
+        return list(iter_pdf_pages(pdf_path))
+    return list(iter_pdf_pages_parallel(pdf_path, workers))
 
-    if not all_documents:
-        raise RuntimeError("No valid PDFs were processed")
 
-    output_path = PROCESSED_DIR / "pages.json"
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(all_documents, f, indent=2, ensure_ascii=False)
+def main():
+    pdf_files = sorted(RAW_DIR.glob("*.pdf"))
+
+    if not pdf_files:
+        print("No PDF found in data/raw/")
+        return
 
-    print(f"\nProcessed {len(all_documents)} document(s)")
+    # One line per page, tagged with its document; pages are streamed
+    # straight from extraction to disk, never collected in memory
+    output_path = record_path(PAGES_FILE)
+    processed = 0
+
+    with RecordWriter(output_path) as writer:
+        for pdf_path in pdf_files:
+            document_id = compute_document_id(pdf_path)
+            version = compute_document_version(pdf_path)
+            print(f"Extracting: {pdf_path.name} (id={document_id}, version={version})")
+
+            written = writer.count
+            for page in iter_pdf_pages_parallel(pdf_path, workers=os.cpu_count() or 1):
+                writer.write({
+                    "document_id": document_id,
+                    "filename": pdf_path.name,
+                    "document_version": version,
+                    **page,
+                })
+
+            if writer.count == written:
+                print("  ⚠ No valid text extracted, skipping")
+                continue
+            processed += 1
+
+        if not processed:
+            raise RuntimeError("No valid PDFs were processed")
+
+    print(f"\nProcessed {processed} document(s)")
     print(f"Saved to {output_path}")
 
 
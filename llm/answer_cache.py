@@ -0,0 +1,275 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from llm.base import NO_CONTEXT_ANSWER, is_error_answer
+from observability.tracing import span
+
+# ---------------- CONFIG ---------------- #
+
+ANSWER_CACHE_PATH = Path("data/answer_cache.sqlite")
+ANSWER_CACHE_TTL = 7 * 24 * 3600    # seconds
+ANSWER_CACHE_MAX_ENTRIES = 20_000
+PRUNE_EVERY = 100                   # writes between size / TTL sweeps
+
+# ---------------------------------------- #
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key          TEXT PRIMARY KEY,
+    backend      TEXT NOT NULL,
+    model        TEXT NOT NULL,
+    intent       TEXT NOT NULL,
+    question     TEXT NOT NULL,
+    answer       TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used_at);
+"""
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+def context_hash(context: str) -> str:
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+def answer_key(backend: str, model: str, prompt_style: str, intent: str,
+               question: str, context: str, index_version: str = "") -> str:
+    """
+    Everything that can change the answer: who answers (backend, model,
+    prompt template), what is asked (intent, normalized question), what
+    it is grounded on (hash of the packed context) and the indexed state
+    of the documents that context came from.
+    """
+    parts = [backend, model, prompt_style, intent,
+             normalize_question(question), context_hash(context), index_version]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Persistent answer cache in SQLite, shared by every process using the
+    same file (WAL mode: readers never block the writer).
+
+    Entries expire after `ttl` seconds; beyond `max_entries` the least
+    recently used ones are evicted.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl: float = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            answer, created_at = row
+            if self.ttl and created_at + self.ttl < now:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE answers SET last_used_at = ?, hits = hits + 1 WHERE key = ?",
+                (now, key),
+            )
+            self._conn.commit()
+            self.hits += 1
+            return answer
+
+    def put(self, key: str, answer: str, backend: str, model: str,
+            intent: str, question: str):
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, backend, model, intent, question, answer, created_at, last_used_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, backend, model, intent, normalize_question(question), answer, now, now),
+            )
+            self._conn.commit()
+
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(now)
+
+    def _prune(self, now: float):
+        if self.ttl:
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+
+        # Keep the max_entries most recently used answers
+        self._conn.execute(
+            "DELETE FROM answers WHERE key IN ("
+            " SELECT key FROM answers ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._conn.commit()
+
+    def prune(self):
+        with self._lock:
+            self._prune(time.time())
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_answer_cache(path=ANSWER_CACHE_PATH, **kwargs) -> AnswerCache:
+    # One connection per file and process (Streamlit reruns share it)
+    key = str(Path(path).resolve())
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = AnswerCache(path, **kwargs)
+            _caches[key] = cache
+        return cache
+
+
+def _cacheable(answer: str) -> bool:
+    return bool(answer.strip()) and answer != NO_CONTEXT_ANSWER and not is_error_answer(answer)
+
+
+class CachedLLM:
+    """
+    Wraps any backend with the answer cache. Same interface as the
+    backend; every method also takes
+
+    - index_version: indexed state of the documents behind the context
+      (indexing.corpus.document_versions), so re-indexing a document
+      invalidates its answers
+    - use_cache=False: skip the lookup and do not store (e.g. "regenerate")
+
+    Error answers are never stored. A stream abandoned halfway is not
+    stored either.
+    """
+
+    def __init__(self, backend, cache: AnswerCache = None):
+        self.backend = backend
+        self.cache = cache or get_answer_cache()
+        self.last_cached = False
+
+    def __getattr__(self, name):
+        # name, model, context_budget, count_tokens, ... come from the backend
+        return getattr(self.backend, name)
+
+    def _key(self, question, context, intent, index_version):
+        backend = self.backend
+        return answer_key(backend.name, backend.model, getattr(backend, "prompt_style", ""),
+                          intent, question, context, index_version)
+
+    def _lookup(self, key):
+        with span("answer_cache.get") as s:
+            cached = self.cache.get(key)
+            s.set(hit=cached is not None)
+        return cached
+
+    def _store(self, key, answer, question, intent):
+        if _cacheable(answer):
+            self.cache.put(key, answer, self.backend.name, self.backend.model, intent, question)
+
+    def answer(self, question: str, context: str, intent: str,
+               index_version: str = "", use_cache: bool = True) -> str:
+        self.last_cached = False
+        if not use_cache:
+            return self.backend.answer(question, context, intent)
+
+        key = self._key(question, context, intent, index_version)
+        cached = self._lookup(key)
+        if cached is not None:
+            self.last_cached = True
+            return cached
+
+        answer = self.backend.answer(question, context, intent)
+        self._store(key, answer, question, intent)
+        return answer
+
+    def stream_answer(self, question: str, context: str, intent: str,
+                      index_version: str = "", use_cache: bool = True):
+        self.last_cached = False
+        if not use_cache:
+            yield from self.backend.stream_answer(question, context, intent)
+            return
+
+        key = self._key(question, context, intent, index_version)
+        cached = self._lookup(key)
+        if cached is not None:
+            self.last_cached = True
+            yield cached
+            return
+
+        parts = []
+        for token in self.backend.stream_answer(question, context, intent):
+            parts.append(token)
+            yield token
+
+        self._store(key, "".join(parts).strip(), question, intent)
+
+    def answer_batch(self, requests, index_version: str = "", use_cache: bool = True):
+        if not use_cache:
+            return self.backend.answer_batch(requests)
+
+        keys = [self._key(q, c, i, index_version) for q, c, i in requests]
+        answers = [self._lookup(key) for key in keys]
+
+        # Only the misses go to the backend, still as one batch
+        missing = [n for n, a in enumerate(answers) if a is None]
+        if missing:
+            fresh = self.backend.answer_batch([requests[n] for n in missing])
+            for n, answer in zip(missing, fresh):
+                answers[n] = answer
+                question, _, intent = requests[n]
+                self._store(keys[n], answer, question, intent)
+
+        return answers
+
+    def __repr__(self):
+        return f"CachedLLM({self.backend!r})"
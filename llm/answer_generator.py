@@ -1,35 +1,35 @@
 import os
-from typing import Literal, Optional
+from typing import List, Optional, Sequence
 
-from llm.offline_ollama import OllamaClient
-from llm.online_gemini import GeminiClient
-from llm.prompts import grounded_qa_prompt
-
-LLMProvider = Literal["ollama", "gemini"]
+from llm.base import Request
+from llm.registry import available_backends, get_backend
 
 
 class AnswerGenerator:
-    """High-level wrapper that chooses between Ollama and Gemini.
+    """High-level wrapper around any registered LLM backend.
 
     Provider can be selected via constructor or `LLM_PROVIDER` env var
-    ("ollama" or "gemini"). Defaults to Ollama so it works out of the box
-    if you already have an Ollama server running locally.
+    (any name from llm.registry.available_backends()). Defaults to Ollama
+    so it works out of the box if you already have an Ollama server
+    running locally. Prompts use the grounded QA template unless another
+    prompt style is given.
     """
 
-    def __init__(self, provider: Optional[str] = None):
+    def __init__(self, provider: Optional[str] = None, prompt_style: str = "grounded",
+                 **backend_options):
         raw = (provider or os.getenv("LLM_PROVIDER", "ollama")).lower()
 
-        if raw not in ("ollama", "gemini"):
+        if raw not in available_backends():
             raise ValueError(f"Unsupported LLM_PROVIDER: {raw}")
 
-        self.provider: LLMProvider = raw  # type: ignore[assignment]
+        self.provider = raw
+        self.llm = get_backend(raw, prompt_style=prompt_style, **backend_options)
+
+    def generate(self, context: str, question: str, intent: str = "GENERAL") -> str:
+        return self.llm.answer(question, context, intent)
 
-        if self.provider == "gemini":
-            self.llm = GeminiClient()
-        else:
-            # Default path: local Ollama
-            self.llm = OllamaClient()
+    def stream(self, context: str, question: str, intent: str = "GENERAL"):
+        return self.llm.stream_answer(question, context, intent)
 
-    def generate(self, context: str, question: str) -> str:
-        prompt = grounded_qa_prompt(context, question)
-        return self.llm.generate(prompt)
+    def generate_batch(self, requests: Sequence[Request]) -> List[str]:
+        return self.llm.answer_batch(requests)
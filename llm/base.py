@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Protocol, Sequence, Tuple, runtime_checkable
+
+from llm.prompts import DEFAULT_STYLE, build_prompt
+from observability.tracing import traced
+from llm.tokens import estimate_tokens
+
+# (question, context, intent)
+Request = Tuple[str, str, str]
+
+TRACED_METHODS = ("answer", "stream_answer", "answer_batch")
+
+NO_CONTEXT_ANSWER = "No relevant information found in the document."
+ERROR_MARKERS = ("[LLM ERROR]", "[GEMINI ERROR]")
+
+
+def is_error_answer(text: str) -> bool:
+    # Streams can fail after some tokens, so look anywhere in the text
+    return any(marker in text for marker in ERROR_MARKERS)
+
+
+class BackendBusyError(RuntimeError):
+    """Raised instead of queueing when a backend already has too many requests waiting."""
+
+
+@runtime_checkable
+class LLMBackend(Protocol):
+    """
+    What the app, scripts and AnswerGenerator rely on. Errors are
+    returned as answer text ("[LLM ERROR] ..."), never raised, except
+    BackendBusyError for load shedding.
+    """
+
+    name: str
+    model: str
+    context_budget: int
+
+    def count_tokens(self, text: str) -> int: ...
+
+    def answer(self, question: str, context: str, intent: str) -> str: ...
+
+    def stream_answer(self, question: str, context: str, intent: str) -> Iterator[str]: ...
+
+    def answer_batch(self, requests: Sequence[Request]) -> List[str]: ...
+
+
+class BaseLLM:
+    """
+    Shared plumbing for backends: prompt building from the template
+    registry, plus default streaming and batch methods. A backend only
+    has to implement answer(); native streaming / batching are optional
+    overrides.
+    """
+
+    name = "base"
+    prompt_style = DEFAULT_STYLE
+    batch_workers = 1   # >1 only for backends that serve requests concurrently
+    context_budget = 1500   # tokens of retrieved context per prompt
+
+    def __init_subclass__(cls, **kwargs):
+        # Every backend's answer / stream_answer / answer_batch shows up as
+        # an "llm.<method>" span (no-op unless a trace is active)
+        super().__init_subclass__(**kwargs)
+        for method in TRACED_METHODS:
+            fn = cls.__dict__.get(method)
+            if fn is not None:
+                setattr(cls, method, traced(f"llm.{method}", attrs=_span_attrs)(fn))
+
+    def __init__(self, model: str, prompt_style: str = None):
+        self.model = model
+        if prompt_style:
+            self.prompt_style = prompt_style
+
+    def _prompt(self, question: str, context: str, intent: str) -> str:
+        return build_prompt(question, context, intent, self.prompt_style)
+
+    def count_tokens(self, text: str) -> int:
+        # Backends with a local tokenizer override this
+        return estimate_tokens(text)
+
+    def answer(self, question: str, context: str, intent: str) -> str:
+        raise NotImplementedError
+
+    def stream_answer(self, question: str, context: str, intent: str):
+        # Non-streaming backends yield the whole answer at once
+        yield self.answer(question, context, intent)
+
+    def answer_batch(self, requests: Sequence[Request], max_workers: int = None) -> List[str]:
+        """
+        Answers in input order. I/O-bound backends fan out over threads,
+        in-process ones run sequentially.
+        """
+        workers = min(max_workers or self.batch_workers, len(requests))
+        if workers <= 1:
+            return [self.answer(*r) for r in requests]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda r: self.answer(*r), requests))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(model={self.model!r})"
+
+
+def _span_attrs(self, *args, **kwargs):
+    return {"backend": self.name, "model": self.model}
@@ -0,0 +1,57 @@
+import hashlib
+import re
+import time
+
+from llm.base import NO_CONTEXT_ANSWER, BaseLLM
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class FakeLLM(BaseLLM):
+    """
+    Deterministic stand-in for load tests and benchmarks: no model, no
+    network. The answer is the first sentences of the context, tagged with
+    the intent and a hash of the full prompt, so identical inputs always
+    give identical answers and prompt changes are visible.
+
+    latency is added once per answer (time to first token), token_delay
+    after every streamed word.
+    """
+
+    name = "fake"
+
+    def __init__(self, model: str = "fake", latency: float = 0.0,
+                 token_delay: float = 0.0, sentences: int = 2,
+                 prompt_style: str = None):
+        super().__init__(model, prompt_style)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.sentences = sentences
+        self.batch_workers = 8
+
+    def _text(self, question: str, context: str, intent: str) -> str:
+        if not context.strip():
+            return NO_CONTEXT_ANSWER
+
+        prompt = self._prompt(question, context, intent)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        excerpt = " ".join(SENTENCE_END.split(context.strip())[:self.sentences])
+        return f"[{intent} {digest}] {excerpt}"
+
+    def answer(self, question: str, context: str, intent: str) -> str:
+        if self.token_delay:
+            return "".join(self.stream_answer(question, context, intent))
+
+        if self.latency:
+            time.sleep(self.latency)
+        return self._text(question, context, intent)
+
+    def stream_answer(self, question: str, context: str, intent: str):
+        if self.latency:
+            time.sleep(self.latency)
+
+        words = self._text(question, context, intent).split(" ")
+        for i, word in enumerate(words):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
@@ -0,0 +1,81 @@
+import os
+import threading
+
+from llm.base import NO_CONTEXT_ANSWER, BaseLLM
+
+# ---------------- CONFIG ---------------- #
+
+LLAMA_CPP_MODEL = os.getenv("LLAMA_CPP_MODEL")   # path to a .gguf file
+LLAMA_CPP_CTX = 4096
+LLAMA_CPP_THREADS = os.cpu_count() or 1
+LLAMA_CPP_MAX_TOKENS = 512
+PROMPT_OVERHEAD_TOKENS = 256   # instructions, rules and chat template
+
+# ---------------------------------------- #
+
+
+class LlamaCppLLM(BaseLLM):
+    """
+    In-process llama.cpp backend (pip install llama-cpp-python).
+
+    The import is deferred so the rest of the app works without the
+    package. One Llama instance cannot run two generations at once, so
+    calls on the same backend are serialized with a lock.
+    """
+
+    name = "llama-cpp"
+    prompt_style = "ollama"
+
+    def __init__(self, model: str = LLAMA_CPP_MODEL, n_ctx: int = LLAMA_CPP_CTX,
+                 n_threads: int = LLAMA_CPP_THREADS,
+                 max_tokens: int = LLAMA_CPP_MAX_TOKENS, temperature: float = 0.2,
+                 prompt_style: str = None):
+        super().__init__(model, prompt_style)
+
+        if not model:
+            raise RuntimeError("Set LLAMA_CPP_MODEL to the path of a .gguf model")
+
+        try:
+            from llama_cpp import Llama
+        except ImportError as e:
+            raise RuntimeError(
+                "llama-cpp-python is not installed (pip install llama-cpp-python)"
+            ) from e
+
+        self.llama = Llama(model_path=model, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self._lock = threading.Lock()
+
+        # Whatever the window leaves after the answer and the fixed prompt
+        self.context_budget = max(n_ctx - max_tokens - PROMPT_OVERHEAD_TOKENS, 256)
+
+    def count_tokens(self, text: str) -> int:
+        # Exact: the model's own tokenizer, no inference involved
+        return len(self.llama.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def answer(self, question: str, context: str, intent: str) -> str:
+        return "".join(self.stream_answer(question, context, intent)).strip()
+
+    def stream_answer(self, question: str, context: str, intent: str):
+        if not context.strip():
+            yield NO_CONTEXT_ANSWER
+            return
+
+        messages = [{"role": "user", "content": self._prompt(question, context, intent)}]
+
+        with self._lock:
+            try:
+                # Chat completion applies the model's own chat template
+                for chunk in self.llama.create_chat_completion(
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    stream=True,
+                ):
+                    token = chunk["choices"][0]["delta"].get("content")
+                    if token:
+                        yield token
+
+            except Exception as e:
+                yield f"[LLM ERROR] {e}"
@@ -1,13 +1,75 @@
+import json
+import os
 import subprocess
+import threading
 
+import requests
+from requests.adapters import HTTPAdapter
 
-class OfflineLLM:
-    def __init__(self, model: str = "llama3.2"):
-        self.model = model
+from llm.base import NO_CONTEXT_ANSWER, BaseLLM
+from llm.tokens import estimate_tokens, hf_token_counter
+
+# ---------------- CONFIG ---------------- #
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = "30m"   # keep the model loaded between questions
+OLLAMA_TIMEOUT = 120        # seconds without a new token before giving up
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))  # concurrent batch requests
+
+# Ollama's default window is small (2048-4096 tokens); keep room for the
+# instructions and the answer so nothing is silently truncated
+OLLAMA_CONTEXT_BUDGET = 1500
+# Optional Hugging Face tokenizer matching the model, for exact counts
+OLLAMA_TOKENIZER = os.getenv("OLLAMA_TOKENIZER")
+
+# ---------------------------------------- #
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _base_url(host: str) -> str:
+    # OLLAMA_HOST is often given without a scheme, e.g. "127.0.0.1:11434"
+    if not host.startswith(("http://", "https://")):
+        host = f"http://{host}"
+    return host.rstrip("/")
+
+
+def _session(base_url: str) -> requests.Session:
+    """
+    One keep-alive session (connection pool) per Ollama server, shared by
+    every OllamaHTTPLLM in the process.
+    """
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[base_url] = session
+        return session
+
+
+class OfflineLLM(BaseLLM):
+    """
+    Ollama through the `ollama run` CLI: one process per question.
+    """
+
+    name = "ollama-cli"
+    prompt_style = "ollama"
+    context_budget = OLLAMA_CONTEXT_BUDGET
+
+    def __init__(self, model: str = "llama3.2", prompt_style: str = None):
+        super().__init__(model, prompt_style)
+
+    def count_tokens(self, text: str) -> int:
+        counter = hf_token_counter(OLLAMA_TOKENIZER) if OLLAMA_TOKENIZER else None
+        return counter(text) if counter else estimate_tokens(text)
 
     def answer(self, question: str, context: str, intent: str) -> str:
         if not context.strip():
-            return "No relevant information found in the document."
+            return NO_CONTEXT_ANSWER
 
         prompt = self._prompt(question, context, intent)
 
@@ -28,55 +90,87 @@ class OfflineLLM:
 
         return result.stdout.strip()
 
-    def _prompt(self, question: str, context: str, intent: str) -> str:
-        if intent == "DOCUMENT_SUMMARY":
-            instruction = (
-                "You are given multiple excerpts from a single research paper. "
-                "Write a concise but complete summary of the paper by synthesizing "
-                "information across all excerpts."
-            )
 
-            rules = (
-                "- Use ONLY the provided text\n"
-                "- Combine information across sections\n"
-                "- Do NOT say information is missing unless context is irrelevant\n"
-            )
+class OllamaHTTPLLM(OfflineLLM):
+    """
+    Ollama backend over the local HTTP API instead of `ollama run`.
 
-        elif intent == "SECTION":
-            instruction = (
-                "Explain and summarize the given section using only the provided text."
-            )
-            rules = "- Use only the given section\n"
+    - pooled keep-alive connections, shared across instances
+    - tokens are streamed back as they are generated (stream_answer)
+    - keep_alive keeps the model resident between questions
+    - reuse_context feeds the returned `context` back into the next
+      request, so follow-up questions skip re-processing the history
+    """
 
-        elif intent == "COMPARISON":
-            instruction = "Compare the concepts using only the provided text."
-            rules = "- Use only the given context\n"
+    name = "ollama"
 
-        elif intent == "WHY":
-            instruction = "Explain the reason using only the provided text."
-            rules = "- Use only the given context\n"
+    def __init__(self, model: str = "llama3.2", host: str = OLLAMA_HOST,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE, reuse_context: bool = False,
+                 timeout: float = OLLAMA_TIMEOUT, options: dict = None,
+                 prompt_style: str = None):
+        super().__init__(model, prompt_style)
+        self.base_url = _base_url(host)
+        self.keep_alive = keep_alive
+        self.reuse_context = reuse_context
+        self.timeout = timeout
+        self.options = options or {}
+        self.session = _session(self.base_url)
+        self._context = None
 
-        else:
-            instruction = "Answer the question using only the provided text."
-            rules = (
-                "- If missing, say:\n"
-                "  'The document does not contain enough information to answer this.'"
-            )
+        # The server answers OLLAMA_NUM_PARALLEL requests at once; a shared
+        # conversation context only makes sense for sequential questions
+        self.batch_workers = 1 if reuse_context else OLLAMA_NUM_PARALLEL
 
-        return f"""
-{instruction}
+    def reset_context(self):
+        self._context = None
 
-Rules:
-{rules}
-
---------------------
-CONTEXT:
-{context}
---------------------
+    def answer(self, question: str, context: str, intent: str) -> str:
+        return "".join(self.stream_answer(question, context, intent)).strip()
 
-QUESTION:
-{question}
+    def stream_answer(self, question: str, context: str, intent: str):
+        if not context.strip():
+            yield NO_CONTEXT_ANSWER
+            return
+
+        payload = {
+            "model": self.model,
+            "prompt": self._prompt(question, context, intent),
+            "stream": True,
+            "keep_alive": self.keep_alive,
+        }
+        if self.options:
+            payload["options"] = self.options
+        if self.reuse_context and self._context:
+            payload["context"] = self._context
 
-ANSWER:
-""".strip()
+        try:
+            with self.session.post(
+                f"{self.base_url}/api/generate",
+                json=payload,
+                stream=True,
+                timeout=(5, self.timeout),
+            ) as response:
+                if response.status_code != 200:
+                    yield f"[LLM ERROR] {response.status_code} {response.text}"
+                    return
+
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+
+                    message = json.loads(line)
+                    if message.get("error"):
+                        yield f"[LLM ERROR] {message['error']}"
+                        return
+
+                    token = message.get("response")
+                    if token:
+                        yield token
+
+                    # Keep reading to the end of the body after "done" so the
+                    # connection goes back to the pool instead of being closed
+                    if message.get("done") and self.reuse_context:
+                        self._context = message.get("context")
 
+        except Exception as e:
+            yield f"[LLM ERROR] {e}"
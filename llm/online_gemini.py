@@ -1,19 +1,80 @@
+import asyncio
 import os
+import threading
+import weakref
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
 from google import genai
 
+from llm.base import BackendBusyError, BaseLLM
+from llm.tokens import estimate_tokens, gemini_token_counter
+from observability.tracing import trace_aiter
+
 load_dotenv()
 
+# ---------------- CONFIG ---------------- #
+
+MAX_CONCURRENT_REQUESTS = 8   # in-flight Gemini calls per event loop
+MAX_PENDING_REQUESTS = 64     # waiting callers beyond this are rejected
+
+GEMINI_CONTEXT_BUDGET = 6000  # long windows, but every token is billed and adds latency
+
+# ---------------------------------------- #
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Per event loop: asyncio primitives cannot be shared across loops
+_limiters = weakref.WeakKeyDictionary()
+
+
+class GeminiBusyError(BackendBusyError):
+    """Raised instead of queueing when too many Gemini requests are already waiting."""
+
+
+def _client(api_key: str):
+    # One SDK client (and its HTTP connection pool) per key, shared by
+    # every OnlineGeminiLLM and every concurrent session
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = genai.Client(api_key=api_key)
+            _clients[api_key] = client
+        return client
+
+
+class _Limiter:
+    def __init__(self, max_concurrent: int, max_pending: int):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_pending = max_pending
+        self.pending = 0
+
+
+class OnlineGeminiLLM(BaseLLM):
+    name = "gemini"
+    prompt_style = "gemini"
+    context_budget = GEMINI_CONTEXT_BUDGET
+
+    def __init__(self, model: str = "gemini-2.5-flash",
+                 max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 max_pending: int = MAX_PENDING_REQUESTS,
+                 prompt_style: str = None):
+        super().__init__(model, prompt_style)
 
-class OnlineGeminiLLM:
-    def __init__(self, model: str = "gemini-2.5-flash"):
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise RuntimeError("GEMINI_API_KEY not found in environment")
 
         # Correct NEW SDK usage
-        self.client = genai.Client(api_key=api_key)
-        self.model = model
+        self.client = _client(api_key)
+        self.max_concurrent = max_concurrent
+        self.batch_workers = max_concurrent
+        self.max_pending = max_pending
+
+    def count_tokens(self, text: str) -> int:
+        counter = gemini_token_counter(self.model)
+        return counter(text) if counter else estimate_tokens(text)
 
     def answer(self, question: str, context: str, intent: str) -> str:
         prompt = self._prompt(question, context, intent)
@@ -28,64 +89,97 @@ class OnlineGeminiLLM:
         except Exception as e:
             return f"[GEMINI ERROR] {e}"
 
-    def _prompt(self, question: str, context: str, intent: str) -> str:
-        if intent == "DOCUMENT_SUMMARY":
-            instruction = (
-                "You are given multiple excerpts from a single research paper. "
-                "Produce a coherent high-level summary of the paper by synthesizing "
-                "the information across all excerpts."
-            )
-
-            rules = (
-                "- Base your summary ONLY on the provided text\n"
-                "- It is OK to combine information across multiple sections\n"
-                "- Do NOT mention missing sections like abstract or introduction\n"
-                "- Do NOT refuse unless the text is completely unrelated\n"
-            )
-
-        elif intent == "SECTION":
-            instruction = (
-                "The following text contains content from a specific numbered section of a document. "
-                "Explain what this section discusses in a clear and structured way."
-            )
-            rules = (
-                "- Treat the provided text as authoritative section content\n"
-                "- Do NOT check whether the section exists\n"
-                "- Do NOT refuse or say information is missing\n"
-                "- Use only the given text\n"
-            )
+    def stream_answer(self, question: str, context: str, intent: str):
+        """
+        Yields text as Gemini produces it. Time to first token and total
+        time are recorded per call on its "llm.stream_answer" span
+        (first_item_ms / duration_ms), not on this shared instance.
+        """
+        prompt = self._prompt(question, context, intent)
 
+        try:
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model,
+                contents=prompt
+            ):
+                if chunk.text:
+                    yield chunk.text
 
-        elif intent == "COMPARISON":
-            instruction = (
-                "Compare the concepts mentioned using only the provided text."
+        except Exception as e:
+            yield f"[GEMINI ERROR] {e}"
+
+    # ---------------- async ---------------- #
+
+    def _limiter(self) -> _Limiter:
+        loop = asyncio.get_running_loop()
+        limiter = _limiters.get(loop)
+        if limiter is None:
+            limiter = _Limiter(self.max_concurrent, self.max_pending)
+            _limiters[loop] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def _slot(self):
+        """
+        Bounded concurrency with back-pressure: at most max_concurrent
+        calls run, at most max_pending wait, anything beyond that fails
+        fast with GeminiBusyError so callers can shed load.
+        """
+        limiter = self._limiter()
+        if limiter.pending >= limiter.max_pending:
+            raise GeminiBusyError(
+                f"{limiter.pending} Gemini requests already waiting"
             )
-            rules = "- Use only the given context\n"
 
-        elif intent == "WHY":
-            instruction = "Explain the reason using only the provided text."
-            rules = "- Use only the given context\n"
+        limiter.pending += 1
+        try:
+            await limiter.semaphore.acquire()
+        finally:
+            limiter.pending -= 1
 
-        else:
-            instruction = "Answer the question using only the provided text."
-            rules = (
-                "- If the answer is missing, say:\n"
-                "  'The document does not contain enough information to answer this.'"
-            )
+        try:
+            yield
+        finally:
+            limiter.semaphore.release()
 
-        return f"""
-{instruction}
+    async def answer_async(self, question: str, context: str, intent: str) -> str:
+        prompt = self._prompt(question, context, intent)
 
-Rules:
-{rules}
+        async with self._slot():
+            try:
+                response = await self.client.aio.models.generate_content(
+                    model=self.model,
+                    contents=prompt
+                )
+                return response.text.strip()
+
+            except Exception as e:
+                return f"[GEMINI ERROR] {e}"
+
+    async def stream_answer_async(self, question: str, context: str, intent: str):
+        """
+        Async stream_answer(); timings go on an "llm.stream_answer_async"
+        span, started once a slot is free.
+        """
+        prompt = self._prompt(question, context, intent)
 
---------------------
-CONTEXT:
-{context}
---------------------
+        async with self._slot():
+            tokens = trace_aiter(
+                "llm.stream_answer_async", self._stream_async(prompt),
+                backend=self.name, model=self.model,
+            )
+            async for text in tokens:
+                yield text
 
-QUESTION:
-{question}
+    async def _stream_async(self, prompt: str):
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model,
+                contents=prompt
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
 
-ANSWER:
-""".strip()
+        except Exception as e:
+            yield f"[GEMINI ERROR] {e}"
@@ -1,6 +1,33 @@
-def grounded_qa_prompt(context: str, question: str) -> str:
-    return f"""
-You are a technical assistant answering questions about a document.
+from string import Template
+
+# ---------------- CONFIG ---------------- #
+
+DEFAULT_STYLE = "ollama"
+DEFAULT_INTENT = "GENERAL"
+
+# ---------------------------------------- #
+
+# Every backend builds its prompt from here. Templates are assembled and
+# compiled once at import; per question only $context / $question are
+# substituted (the substituted text itself is never re-parsed, so a "$"
+# inside a document is safe).
+
+QA_LAYOUT = """$instruction
+
+Rules:
+$rules
+
+--------------------
+CONTEXT:
+{context}
+--------------------
+
+QUESTION:
+{question}
+
+ANSWER:"""
+
+GROUNDED_LAYOUT = """You are a technical assistant answering questions about a document.
 
 Using ONLY the information provided in the context below:
 - Synthesize information from different parts of the context
@@ -18,5 +45,112 @@ Context:
 Question:
 {question}
 
-Answer (2–4 sentences):
-"""
+Answer (2–4 sentences):"""
+
+# style -> intent -> (instruction, rules)
+QA_STYLES = {
+    # Short, literal instructions: small local models follow these best
+    "ollama": {
+        "DOCUMENT_SUMMARY": (
+            "You are given multiple excerpts from a single research paper. "
+            "Write a concise but complete summary of the paper by synthesizing "
+            "information across all excerpts.",
+            "- Use ONLY the provided text\n"
+            "- Combine information across sections\n"
+            "- Do NOT say information is missing unless context is irrelevant\n",
+        ),
+        "SECTION": (
+            "Explain and summarize the given section using only the provided text.",
+            "- Use only the given section\n",
+        ),
+        "COMPARISON": (
+            "Compare the concepts using only the provided text.",
+            "- Use only the given context\n",
+        ),
+        "WHY": (
+            "Explain the reason using only the provided text.",
+            "- Use only the given context\n",
+        ),
+        DEFAULT_INTENT: (
+            "Answer the question using only the provided text.",
+            "- If missing, say:\n"
+            "  'The document does not contain enough information to answer this.'",
+        ),
+    },
+    "gemini": {
+        "DOCUMENT_SUMMARY": (
+            "You are given multiple excerpts from a single research paper. "
+            "Produce a coherent high-level summary of the paper by synthesizing "
+            "the information across all excerpts.",
+            "- Base your summary ONLY on the provided text\n"
+            "- It is OK to combine information across multiple sections\n"
+            "- Do NOT mention missing sections like abstract or introduction\n"
+            "- Do NOT refuse unless the text is completely unrelated\n",
+        ),
+        "SECTION": (
+            "The following text contains content from a specific numbered section of a document. "
+            "Explain what this section discusses in a clear and structured way.",
+            "- Treat the provided text as authoritative section content\n"
+            "- Do NOT check whether the section exists\n"
+            "- Do NOT refuse or say information is missing\n"
+            "- Use only the given text\n",
+        ),
+        "COMPARISON": (
+            "Compare the concepts mentioned using only the provided text.",
+            "- Use only the given context\n",
+        ),
+        "WHY": (
+            "Explain the reason using only the provided text.",
+            "- Use only the given context\n",
+        ),
+        DEFAULT_INTENT: (
+            "Answer the question using only the provided text.",
+            "- If the answer is missing, say:\n"
+            "  'The document does not contain enough information to answer this.'",
+        ),
+    },
+}
+
+
+def _compile(layout: str) -> Template:
+    # Literal "$" in the fixed text must not be read as a placeholder
+    text = layout.replace("$", "$$")
+    return Template(text.replace("{context}", "$context").replace("{question}", "$question"))
+
+
+def _compile_qa(instruction: str, rules: str) -> Template:
+    layout = Template(QA_LAYOUT).substitute(instruction=instruction, rules=rules)
+    return _compile(layout)
+
+
+PROMPT_TEMPLATES = {
+    style: {intent: _compile_qa(*parts) for intent, parts in intents.items()}
+    for style, intents in QA_STYLES.items()
+}
+PROMPT_TEMPLATES["grounded"] = {DEFAULT_INTENT: _compile(GROUNDED_LAYOUT)}
+
+
+def register_prompt_style(style: str, templates: dict):
+    """
+    Add a style: {intent: layout} where each layout contains {context}
+    and {question}. A DEFAULT_INTENT entry is required as the fallback.
+    """
+    if DEFAULT_INTENT not in templates:
+        raise ValueError(f"Prompt style '{style}' needs a {DEFAULT_INTENT} template")
+    PROMPT_TEMPLATES[style] = {intent: _compile(t) for intent, t in templates.items()}
+
+
+def get_template(intent: str, style: str = DEFAULT_STYLE) -> Template:
+    if style not in PROMPT_TEMPLATES:
+        raise ValueError(f"Unknown prompt style: {style}")
+    templates = PROMPT_TEMPLATES[style]
+    return templates.get(intent) or templates[DEFAULT_INTENT]
+
+
+def build_prompt(question: str, context: str, intent: str = DEFAULT_INTENT,
+                 style: str = DEFAULT_STYLE) -> str:
+    return get_template(intent, style).substitute(context=context, question=question)
+
+
+def grounded_qa_prompt(context: str, question: str) -> str:
+    return build_prompt(question, context, style="grounded")
@@ -0,0 +1,87 @@
+import threading
+
+# Backend registry: name -> (factory, UI label). Factories import their
+# module lazily, so an optional dependency (google-genai, llama-cpp-python)
+# is only needed when that backend is actually selected.
+_backends = {}
+_instances = {}
+_lock = threading.Lock()
+
+
+def register_backend(name: str, factory, label: str = None):
+    """
+    factory(**kwargs) must return an object implementing llm.base.LLMBackend.
+    """
+    with _lock:
+        _backends[name] = (factory, label or name)
+        for key in [k for k in _instances if k[0] == name]:
+            del _instances[key]
+
+
+def available_backends() -> dict:
+    """
+    {name: label}, in registration order.
+    """
+    with _lock:
+        return {name: label for name, (_, label) in _backends.items()}
+
+
+def create_backend(name: str, **kwargs):
+    if name not in _backends:
+        raise ValueError(f"Unknown LLM backend: {name}")
+    factory, _ = _backends[name]
+    return factory(**kwargs)
+
+
+def get_backend(name: str, **kwargs):
+    """
+    Shared instance per (name, kwargs). Streamlit reruns the script on
+    every interaction; this keeps clients, connection pools and
+    in-process models alive across reruns.
+    """
+    key = (name, tuple(sorted(kwargs.items())))
+
+    with _lock:
+        backend = _instances.get(key)
+    if backend is not None:
+        return backend
+
+    # Created outside the lock: loading a local model can take a while
+    backend = create_backend(name, **kwargs)
+
+    with _lock:
+        return _instances.setdefault(key, backend)
+
+
+# ---------------- Built-in backends ---------------- #
+
+def _ollama(**kwargs):
+    from llm.offline_ollama import OllamaHTTPLLM
+    return OllamaHTTPLLM(**kwargs)
+
+
+def _ollama_cli(**kwargs):
+    from llm.offline_ollama import OfflineLLM
+    return OfflineLLM(**kwargs)
+
+
+def _gemini(**kwargs):
+    from llm.online_gemini import OnlineGeminiLLM
+    return OnlineGeminiLLM(**kwargs)
+
+
+def _llama_cpp(**kwargs):
+    from llm.llama_cpp_llm import LlamaCppLLM
+    return LlamaCppLLM(**kwargs)
+
+
+def _fake(**kwargs):
+    from llm.fake_llm import FakeLLM
+    return FakeLLM(**kwargs)
+
+
+register_backend("ollama", _ollama, "Offline LLM (LLaMA-3 via Ollama)")
+register_backend("ollama-cli", _ollama_cli, "Offline LLM (Ollama CLI)")
+register_backend("gemini", _gemini, "Online LLM (Gemini)")
+register_backend("llama-cpp", _llama_cpp, "Offline LLM (llama.cpp, in-process)")
+register_backend("fake", _fake, "Fake LLM (deterministic, for testing)")
@@ -0,0 +1,76 @@
+import re
+import threading
+
+# Token counting for context budgets. Every backend counts with a local
+# tokenizer when one is available (no network call per count) and falls
+# back to a conservative estimate otherwise.
+
+WORD_OR_SYMBOL = re.compile(r"\w+|[^\w\s]")
+
+_tokenizers = {}
+_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    BPE-style estimate: one token per symbol, one per short word and one
+    more for every further 6 characters of a long word. Slightly
+    overestimates English prose, which is the safe side for a budget.
+    """
+    return sum(
+        1 + (len(piece) - 1) // 6 if piece[0].isalnum() else 1
+        for piece in WORD_OR_SYMBOL.findall(text)
+    )
+
+
+def hf_token_counter(tokenizer_name: str):
+    """
+    Counter backed by a Hugging Face `tokenizers` tokenizer (e.g. the one
+    matching the Ollama model). Loaded once per name; returns None when
+    the package or the tokenizer files are unavailable.
+    """
+    with _lock:
+        if tokenizer_name in _tokenizers:
+            return _tokenizers[tokenizer_name]
+
+        counter = None
+        try:
+            from tokenizers import Tokenizer
+
+            tokenizer = Tokenizer.from_pretrained(tokenizer_name)
+
+            def counter(text: str) -> int:
+                return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+        except Exception as e:
+            print(f"[tokens] {tokenizer_name} unavailable, estimating instead: {e}")
+
+        _tokenizers[tokenizer_name] = counter
+        return counter
+
+
+def gemini_token_counter(model: str):
+    """
+    Offline Gemini token counts via the SDK's local tokenizer (recent
+    google-genai releases); None when unavailable.
+    """
+    key = ("gemini", model)
+
+    with _lock:
+        if key in _tokenizers:
+            return _tokenizers[key]
+
+        counter = None
+        try:
+            from google.genai.local_tokenizer import LocalTokenizer
+
+            tokenizer = LocalTokenizer(model_name=model)
+
+            def counter(text: str) -> int:
+                return tokenizer.count_tokens(text).total_tokens
+
+        except Exception as e:
+            print(f"[tokens] local Gemini tokenizer unavailable, estimating instead: {e}")
+
+        _tokenizers[key] = counter
+        return counter
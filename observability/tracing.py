@@ -0,0 +1,325 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+# ---------------- CONFIG ---------------- #
+
+# TRACING=1 traces every request; TRACE_FILE=<path> also appends each
+# finished trace there as one JSON line (and implies TRACING=1)
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACING = os.getenv("TRACING", "0") == "1" or bool(TRACE_FILE)
+
+RECENT_TRACES = 50      # kept in memory for debug panels
+
+# ---------------------------------------- #
+
+# The active trace and innermost open span follow the request across
+# function calls, threads started with contextvars.copy_context() and
+# asyncio tasks. With no active trace, span() returns a shared no-op
+# object: one ContextVar lookup per instrumented call.
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+_recent = deque(maxlen=RECENT_TRACES)
+_export_lock = threading.Lock()
+_export_path = Path(TRACE_FILE) if TRACE_FILE else None
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start", "end", "attrs", "_token")
+
+    def __init__(self, trace, name, parent_id, attrs):
+        self.trace = trace
+        self.name = name
+        self.span_id = trace.next_span_id()
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return round((end - self.start) * 1000, 3)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+            self.trace.add(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.finish()
+        _current_span.reset(self._token)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start - self.trace.start) * 1000, 3),
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """
+    All spans of one request. Spans may finish on other threads
+    (e.g. a streamed answer), hence the lock.
+    """
+
+    def __init__(self, name, request_id=None, **attrs):
+        self.name = name
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def next_span_id(self):
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def stage_totals(self) -> dict:
+        """
+        {span name: total ms}; a name used several times is summed.
+        """
+        totals = {}
+        with self._lock:
+            for s in self.spans:
+                totals[s.name] = round(totals.get(s.name, 0.0) + s.duration_ms, 3)
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "attrs": self.attrs,
+            "spans": [s.to_dict() for s in spans],
+        }
+
+
+def tracing_enabled() -> bool:
+    return TRACING
+
+
+def enable(flag: bool = True, export_path=None):
+    """
+    Turn tracing of every request on or off at runtime; export_path
+    (optional) is where finished traces are appended as JSON lines.
+    """
+    global TRACING, _export_path
+    TRACING = flag
+    if export_path is not None:
+        _export_path = Path(export_path)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def current_request_id():
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+def recent_traces(n: int = 10):
+    return list(_recent)[-n:]
+
+
+@contextmanager
+def start_trace(name: str = "request", request_id=None, force: bool = False, **attrs):
+    """
+    Open a trace for one request and make it current. Yields the Trace,
+    or None when tracing is off and not forced (e.g. by a debug panel).
+    Nested calls reuse the outer trace.
+    """
+    outer = _current_trace.get()
+    if outer is not None:
+        yield outer
+        return
+    if not (force or TRACING):
+        yield None
+        return
+
+    trace = Trace(name, request_id, **attrs)
+    trace_token = _current_trace.set(trace)
+    root = Span(trace, name, None, dict(attrs))
+    try:
+        with root:
+            yield trace
+    finally:
+        _current_trace.reset(trace_token)
+        _recent.append(trace)
+        if _export_path is not None:
+            export_jsonl(trace, _export_path)
+
+
+def span(name: str, **attrs):
+    """
+    Context manager timing one stage of the current request:
+
+        with span("retriever.embed") as s:
+            ...
+            s.set(cached=True)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    parent = _current_span.get()
+    return Span(trace, name, parent.span_id if parent else None, attrs)
+
+
+def trace_iter(name: str, iterator, **attrs):
+    """
+    Span around the consumption of a stream, with time to first item.
+    The span is not made current while the stream is suspended, so
+    whatever the consumer does in between is not attributed to it.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield from iterator
+        return
+
+    parent = _current_span.get()
+    s = Span(trace, name, parent.span_id if parent else None, attrs)
+    items = 0
+    try:
+        for item in iterator:
+            if items == 0:
+                s.set(first_item_ms=s.duration_ms)
+            items += 1
+            yield item
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            s.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        s.set(items=items)
+        s.finish()
+
+
+async def trace_aiter(name: str, aiterator, **attrs):
+    """
+    trace_iter() for an async stream.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        async for item in aiterator:
+            yield item
+        return
+
+    parent = _current_span.get()
+    s = Span(trace, name, parent.span_id if parent else None, attrs)
+    items = 0
+    try:
+        async for item in aiterator:
+            if items == 0:
+                s.set(first_item_ms=s.duration_ms)
+            items += 1
+            yield item
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            s.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        s.set(items=items)
+        s.finish()
+
+
+def traced(name: str = None, attrs=None):
+    """
+    Decorator: run the function inside a span. Generator functions get a
+    trace_iter span covering the whole iteration. `attrs(*args, **kwargs)`
+    may return extra span attributes.
+    """
+    def decorate(fn):
+        span_name = name or fn.__qualname__
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                if _current_trace.get() is None:
+                    return fn(*args, **kwargs)
+                extra = attrs(*args, **kwargs) if attrs else {}
+                return trace_iter(span_name, fn(*args, **kwargs), **extra)
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return fn(*args, **kwargs)
+            extra = attrs(*args, **kwargs) if attrs else {}
+            with span(span_name, **extra):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def export_jsonl(trace, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+    with _export_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def format_trace(trace) -> str:
+    """
+    Indented text view of a trace (one line per span, in start order).
+    """
+    data = trace.to_dict()
+    depth = {None: -1}
+    lines = [f"request {data['request_id']}"]
+    for s in data["spans"]:
+        depth[s["span_id"]] = depth.get(s["parent_id"], -1) + 1
+        attrs = " ".join(f"{k}={v}" for k, v in s["attrs"].items() if k != "query")
+        indent = "  " * depth[s["span_id"]]
+        lines.append(f"{indent}{s['name']:<{32 - len(indent)}} {s['duration_ms']:>10.2f} ms  {attrs}")
+    return "\n".join(lines)
@@ -1,14 +1,17 @@
-import json
+import hashlib
 import re
+from itertools import groupby
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List, Optional
+from preprocessing.records import RecordWriter, find_records, iter_records, record_path
 from preprocessing.section_utils import extract_section_id, section_parents
 
 # ---------------- Paths ---------------- #
 
 PROCESSED_DIR = Path("data/processed")
-PAGES_FILE = PROCESSED_DIR / "pages.json"
-CHUNKS_FILE = PROCESSED_DIR / "chunks.json"
+# JSON Lines (.jsonl.zst with INTERMEDIATE_FORMAT=zstd); legacy .json still read
+PAGES_FILE = PROCESSED_DIR / "pages.jsonl"
+CHUNKS_FILE = PROCESSED_DIR / "chunks.jsonl"
 
 # ---------------- Chunk size ---------------- #
 
@@ -16,6 +19,8 @@ MIN_CHUNK_CHARS = 250
 TARGET_CHUNK_CHARS = 400
 MAX_CHUNK_CHARS = 700
 
+CHUNK_ID_DIGEST_CHARS = 16   # hex chars of sha1(text) in a chunk id
+
 # ---------------- Section heuristics ---------------- #
 
 SECTION_INLINE_PATTERN = re.compile(
@@ -70,9 +75,34 @@ def split_into_blocks(text: str) -> List[str]:
 
 # ---------------- Chunking logic ---------------- #
 
-def chunk_pages(pages: List[Dict]) -> List[Dict]:
-    chunks = []
-    chunk_id = 0
+def content_chunk_id(text: str, id_prefix: str = "", occurrence: int = 0) -> str:
+    """
+    Stable chunk id derived from the chunk text: re-chunking an edited
+    PDF gives unchanged chunks the same id wherever they moved, so
+    indexing only has to embed what actually changed. `occurrence`
+    tells identical texts within one document apart.
+    """
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:CHUNK_ID_DIGEST_CHARS]
+    suffix = f"_{occurrence}" if occurrence else ""
+    return f"{id_prefix}chunk_{digest}{suffix}"
+
+
+def iter_chunks(pages: Iterable[Dict], document_id: Optional[str] = None,
+                source: Optional[str] = None, version: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Streaming chunker: consumes pages lazily (e.g. from
+    pdf_loader.iter_pdf_pages) and yields each chunk as soon as it is closed.
+
+    With a document_id every chunk is tagged with it and its id is
+    prefixed by it, so chunks of different PDFs never collide in a
+    shared collection. `source` is the original filename and `version`
+    its content hash (pdf_loader.compute_document_version), carried to
+    the corpus manifest. Ids hash the chunk text (content_chunk_id);
+    `position` keeps the document order.
+    """
+    id_prefix = f"{document_id}_" if document_id else ""
+    position = 0
+    seen = {}
 
     current_section = None
     current_level = None
@@ -81,26 +111,37 @@ def chunk_pages(pages: List[Dict]) -> List[Dict]:
     buffer_pages = set()
 
     def flush():
-        nonlocal chunk_id, buffer, buffer_pages
+        nonlocal position, buffer, buffer_pages
         if len(buffer) < MIN_CHUNK_CHARS:
-            return
+            return None
 
         section_id = extract_section_id(current_section)
-
-        chunks.append({
-            "id": f"chunk_{chunk_id:05d}",
+        text = buffer.strip()
+        chunk_id = content_chunk_id(text, id_prefix)
+        occurrence = seen.get(chunk_id, 0)
+        seen[chunk_id] = occurrence + 1
+        if occurrence:
+            chunk_id = content_chunk_id(text, id_prefix, occurrence)
+
+        chunk = {
+            "id": chunk_id,
+            "document_id": document_id or "",
+            "source": source or "document",
+            "document_version": version,
+            "position": position,   # order within the document
             "pages": sorted(buffer_pages),
             "section_title": current_section or "UNKNOWN",
             "section_id": section_id,
             "section_parents": section_parents(section_id) if section_id else [],
             "section_level": current_level if current_section else -1,
             "structure_confidence": 0.9 if current_section else 0.2,
-            "text": buffer.strip()
-        })
+            "text": text
+        }
 
-        chunk_id += 1
+        position += 1
         buffer = ""
         buffer_pages = set()
+        return chunk
 
     for page in pages:
         page_num = page["page"]
@@ -110,7 +151,9 @@ def chunk_pages(pages: List[Dict]) -> List[Dict]:
             detected_section = extract_section_from_text(block)
 
             if detected_section:
-                flush()
+                chunk = flush()
+                if chunk:
+                    yield chunk
                 current_section = detected_section
                 current_level = infer_section_level(detected_section)
                 continue
@@ -119,32 +162,66 @@ def chunk_pages(pages: List[Dict]) -> List[Dict]:
             buffer_pages.add(page_num)
 
             if len(buffer) >= TARGET_CHUNK_CHARS:
-                flush()
+                chunk = flush()
+                if chunk:
+                    yield chunk
+
+    chunk = flush()
+    if chunk:
+        yield chunk
 
-    flush()
-    return chunks
+
+def chunk_pages(pages: Iterable[Dict], document_id: Optional[str] = None,
+                source: Optional[str] = None) -> List[Dict]:
+    return list(iter_chunks(pages, document_id, source))
 
 
 # ---------------- Main ---------------- #
 
-def main():
-    if not PAGES_FILE.exists():
-        print("pages.json not found. Run pdf_loader first.")
-        return
+def iter_documents(records: Iterable[Dict]):
+    """
+    (document_id, filename, version, pages) per document of a pages file.
+
+    pdf_loader.main writes one line per page tagged with its document;
+    legacy pages.json holds one record per document (corpus layout) or a
+    flat list of pages from a single PDF (document_id None).
+    """
+    for (document_id, filename, version), group in groupby(
+        records,
+        key=lambda r: (r.get("document_id"), r.get("filename"), r.get("document_version")),
+    ):
+        first = next(group)
+        if "pages" in first:
+            for doc in _chain(first, group):
+                yield (doc["document_id"], doc.get("filename"),
+                       doc.get("document_version"), doc["pages"])
+        else:
+            yield document_id, filename, version, _chain(first, group)
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
 
-    with open(PAGES_FILE, "r", encoding="utf-8") as f:
-        pages = json.load(f)
 
-    chunks = chunk_pages(pages)
+def main():
+    pages_file = find_records(PAGES_FILE)
+    if pages_file is None:
+        print("pages.jsonl not found. Run pdf_loader first.")
+        return
 
-    with open(CHUNKS_FILE, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, indent=2, ensure_ascii=False)
+    output_path = record_path(CHUNKS_FILE)
+    structured = 0
 
-    structured = sum(1 for c in chunks if c["section_title"] != "UNKNOWN")
+    with RecordWriter(output_path) as writer:
+        for document_id, filename, version, pages in iter_documents(iter_records(pages_file)):
+            for chunk in iter_chunks(pages, document_id, filename, version):
+                writer.write(chunk)
+                structured += chunk["section_title"] != "UNKNOWN"
 
-    print(f"Created {len(chunks)} chunks")
+    print(f"Created {writer.count} chunks")
     print(f"Structured chunks: {structured}")
-    print(f"Saved to {CHUNKS_FILE}")
+    print(f"Saved to {output_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+"""
+Intermediate record files (pages, chunks) as JSON Lines: one compact
+record per line, written and read as a stream, appendable, optionally
+zstd-compressed (`.jsonl.zst`, needs the `zstandard` package).
+
+Legacy `pages.json` / `chunks.json` (one indented JSON array) still load
+through iter_records(); they are parsed whole, as before.
+"""
+import io
+import json
+import os
+from pathlib import Path
+
+# ---------------- CONFIG ---------------- #
+
+# Format for newly written files: "jsonl" or "zstd" (.jsonl.zst)
+INTERMEDIATE_FORMAT = os.getenv("INTERMEDIATE_FORMAT", "jsonl")
+ZSTD_LEVEL = 3
+
+# ---------------------------------------- #
+
+SUFFIXES = (".jsonl.zst", ".jsonl", ".json")
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError(
+            "zstd record files need the zstandard package (pip install zstandard)"
+        ) from e
+    return zstandard
+
+
+def record_stem(path) -> Path:
+    """
+    data/processed/chunks.jsonl.zst -> data/processed/chunks
+    """
+    path = Path(path)
+    for suffix in SUFFIXES:
+        if path.name.endswith(suffix):
+            return path.with_name(path.name[:-len(suffix)])
+    return path
+
+
+def record_path(path, fmt: str = None) -> Path:
+    """
+    Where to write records for `path` in the configured format.
+    """
+    fmt = fmt or INTERMEDIATE_FORMAT
+    stem = record_stem(path)
+    return stem.with_name(stem.name + (".jsonl.zst" if fmt == "zstd" else ".jsonl"))
+
+
+def find_records(path):
+    """
+    Existing file for `path` in any supported format, or None. `path`
+    may name any variant or the bare stem; when several variants exist
+    (e.g. an old chunks.json next to chunks.jsonl) the most recently
+    written one wins.
+    """
+    stem = record_stem(path)
+    candidates = [stem.with_name(stem.name + suffix) for suffix in SUFFIXES]
+    existing = [c for c in candidates if c.is_file()]
+    if not existing:
+        return None
+    return max(existing, key=lambda c: c.stat().st_mtime_ns)
+
+
+def iter_records(path):
+    """
+    Yield the records of a JSONL, JSONL.zst or legacy JSON-array file.
+    """
+    path = Path(path)
+
+    if path.name.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+
+    if path.name.endswith(".zst"):
+        with open(path, "rb") as raw:
+            reader = _zstd().ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            with io.TextIOWrapper(reader, encoding="utf-8") as f:
+                yield from _parse_lines(f)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _parse_lines(f)
+
+
+def _parse_lines(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+class RecordWriter:
+    """
+    Streams records into a JSONL (or .jsonl.zst) file, one line each.
+
+    Written to a temporary file and renamed on close(), so readers never
+    see a half-written file; append=True adds to an existing file in
+    place instead (a zstd file gets a new frame, which readers handle).
+    """
+
+    def __init__(self, path, append: bool = False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.count = 0
+
+        self._target = self.path if append else self.path.with_name(self.path.name + ".tmp")
+        self._raw = open(self._target, "ab" if append else "wb")
+        if self.path.name.endswith(".zst"):
+            compressor = _zstd().ZstdCompressor(level=ZSTD_LEVEL)
+            self._stream = compressor.stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._stream.write(line.encode("utf-8"))
+        self.count += 1
+
+    def close(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        if self._target != self.path:
+            self._target.replace(self.path)
+
+    def abort(self):
+        # Drop a partial rewrite; the previous file (if any) stays intact
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        if self._target != self.path:
+            self._target.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,156 @@
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from preprocessing.section_utils import section_parents
+
+SECTIONS_FILENAME = "sections.json"
+
+
+def section_sort_key(section_id: str):
+    # Numeric order: 3.2 < 3.10 (plain string order would put 3.10 first)
+    return [int(p) for p in section_id.split(".") if p.isdigit()]
+
+
+class SectionTreeBuilder:
+    """
+    Builds the section tree of one document while chunks stream by.
+
+    Tree layout (flat dict keyed by section id):
+
+        {"3.2": {"title": "3.2 Training", "parent": "3", "children": ["3.2.1"],
+                 "chunks": ["<chunk ids in document order>"], "pages": [4, 6]}}
+    """
+
+    def __init__(self):
+        self.tree: Dict[str, Dict] = {}
+
+    def _node(self, section_id: str) -> Dict:
+        node = self.tree.get(section_id)
+        if node is None:
+            parents = section_parents(section_id)
+            parent = parents[-1] if parents else None
+
+            node = {"title": None, "parent": parent, "children": [], "chunks": [], "pages": []}
+            self.tree[section_id] = node
+
+            if parent is not None:
+                siblings = self._node(parent)["children"]
+                siblings.append(section_id)
+                siblings.sort(key=section_sort_key)
+        return node
+
+    def add(self, chunk: Dict):
+        section_id = chunk.get("section_id")
+        if not section_id:
+            return
+
+        node = self._node(section_id)
+        node["title"] = node["title"] or chunk.get("section_title")
+        node["chunks"].append(chunk["id"])
+
+        pages = [int(p) for p in chunk.get("pages", [])]
+        if pages:
+            lo, hi = min(pages), max(pages)
+            node["pages"] = [min(node["pages"][0], lo), max(node["pages"][1], hi)] if node["pages"] else [lo, hi]
+
+
+def build_section_tree(chunks) -> Dict[str, Dict]:
+    builder = SectionTreeBuilder()
+    for chunk in chunks:
+        builder.add(chunk)
+    return builder.tree
+
+
+def section_chunk_ids(tree: Dict[str, Dict], section_id: str) -> List[str]:
+    """
+    Chunk ids of a section and all its subsections, root first, then
+    subsections in numeric order. "1" never matches "10".
+    """
+    if section_id not in tree:
+        return []
+
+    ids = []
+    stack = [section_id]
+    while stack:
+        node = tree[stack.pop()]
+        ids.extend(node["chunks"])
+        stack.extend(reversed(node["children"]))
+    return ids
+
+
+def section_pages(tree: Dict[str, Dict], section_id: str) -> Optional[List[int]]:
+    if section_id not in tree:
+        return None
+
+    spans = []
+    stack = [section_id]
+    while stack:
+        node = tree[stack.pop()]
+        if node["pages"]:
+            spans.append(node["pages"])
+        stack.extend(node["children"])
+
+    if not spans:
+        return None
+    return [min(s[0] for s in spans), max(s[1] for s in spans)]
+
+
+# ---------------- Persistence ---------------- #
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def sections_path(vector_dir) -> Path:
+    return Path(vector_dir) / SECTIONS_FILENAME
+
+
+def load_sections(vector_dir) -> Dict[str, Dict]:
+    """
+    {document_id: section tree}, cached per process and reloaded when
+    the file changes.
+    """
+    path = sections_path(vector_dir)
+    key = str(path.resolve())
+
+    with _lock:
+        mtime = path.stat().st_mtime_ns if path.exists() else None
+        cached = _loaded.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        sections = {}
+        if mtime is not None:
+            with open(path, "r", encoding="utf-8") as f:
+                sections = json.load(f)
+
+        _loaded[key] = (mtime, sections)
+        return sections
+
+
+def _write_sections(vector_dir, sections: Dict):
+    path = sections_path(vector_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sections, f, ensure_ascii=False)
+    tmp.replace(path)
+
+
+def save_document_sections(vector_dir, document_id: str, tree: Dict[str, Dict]):
+    sections = dict(load_sections(vector_dir))
+    sections[document_id] = tree
+    _write_sections(vector_dir, sections)
+
+
+def remove_document_sections(vector_dir, document_id: str):
+    sections = dict(load_sections(vector_dir))
+    if sections.pop(document_id, None) is not None:
+        _write_sections(vector_dir, sections)
+
+
+def clear_sections(vector_dir):
+    _write_sections(vector_dir, {})
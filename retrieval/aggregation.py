@@ -1,29 +1,46 @@
-def aggregate_section(results, section_id, max_chunks=8):
-    collected = []
-    pages = set()
+from observability.tracing import span
+from retrieval.context_packer import DEFAULT_TOKEN_BUDGET, pack_context
 
-    for r in results:
-        if r.get("section_id") and r["section_id"].startswith(section_id):
-            collected.append(r["text"])
-            pages.update(r["pages"])
+
+def in_section(chunk_section_id, section_id) -> bool:
+    # "1" must match "1" and "1.2" but not "10"
+    return bool(chunk_section_id) and (
+        chunk_section_id == section_id
+        or chunk_section_id.startswith(section_id + ".")
+    )
+
+
+def _document_ids(chunks):
+    return sorted({c.get("document_id", "") for c in chunks})
+
+
+def aggregate_section(results, section_id, max_chunks=8,
+                      token_budget=DEFAULT_TOKEN_BUDGET, count_tokens=None):
+    with span("aggregate_section", section_id=section_id) as s:
+        matching = [r for r in results if in_section(r.get("section_id"), section_id)]
+        packed = pack_context(matching, token_budget, count_tokens, max_chunks)
+        s.set(chunks=packed["chunks_used"], tokens=packed["tokens"], budget=token_budget)
 
     return {
         "section": section_id,
-        "pages": sorted(pages),
-        "chunks_used": len(collected),
-        "text": "\n\n".join(collected[:max_chunks]),
+        "pages": packed["pages"],
+        "chunks_used": packed["chunks_used"],
+        "tokens": packed["tokens"],
+        "document_ids": _document_ids(packed["chunks"]),
+        "text": packed["text"],
     }
 
 
-def aggregate_global(results, max_chunks=12):
-    texts = []
-    pages = set()
-
-    for r in results[:max_chunks]:
-        texts.append(r["text"])
-        pages.update(r["pages"])
+def aggregate_global(results, max_chunks=12,
+                     token_budget=DEFAULT_TOKEN_BUDGET, count_tokens=None):
+    with span("aggregate_global") as s:
+        packed = pack_context(results, token_budget, count_tokens, max_chunks)
+        s.set(chunks=packed["chunks_used"], tokens=packed["tokens"], budget=token_budget)
 
     return {
-        "pages": sorted(pages),
-        "text": "\n\n".join(texts),
+        "pages": packed["pages"],
+        "chunks_used": packed["chunks_used"],
+        "tokens": packed["tokens"],
+        "document_ids": _document_ids(packed["chunks"]),
+        "text": packed["text"],
     }
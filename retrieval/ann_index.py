@@ -0,0 +1,465 @@
+"""
+Compressed approximate nearest-neighbour index (IVF + product quantization)
+for corpora too large to search exactly in RAM.
+
+- IVF: k-means splits the vectors into `nlist` cells; a query only scans
+  the `nprobe` cells whose centroids are closest.
+- PQ: each vector's residual to its cell centroid is cut into `m`
+  sub-vectors, each replaced by the id of its nearest of 256 sub-centroids,
+  so a 384-dim float32 vector (1536 bytes) becomes m bytes (48 by default).
+
+For normalized vectors and inner product, q . x ~= q . centroid + sum_j
+q_j . codebook_j[code_j]; the second term is a table lookup per
+(sub-space, code) computed once per query, so scanning a cell is a
+gather + sum over uint8 codes.
+
+PQ scores are approximate: the Retriever takes `candidate_k * RESCORE`
+ANN candidates and re-scores them exactly with their stored embeddings
+(fetched from the vector store together with text and metadata), so
+final distances are exact and only recall depends on nprobe / m.
+
+Built by indexing.index_chunks.main once the collection reaches
+ANN_MIN_ROWS vectors (ANN_INDEX=on forces it, off disables it); kept up
+to date by the ingest pipeline afterwards with the trained codebooks.
+Each save writes a new `gen-*` directory and then atomically repoints
+`ann/CURRENT` at it, so readers never load half of an update.
+Measure recall / latency with scripts/benchmark_ann.py.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# ---------------- CONFIG ---------------- #
+
+ANN_DIRNAME = "ann"
+CURRENT_FILE = "CURRENT"   # names the live generation directory
+ANN_VERSION = 1
+
+ANN_INDEX = os.getenv("ANN_INDEX", "auto")             # auto | on | off
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "200000"))
+
+PQ_M = 48               # sub-quantizers (bytes per vector); must divide the dimension
+PQ_KSUB = 256           # centroids per sub-quantizer (uint8 codes)
+NPROBE = 16             # cells scanned per query
+RESCORE = 4             # exact re-scoring of candidate_k * RESCORE ANN hits
+
+TRAIN_SAMPLE = 100_000      # vectors for the coarse k-means
+PQ_TRAIN_SAMPLE = 32_768    # residuals per sub-quantizer k-means (128 per centroid)
+KMEANS_ITERS = 20
+BLOCK_ROWS = 65_536     # rows per assignment / encoding block
+SEED = 0
+
+# ---------------------------------------- #
+
+
+def default_nlist(n: int) -> int:
+    # ~4 sqrt(n) cells, at least 39 training points per centroid
+    return int(max(1, min(4 * np.sqrt(n), n // 39, 65_536)))
+
+
+def _sub_quantizers(dim: int, m: int) -> int:
+    # Largest divisor of dim not above m
+    return max(d for d in range(1, min(m, dim) + 1) if dim % d == 0)
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Nearest centroid (L2) per row, in blocks to bound memory.
+    """
+    half_norms = 0.5 * (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), BLOCK_ROWS):
+        block = x[start:start + BLOCK_ROWS]
+        out[start:start + BLOCK_ROWS] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return out
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = KMEANS_ITERS, seed: int = SEED) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), size=k, replace=False)].astype(np.float32)
+
+    for _ in range(iters):
+        labels = _assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+
+        # Per-cluster sums over rows sorted by label (np.add.at is far slower)
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[~empty]
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        # Re-seed empty cells on random points instead of losing them
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+
+    return centroids
+
+
+class IVFPQIndex:
+    def __init__(self, coarse: np.ndarray, codebooks: np.ndarray):
+        self.coarse = coarse            # (nlist, dim)
+        self.codebooks = codebooks      # (m, ksub, dsub)
+        self.dim = coarse.shape[1]
+        self.m, self.ksub, self.dsub = codebooks.shape
+
+        self.ids = []
+        self.lists = np.zeros(0, dtype=np.int32)
+        self.codes = np.zeros((0, self.m), dtype=np.uint8)
+        self.document_ids = []
+        self.position = {}
+        self._dirty = True
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.coarse)
+
+    # ---------------- training / encoding ---------------- #
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int = None, m: int = PQ_M,
+              sample: int = TRAIN_SAMPLE, seed: int = SEED):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        if len(vectors) > sample:
+            vectors = vectors[rng.choice(len(vectors), size=sample, replace=False)]
+
+        coarse = kmeans(vectors, nlist or default_nlist(len(vectors)), seed=seed)
+        residuals = vectors - coarse[_assign(vectors, coarse)]
+
+        if len(residuals) > PQ_TRAIN_SAMPLE:
+            residuals = residuals[rng.choice(len(residuals), size=PQ_TRAIN_SAMPLE, replace=False)]
+
+        m = _sub_quantizers(vectors.shape[1], m)
+        dsub = vectors.shape[1] // m
+        ksub = min(PQ_KSUB, len(residuals))
+        codebooks = np.stack([
+            kmeans(residuals[:, j * dsub:(j + 1) * dsub], ksub, seed=seed + j)
+            for j in range(m)
+        ])
+        return cls(coarse, codebooks)
+
+    def encode(self, vectors: np.ndarray):
+        """
+        (cell per vector, (n, m) uint8 PQ codes of the residuals).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        lists = _assign(vectors, self.coarse)
+        residuals = vectors - self.coarse[lists]
+
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = residuals[:, j * self.dsub:(j + 1) * self.dsub]
+            codes[:, j] = _assign(sub, self.codebooks[j])
+        return lists, codes
+
+    # ---------------- updates ---------------- #
+
+    def add(self, ids, vectors, document_ids):
+        """
+        Encode with the trained codebooks; ids already present are replaced.
+        """
+        if not len(ids):
+            return
+        self.remove_ids(ids)
+        lists, codes = self.encode(vectors)
+        self._extend(ids, document_ids, lists, codes)
+
+    def _extend(self, ids, document_ids, lists, codes):
+        for i, chunk_id in enumerate(ids, start=len(self.ids)):
+            self.position[chunk_id] = i
+        self.ids.extend(ids)
+        self.document_ids.extend(document_ids)
+        self.lists = np.concatenate([self.lists, lists])
+        self.codes = np.concatenate([self.codes, codes])
+        self._dirty = True
+
+    def remove_document(self, document_id: str):
+        self._remove([i for i, d in enumerate(self.document_ids) if d == document_id])
+
+    def remove_ids(self, ids):
+        self._remove([self.position[i] for i in ids if i in self.position])
+
+    def _remove(self, rows):
+        if not rows:
+            return
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[rows] = False
+        self.ids = [chunk_id for chunk_id, k in zip(self.ids, keep) if k]
+        self.document_ids = [d for d, k in zip(self.document_ids, keep) if k]
+        self.lists = self.lists[keep]
+        self.codes = self.codes[keep]
+        self.position = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        self._dirty = True
+
+    def _build(self):
+        # Rows grouped by cell (CSR): a probe reads one contiguous slice
+        self._order = np.argsort(self.lists, kind="stable")
+        counts = np.bincount(self.lists, minlength=self.nlist)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._sorted_codes = self.codes[self._order]
+
+        code_of = {}
+        self._doc_codes = np.fromiter(
+            (code_of.setdefault(d, len(code_of)) for d in self.document_ids),
+            dtype=np.int32, count=len(self.document_ids),
+        )[self._order]
+        self._code_of = code_of
+        self._dirty = False
+
+    # ---------------- queries ---------------- #
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = NPROBE, document_ids=None):
+        """
+        Approximate top-k by inner product: [(chunk_id, score), ...] best first.
+        """
+        if self._dirty:
+            self._build()
+        if not self.ids:
+            return []
+
+        query = np.asarray(query, dtype=np.float32)
+        coarse_scores = self.coarse @ query
+        nprobe = min(nprobe, self.nlist)
+        probes = np.argpartition(-coarse_scores, nprobe - 1)[:nprobe]
+
+        starts, stops = self._offsets[probes], self._offsets[probes + 1]
+        sizes = stops - starts
+        if not sizes.sum():
+            return []
+        rows = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])
+
+        if document_ids:
+            wanted = [self._code_of[d] for d in document_ids if d in self._code_of]
+            keep = np.isin(self._doc_codes[rows], wanted)
+            rows = rows[keep]
+            cell_scores = np.repeat(coarse_scores[probes], sizes)[keep]
+        else:
+            cell_scores = np.repeat(coarse_scores[probes], sizes)
+        if not len(rows):
+            return []
+
+        # Lookup table: q_j . codebook_j[c] for every sub-space j and code c
+        table = np.einsum("jcd,jd->jc", self.codebooks, query.reshape(self.m, self.dsub))
+        scores = cell_scores + table[np.arange(self.m), self._sorted_codes[rows]].sum(axis=1)
+
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[self._order[rows[i]]], float(scores[i])) for i in top]
+
+    def stats(self) -> dict:
+        return {
+            "vectors": len(self.ids),
+            "nlist": self.nlist,
+            "m": self.m,
+            "bytes_per_vector": self.m,
+            "code_mb": round(self.codes.nbytes / 2**20, 2),
+        }
+
+    # ---------------- persistence ---------------- #
+
+    def save(self, directory):
+        """
+        Write a new generation under `directory` and switch the CURRENT
+        pointer to it with one os.replace(), so readers load either the
+        old or the new index, never a mix. The previous generation is
+        kept for readers that resolved CURRENT just before the switch.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        name = f"gen-{time.time_ns()}-{os.getpid()}"
+        tmp = directory / (name + ".tmp")
+        tmp.mkdir()
+
+        np.save(tmp / "coarse.npy", self.coarse)
+        np.save(tmp / "codebooks.npy", self.codebooks)
+        np.save(tmp / "lists.npy", self.lists)
+        np.save(tmp / "codes.npy", self.codes)
+        with open(tmp / "ids.json", "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "document_ids": self.document_ids}, f)
+        with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": ANN_VERSION,
+                "dim": self.dim,
+                "nlist": self.nlist,
+                "m": self.m,
+                "ksub": self.ksub,
+                "vectors": len(self.ids),
+                "saved_at": time.time(),
+            }, f)
+        os.replace(tmp, directory / name)
+
+        previous = current_generation(directory)
+        pointer = directory / "CURRENT.tmp"
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(pointer, directory / CURRENT_FILE)
+
+        keep = {name, previous.name if previous else None}
+        for path in directory.iterdir():
+            if path.is_dir() and path.name.startswith("gen-") and path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        directory = current_generation(directory)
+        if directory is None:
+            raise FileNotFoundError("No ANN index generation to load")
+
+        with open(directory / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != ANN_VERSION:
+            raise ValueError(f"Unsupported ANN index version in {directory}")
+
+        index = cls(np.load(directory / "coarse.npy"), np.load(directory / "codebooks.npy"))
+        index.lists = np.load(directory / "lists.npy")
+        index.codes = np.load(directory / "codes.npy")
+        with open(directory / "ids.json", "r", encoding="utf-8") as f:
+            names = json.load(f)
+        index.ids = names["ids"]
+        index.document_ids = names["document_ids"]
+        index.position = {chunk_id: i for i, chunk_id in enumerate(index.ids)}
+        return index
+
+
+def current_generation(directory):
+    """
+    Directory of the live generation under an ANN dir, or None.
+    """
+    directory = Path(directory)
+    try:
+        with open(directory / CURRENT_FILE, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return directory / name if name else None
+
+
+def rescore(query: np.ndarray, ids, vectors, k: int):
+    """
+    Exact cosine distances for ANN candidates: [(chunk_id, distance), ...]
+    best first, at most k.
+    """
+    if not len(ids):
+        return []
+    scores = np.asarray(vectors, dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [(ids[i], 1.0 - float(scores[i])) for i in top]
+
+
+# ---------------- Shared instances ---------------- #
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def ann_path(vector_dir) -> Path:
+    return Path(vector_dir) / ANN_DIRNAME
+
+
+def load_ann_index(vector_dir):
+    """
+    Process-wide ANN index for a vector dir, reloaded when a new
+    generation is saved; None if the dir has no ANN index (exact search).
+    """
+    directory = ann_path(vector_dir)
+    key = str(directory.resolve())
+
+    with _lock:
+        for _ in range(2):
+            generation = current_generation(directory)
+            cached = _loaded.get(key)
+            if cached and cached[0] == generation:
+                return cached[1]
+            try:
+                index = IVFPQIndex.load(directory) if generation is not None else None
+            except FileNotFoundError:
+                # Generation pruned or dropped between reading CURRENT and
+                # loading it: look again
+                continue
+            _loaded[key] = (generation, index)
+            return index
+        return None
+
+
+def load_ann_for_update(vector_dir):
+    """
+    Private copy for an indexing run, or None if the dir has no ANN index.
+    """
+    directory = ann_path(vector_dir)
+    return IVFPQIndex.load(directory) if current_generation(directory) else None
+
+
+def drop_ann_index(vector_dir):
+    # Full rebuilds retrain from scratch; readers fall back to exact search
+    directory = ann_path(vector_dir)
+    (directory / CURRENT_FILE).unlink(missing_ok=True)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def wants_ann(rows: int) -> bool:
+    if ANN_INDEX == "on":
+        return rows > 0
+    if ANN_INDEX == "off":
+        return False
+    return rows >= ANN_MIN_ROWS
+
+
+def build_ann_index(collection, vector_dir, page_size: int = 10_000):
+    """
+    Train and encode an IVF-PQ index over every vector in `collection`
+    and save it next to the vector DB. Two passes over the collection
+    (training sample, then encoding page by page), so the full float
+    matrix is never in memory. Returns the index stats.
+    """
+    total = collection.count()
+    rng = np.random.default_rng(SEED)
+    fraction = min(1.0, TRAIN_SAMPLE / max(total, 1))
+
+    def pages():
+        for offset in range(0, total, page_size):
+            page = collection.get(limit=page_size, offset=offset, include=["metadatas", "embeddings"])
+            document_ids = [m.get("document_id", "") for m in page["metadatas"]]
+            yield page["ids"], document_ids, np.asarray(page["embeddings"], dtype=np.float32)
+
+    sample = np.concatenate([v[rng.random(len(v)) < fraction] for _, _, v in pages()])
+    index = IVFPQIndex.train(sample, nlist=max(1, min(default_nlist(total), len(sample) // 39)))
+
+    ids, document_ids, lists, codes = [], [], [], []
+    for page_ids, page_documents, vectors in pages():
+        page_lists, page_codes = index.encode(vectors)
+        ids.extend(page_ids)
+        document_ids.extend(page_documents)
+        lists.append(page_lists)
+        codes.append(page_codes)
+
+    index._extend(ids, document_ids, np.concatenate(lists), np.concatenate(codes))
+    index.save(ann_path(vector_dir))
+    return index.stats()
+
+
+def commit_ann_index(index, collection, vector_dir):
+    """
+    End of an indexing run: save the incrementally updated `index`, or,
+    when the dir has none yet, build one if the collection is now large
+    enough. Returns the index stats, or None while search stays exact.
+
+    Incremental updates reuse the trained codebooks; if the corpus drifts
+    far from the training sample, drop_ann_index() + a rebuild retrains.
+    """
+    if index is not None:
+        index.save(ann_path(vector_dir))
+        return index.stats()
+    if wants_ann(collection.count()):
+        return build_ann_index(collection, vector_dir)
+    return None
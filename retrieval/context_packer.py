@@ -0,0 +1,137 @@
+import re
+from typing import Callable, Dict, List, Optional
+
+from llm.tokens import estimate_tokens
+
+# ---------------- CONFIG ---------------- #
+
+DEFAULT_TOKEN_BUDGET = 1500
+SEPARATOR = "\n\n"
+
+SHINGLE_SIZE = 5            # words per shingle for near-duplicate detection
+DUPLICATE_OVERLAP = 0.8     # shared share of the smaller chunk's shingles
+MIN_USEFUL_TOKENS = 32      # stop scanning once less than this is left
+
+# ---------------------------------------- #
+
+WORD = re.compile(r"\w+")
+
+
+def _shingles(text: str) -> frozenset:
+    words = WORD.findall(text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return frozenset([tuple(words)])
+    return frozenset(tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+
+
+def _is_duplicate(shingles: frozenset, selected: List[frozenset]) -> bool:
+    # Overlap relative to the smaller chunk: a chunk fully contained in a
+    # longer one (re-chunked or re-uploaded text) counts as a duplicate
+    for other in selected:
+        smaller = min(len(shingles), len(other))
+        if smaller and len(shingles & other) / smaller >= DUPLICATE_OVERLAP:
+            return True
+    return False
+
+
+def _page_key(page) -> int:
+    page = str(page)
+    return int(page) if page.isdigit() else 0
+
+
+def _truncate(text: str, budget: int, count_tokens: Callable[[str], int]) -> str:
+    # Only used when even the best chunk alone exceeds the budget
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+def pack_context(results: List[Dict], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 count_tokens: Optional[Callable[[str], int]] = None,
+                 max_chunks: Optional[int] = None) -> Dict:
+    """
+    Fill a token budget with retrieved chunks.
+
+    1. walk results in relevance order (as ranked by the retriever)
+    2. skip near-duplicates of an already selected chunk
+    3. take every chunk that still fits; a chunk that does not fit is
+       skipped, so a shorter, less relevant one can use the remainder
+    4. emit the selection in document order (documents by their best
+       rank, chunks by position), so the prompt reads like the source
+
+    count_tokens should be the answering backend's counter
+    (llm.count_tokens); the default is a conservative estimate.
+    """
+    count_tokens = count_tokens or estimate_tokens
+    separator_tokens = count_tokens(SEPARATOR)
+
+    selected = []
+    selected_shingles = []
+    used = 0
+    duplicates = 0
+    over_budget = 0
+
+    for rank, r in enumerate(results):
+        if max_chunks is not None and len(selected) >= max_chunks:
+            break
+        if token_budget - used < MIN_USEFUL_TOKENS:
+            break
+
+        text = r["text"].strip()
+        if not text:
+            continue
+
+        shingles = _shingles(text)
+        if _is_duplicate(shingles, selected_shingles):
+            duplicates += 1
+            continue
+
+        cost = count_tokens(text) + (separator_tokens if selected else 0)
+        if used + cost > token_budget:
+            over_budget += 1
+            continue
+
+        selected.append((rank, r, text))
+        selected_shingles.append(shingles)
+        used += cost
+
+    if not selected:
+        first = next(((rank, r) for rank, r in enumerate(results) if r["text"].strip()), None)
+        if first is not None:
+            text = _truncate(first[1]["text"].strip(), token_budget, count_tokens)
+            if text:
+                selected.append((first[0], first[1], text))
+                used = count_tokens(text)
+
+    best_rank = {}
+    for rank, r, _ in selected:
+        best_rank.setdefault(r.get("document_id", ""), rank)
+
+    def document_order(item):
+        rank, r, _ = item
+        position = r.get("position")
+        if position is None or position < 0:
+            # Indexed before positions were stored: first page, then rank
+            position = _page_key(r["pages"][0]) if r.get("pages") else rank
+        return best_rank[r.get("document_id", "")], position, rank
+
+    selected.sort(key=document_order)
+
+    pages = {p for _, r, _ in selected for p in r.get("pages", []) if p != ""}
+
+    return {
+        "text": SEPARATOR.join(text for _, _, text in selected),
+        "chunks": [r for _, r, _ in selected],
+        "pages": sorted(pages, key=_page_key),
+        "chunks_used": len(selected),
+        "tokens": used,
+        "token_budget": token_budget,
+        "dropped_duplicates": duplicates,
+        "dropped_over_budget": over_budget,
+    }
@@ -0,0 +1,287 @@
+import math
+import pickle
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# ---------------- CONFIG ---------------- #
+
+INDEX_FILENAME = "bm25.pkl"
+INDEX_VERSION = 1
+
+K1 = 1.5
+B = 0.75
+
+# ---------------------------------------- #
+
+# Section numbers / decimals ("3.2.1", "0.95") stay one token, as do
+# hyphenated terms ("gpt-4") so exact references and numeric facts match.
+TOKEN_RE = re.compile(r"\d+(?:\.\d+)+|[a-z0-9]+(?:[-_][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the
+this to was were will with what which who how does do
+""".split())
+
+
+def tokenize(text: str):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process inverted index over chunk text.
+
+    Postings are kept in CSR form (one offsets array into flat doc / weight
+    arrays) and store the full BM25 weight of each (term, chunk) pair, so a
+    query is a scatter-add over the postings of its terms followed by a
+    partial sort of the touched chunks; no per-chunk Python loop.
+    """
+
+    def __init__(self, k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+
+        self.vocab = {}
+        self.ids = []
+        self.document_ids = []
+        self.doc_terms = []
+        self.doc_freqs = []
+        self.position = {}
+
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_weights = np.zeros(0, dtype=np.float32)
+        self._doc_codes = None
+        self._code_of = {}
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------------- updates ---------------- #
+
+    def add(self, ids, texts, metadatas=None):
+        """
+        Add (or replace) chunks. Call save() once the batch of updates is done.
+        """
+        metadatas = metadatas or [{}] * len(ids)
+
+        replaced = [i for i in ids if i in self.position]
+        if replaced:
+            self._remove(set(replaced))
+
+        for chunk_id, text, meta in zip(ids, texts, metadatas):
+            tf = Counter(tokenize(text))
+            term_ids = [self.vocab.setdefault(t, len(self.vocab)) for t in tf]
+
+            self.position[chunk_id] = len(self.ids)
+            self.ids.append(chunk_id)
+            self.document_ids.append(meta.get("document_id", ""))
+            self.doc_terms.append(np.asarray(term_ids, dtype=np.int32))
+            self.doc_freqs.append(np.asarray(list(tf.values()), dtype=np.int32))
+
+        self._dirty = True
+
+    def remove_document(self, document_id: str):
+        self._remove({
+            chunk_id for chunk_id, doc in zip(self.ids, self.document_ids)
+            if doc == document_id
+        })
+
+    def remove_ids(self, ids):
+        self._remove(set(ids) & set(self.position))
+
+    def _remove(self, drop):
+        if not drop:
+            return
+
+        keep = [i for i, chunk_id in enumerate(self.ids) if chunk_id not in drop]
+        self.ids = [self.ids[i] for i in keep]
+        self.document_ids = [self.document_ids[i] for i in keep]
+        self.doc_terms = [self.doc_terms[i] for i in keep]
+        self.doc_freqs = [self.doc_freqs[i] for i in keep]
+        self.position = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        self._dirty = True
+
+    def _build(self):
+        n = len(self.ids)
+        vocab_size = len(self.vocab)
+
+        if n == 0:
+            self.offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+            self.post_docs = np.zeros(0, dtype=np.int32)
+            self.post_weights = np.zeros(0, dtype=np.float32)
+        else:
+            counts = np.fromiter((len(t) for t in self.doc_terms), dtype=np.int64, count=n)
+            lengths = np.fromiter((f.sum() for f in self.doc_freqs), dtype=np.float32, count=n)
+            avgdl = max(float(lengths.mean()), 1e-9)
+
+            term_ids = np.concatenate(self.doc_terms)
+            freqs = np.concatenate(self.doc_freqs).astype(np.float32)
+            docs = np.repeat(np.arange(n, dtype=np.int32), counts)
+
+            order = np.argsort(term_ids, kind="stable")
+            term_ids, freqs, docs = term_ids[order], freqs[order], docs[order]
+
+            df = np.bincount(term_ids, minlength=vocab_size)
+            idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[docs] / avgdl)
+
+            self.offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+            self.post_docs = docs
+            self.post_weights = (
+                idf[term_ids] * freqs * (self.k1 + 1.0) / (freqs + norm)
+            ).astype(np.float32)
+
+        self._doc_codes = None
+        self._dirty = False
+
+    def _document_mask(self, candidates, document_ids):
+        if self._doc_codes is None:
+            self._code_of = {}
+            self._doc_codes = np.fromiter(
+                (self._code_of.setdefault(d, len(self._code_of)) for d in self.document_ids),
+                dtype=np.int32, count=len(self.document_ids)
+            )
+
+        wanted = [self._code_of[d] for d in document_ids if d in self._code_of]
+        return np.isin(self._doc_codes[candidates], wanted)
+
+    # ---------------- queries ---------------- #
+
+    def search(self, query: str, k: int = 20, document_ids=None):
+        """
+        Returns [(chunk_id, bm25_score), ...] best first.
+        """
+        if self._dirty:
+            self._build()
+
+        term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        spans = [
+            (self.offsets[t], self.offsets[t + 1]) for t in term_ids
+            if self.offsets[t + 1] > self.offsets[t]
+        ]
+        if not spans:
+            return []
+
+        # Fresh buffer per query keeps concurrent searches independent
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        touched = []
+        for start, stop in spans:
+            docs = self.post_docs[start:stop]
+            scores[docs] += self.post_weights[start:stop]  # docs are unique per term
+            touched.append(docs)
+
+        candidates = np.unique(np.concatenate(touched)) if len(touched) > 1 else touched[0]
+        candidate_scores = scores[candidates]
+
+        if document_ids:
+            mask = self._document_mask(candidates, document_ids)
+            candidates = candidates[mask]
+            candidate_scores = candidate_scores[mask]
+
+        if len(candidates) > k:
+            top = np.argpartition(-candidate_scores, k)[:k]
+            candidates = candidates[top]
+            candidate_scores = candidate_scores[top]
+
+        order = np.argsort(-candidate_scores)
+        return [
+            (self.ids[candidates[i]], float(candidate_scores[i]))
+            for i in order
+        ]
+
+    # ---------------- persistence ---------------- #
+
+    def save(self, path):
+        if self._dirty:
+            self._build()
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump({
+                "version": INDEX_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "vocab": self.vocab,
+                "ids": self.ids,
+                "document_ids": self.document_ids,
+                "doc_terms": self.doc_terms,
+                "doc_freqs": self.doc_freqs,
+                "offsets": self.offsets,
+                "post_docs": self.post_docs,
+                "post_weights": self.post_weights,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+
+        if state.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported BM25 index version in {path}")
+
+        index = cls(state["k1"], state["b"])
+        for key in ("vocab", "ids", "document_ids", "doc_terms", "doc_freqs",
+                    "offsets", "post_docs", "post_weights"):
+            setattr(index, key, state[key])
+        index.position = {chunk_id: i for i, chunk_id in enumerate(index.ids)}
+        return index
+
+
+# ---------------- Shared instances ---------------- #
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def index_path(vector_dir) -> Path:
+    return Path(vector_dir) / INDEX_FILENAME
+
+
+def load_lexical_index(vector_dir):
+    """
+    Process-wide BM25 index for a vector dir, reloaded when the file on
+    disk changes. Returns an empty index if none was built yet.
+    """
+    path = index_path(vector_dir)
+    key = str(path.resolve())
+
+    with _lock:
+        mtime = path.stat().st_mtime_ns if path.exists() else None
+        cached = _loaded.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        index = BM25Index.load(path) if mtime is not None else BM25Index()
+        _loaded[key] = (mtime, index)
+        return index
+
+
+def load_for_update(vector_dir) -> BM25Index:
+    """
+    Private copy for an indexing run; readers keep the shared instance
+    until save() replaces the file.
+    """
+    path = index_path(vector_dir)
+    return BM25Index.load(path) if path.exists() else BM25Index()
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """
+    Fuse several ranked id lists: score(id) = sum 1 / (k + rank).
+    Returns {id: fused_score}.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return fused
@@ -1,6 +1,8 @@
 import re
 from enum import Enum, auto
 
+from observability.tracing import traced
+
 
 class QueryIntent(Enum):
     DEFINITION = auto()
@@ -62,10 +64,25 @@ FACT_PATTERNS = [
 ]
 
 
+SECTION_NUMBER_PATTERN = re.compile(r"\bsection\s+(\d+(?:\.\d+)*)|\b(\d+(?:\.\d+)+)\b", re.I)
+
+
+def section_id_from_query(query: str) -> str:
+    """
+    "explain section 3.2" -> "3.2". Falls back to every digit and dot in
+    the query, which is what callers used to do inline.
+    """
+    m = SECTION_NUMBER_PATTERN.search(query)
+    if m:
+        return m.group(1) or m.group(2)
+    return "".join(c for c in query if c.isdigit() or c == ".").strip(".")
+
+
 def _matches_any(patterns, text: str) -> bool:
     return any(re.search(p, text) for p in patterns)
 
 
+@traced("detect_intent")
 def detect_intent(query: str) -> QueryIntent:
     q = query.lower().strip()
 
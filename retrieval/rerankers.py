@@ -0,0 +1,169 @@
+import re
+
+import numpy as np
+
+from embeddings.registry import DEFAULT_CROSS_ENCODER, get_cross_encoder
+from retrieval.query_intent import QueryIntent
+
+# ---------------- CONFIG ---------------- #
+
+RRF_K = 60          # standard reciprocal-rank-fusion damping constant
+RRF_WEIGHT = 0.2    # weight of the fused rank relative to the heuristic score
+
+CROSS_ENCODER_BATCH_SIZE = 32
+
+# ---------------------------------------- #
+
+DEFINITION_CUE = re.compile(r"\b(is|are|refers to|defined as)\b", re.I)
+WHY_CUE = re.compile(r"\b(because|due to|since|therefore)\b", re.I)
+NUMBER_CUE = re.compile(r"\d")
+
+# Candidates passed to a reranker are dicts with:
+#   id, text, meta, distance (cosine, from the dense stage), fused (RRF score)
+
+
+class HeuristicReranker:
+    """
+    Cheap default: semantic similarity + fused rank + intent / structure cues.
+    """
+
+    name = "heuristic"
+
+    def score(self, query, intent, candidates):
+        max_fused = 2.0 / (RRF_K + 1)
+        return [
+            self._score(query, intent, c["text"], c["meta"], c["distance"])
+            + RRF_WEIGHT * c["fused"] / max_fused
+            for c in candidates
+        ]
+
+    def score_many(self, requests):
+        """
+        Vectorized score() for many (query, intent, candidates) at once;
+        returns one float array per request, same values as score().
+        Text cues only depend on the chunk, so a chunk shared by several
+        queries is scanned once.
+        """
+        max_fused = 2.0 / (RRF_K + 1)
+        cues = {}
+        out = []
+
+        for query, intent, candidates in requests:
+            n = len(candidates)
+            for c in candidates:
+                if c["id"] not in cues:
+                    cues[c["id"]] = self._cues(c["text"], c["meta"])
+
+            flags = np.array([cues[c["id"]] for c in candidates], dtype=np.float64).reshape(n, 4)
+            distance = np.fromiter((c["distance"] for c in candidates), dtype=np.float64, count=n)
+            fused = np.fromiter((c["fused"] for c in candidates), dtype=np.float64, count=n)
+
+            score = 0.65 * (1.0 - distance)
+
+            if intent == QueryIntent.DEFINITION:
+                score += 0.15 * flags[:, 0]
+            elif intent == QueryIntent.WHY:
+                score += 0.15 * flags[:, 1]
+            elif intent == QueryIntent.FACT:
+                score += 0.10 * flags[:, 2]
+            elif intent == QueryIntent.SECTION:
+                score += 0.10
+
+            if intent == QueryIntent.SECTION:
+                section_ids = [c["meta"].get("section_id", "") for c in candidates]
+                in_query = (bool(sid) and sid in query for sid in section_ids)
+                score += 0.15 * np.fromiter(in_query, dtype=np.float64, count=n)
+
+            score -= 0.25 * flags[:, 3]
+
+            out.append(np.maximum(score, 0.0) + RRF_WEIGHT * fused / max_fused)
+
+        return out
+
+    @staticmethod
+    def _cues(text, meta):
+        # (definition cue, why cue, number, reference section)
+        section_id = meta.get("section_id", "")
+        return (
+            DEFINITION_CUE.search(text) is not None,
+            WHY_CUE.search(text) is not None,
+            NUMBER_CUE.search(text) is not None,
+            bool(section_id) and section_id.lower().startswith("9"),
+        )
+
+    def _score(self, query, intent, text, meta, distance):
+        # Base semantic score
+        semantic = 1.0 - distance
+
+        score = 0.65 * semantic
+
+        # Intent bonus (whole words only: "is" must not match "this")
+        if intent == QueryIntent.DEFINITION and DEFINITION_CUE.search(text):
+            score += 0.15
+        elif intent == QueryIntent.WHY and WHY_CUE.search(text):
+            score += 0.15
+        elif intent == QueryIntent.FACT and NUMBER_CUE.search(text):
+            score += 0.10
+        elif intent == QueryIntent.SECTION:
+            score += 0.10
+
+        # Structure bias (soft, never dominant)
+        section_id = meta.get("section_id", "")
+        if intent == QueryIntent.SECTION and section_id and section_id in query:
+            score += 0.15
+
+        # Penalize references unless explicitly asked
+        if section_id and section_id.lower().startswith("9"):
+            score -= 0.25
+
+        return max(score, 0.0)
+
+
+class CrossEncoderReranker:
+    """
+    Local cross-encoder run over (query, chunk) pairs in batches.
+    Slower than the heuristic, so keep candidate_k modest (~50).
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER,
+                 batch_size: int = CROSS_ENCODER_BATCH_SIZE):
+        self.model = get_cross_encoder(model_name)
+        self.batch_size = batch_size
+
+    def score(self, query, intent, candidates):
+        if not candidates:
+            return []
+
+        logits = self.model.predict(
+            [(query, c["text"]) for c in candidates],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+        )
+        # Squash to [0, 1] so confidences stay comparable with the heuristic
+        return (1.0 / (1.0 + np.exp(-np.asarray(logits, dtype=np.float32)))).tolist()
+
+    def score_many(self, requests):
+        # Pairs of every query in one predict() call: full batches throughout
+        pairs = [(query, c["text"]) for query, _, candidates in requests for c in candidates]
+        if not pairs:
+            return [np.zeros(0) for _ in requests]
+
+        logits = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        scores = 1.0 / (1.0 + np.exp(-np.asarray(logits, dtype=np.float32)))
+
+        bounds = np.cumsum([0] + [len(candidates) for _, _, candidates in requests])
+        return [scores[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+RERANKERS = {
+    HeuristicReranker.name: HeuristicReranker,
+    CrossEncoderReranker.name: CrossEncoderReranker,
+}
+
+
+def get_reranker(name: str = "heuristic", **kwargs):
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker: {name}")
+    return RERANKERS[name](**kwargs)
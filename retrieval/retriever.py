@@ -1,70 +1,580 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-from retrieval.query_intent import detect_intent, QueryIntent
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from embeddings.registry import get_collection, get_embedding_model, index_version
+from indexing.corpus import corpus_version
+from observability.tracing import span
+from preprocessing.section_index import load_sections, section_chunk_ids
+from retrieval.ann_index import ANN_INDEX, NPROBE, RESCORE, load_ann_index, rescore
+from retrieval.lexical_index import load_lexical_index, reciprocal_rank_fusion
+from retrieval.query_intent import detect_intent
+from retrieval.rerankers import RRF_K, HeuristicReranker
 
 CHROMA_DIR = "data/vector_db"
 COLLECTION_NAME = "documents"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
+# search(k) fetches k * CANDIDATE_FANOUT candidates before reranking
+CANDIDATE_FANOUT = 2
+
+QUERY_CACHE_SIZE = 2048
+QUERY_CACHE_TTL = 24 * 3600   # seconds; embeddings only change with the model
+RESULT_CACHE_SIZE = 512
+RESULT_CACHE_TTL = 600        # seconds; also keyed on the index version
+
+# search_many(): queries per encode batch / per batched collection.query
+ENCODE_BATCH_SIZE = 64
+QUERY_BATCH_SIZE = 128
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional per-entry TTL (seconds).
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# Shared by every Retriever in the process (the app builds one per rerun)
+_query_embeddings = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+_results = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+
+def normalize_query(query: str) -> str:
+    # MiniLM is uncased, so case and spacing never change the embedding
+    return " ".join(query.lower().split())
+
+
+def cache_stats() -> dict:
+    return {
+        "query_embeddings": _query_embeddings.stats(),
+        "results": _results.stats(),
+    }
+
+
+def clear_caches():
+    _query_embeddings.clear()
+    _results.clear()
+
+
+def document_filter(document_ids):
+    """
+    Chroma `where` clause for a subset of documents (None = whole corpus).
+    """
+    if not document_ids:
+        return None
+
+    document_ids = list(document_ids)
+    if len(document_ids) == 1:
+        return {"document_id": document_ids[0]}
+    return {"document_id": {"$in": document_ids}}
+
 
 class Retriever:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path=CHROMA_DIR)
-        self.collection = self.client.get_collection(COLLECTION_NAME)
-        self.embedder = SentenceTransformer(EMBEDDING_MODEL)
-
-    def search(self, query: str, k: int = 20):
-        intent = detect_intent(query)
-
-        query_embedding = self.embedder.encode(
-            query, normalize_embeddings=True
-        ).tolist()
-
-        raw = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=k,
-            include=["documents", "metadatas", "distances"]
+    """
+    Two-stage retrieval:
+
+    1. candidates: dense Chroma results fused with BM25 results via
+       reciprocal-rank fusion, `candidate_k` from each
+    2. rerank: a pluggable scorer (retrieval/rerankers.py) orders the
+       candidates and the best `final_k` are returned
+
+    If the vector dir has an IVF-PQ index (retrieval/ann_index.py) and
+    `use_ann` is on, the dense stage scans `nprobe` cells of it instead
+    of the full collection and re-scores the hits exactly.
+    """
+
+    def __init__(self, hybrid: bool = True, reranker=None, use_cache: bool = True,
+                 vector_dir=CHROMA_DIR, use_ann: bool = None, nprobe: int = NPROBE):
+        self.vector_dir = vector_dir
+        self.collection = get_collection(vector_dir, COLLECTION_NAME)
+        self.embedder = get_embedding_model(EMBEDDING_MODEL)
+        self.hybrid = hybrid
+        self.reranker = reranker or HeuristicReranker()
+        self.use_cache = use_cache
+        self.use_ann = ANN_INDEX != "off" if use_ann is None else use_ann
+        self.nprobe = nprobe
+
+    def search(self, query: str, k: int = 20, document_ids=None):
+        """
+        Up to `k` results, best first. `document_ids` restricts the search
+        to a subset of the corpus; None (or empty) searches everything.
+        """
+        return self.search_with_timings(
+            query,
+            candidate_k=k * CANDIDATE_FANOUT,
+            final_k=k,
+            document_ids=document_ids,
+        )["results"]
+
+    def search_with_timings(self, query: str, candidate_k: int = 40, final_k: int = 10,
+                            document_ids=None, reranker=None):
+        """
+        Returns {"results": [...], "timings": {stage: milliseconds},
+        "cached": bool}.
+
+        Query embeddings and final results are cached process-wide; the
+        result cache key includes the index version, so any re-index
+        invalidates it.
+        """
+        with span("retriever.search", candidate_k=candidate_k, final_k=final_k) as s:
+            out = self._search(query, candidate_k, final_k, document_ids, reranker or self.reranker)
+            s.set(cached=out["cached"], results=len(out["results"]))
+        return out
+
+    def _search(self, query, candidate_k, final_k, document_ids, reranker):
+        timings = {}
+        start = time.perf_counter()
+
+        with _stage(timings, "intent"):
+            intent = detect_intent(query)
+
+        with _stage(timings, "embed"):
+            query_embedding = self._embed(query)
+
+        result_key = None
+        if self.use_cache:
+            result_key = self._result_key(
+                query, query_embedding, candidate_k, final_k, document_ids, reranker
+            )
+            cached = _results.get(result_key)
+            if cached is not None:
+                timings["total"] = _ms_since(start)
+                return {"results": copy.deepcopy(cached), "timings": timings, "cached": True}
+
+        candidates = self._candidates(
+            query, query_embedding, candidate_k, document_ids, timings
+        )
+
+        with _stage(timings, "rerank", reranker=reranker.name):
+            scores = reranker.score(query, intent, candidates)
+            ranked = sorted(zip(scores, candidates), key=lambda x: x[0], reverse=True)
+
+        results = [
+            self._format(c, score) for score, c in ranked[:final_k]
+        ]
+
+        if result_key is not None:
+            _results.put(result_key, copy.deepcopy(results))
+
+        timings["total"] = _ms_since(start)
+
+        return {"results": results, "timings": timings, "cached": False}
+
+    def search_many(self, queries, k: int = 20, document_ids=None):
+        """
+        search() for a list of queries, one result list per query, same
+        results. Much cheaper per query than calling search() in a loop:
+        one encode call for all queries, one collection.query per
+        QUERY_BATCH_SIZE queries and vectorized reranking.
+        """
+        return self.search_many_with_timings(
+            queries,
+            candidate_k=k * CANDIDATE_FANOUT,
+            final_k=k,
+            document_ids=document_ids,
+        )["results"]
+
+    def search_many_with_timings(self, queries, candidate_k: int = 40, final_k: int = 10,
+                                 document_ids=None, reranker=None):
+        """
+        Returns {"results": [[...], ...], "timings": {stage: total ms
+        over all queries}, "cached": number of queries served from the
+        result cache}. Shares both caches with search().
+        """
+        queries = list(queries)
+        reranker = reranker or self.reranker
+        timings = {}
+        start = time.perf_counter()
+
+        with span("retriever.search_many", queries=len(queries),
+                  candidate_k=candidate_k, final_k=final_k) as s:
+            with _stage(timings, "intent"):
+                intents = [detect_intent(q) for q in queries]
+
+            with _stage(timings, "embed"):
+                embeddings = self._embed_many(queries)
+
+            results = [None] * len(queries)
+            keys = [None] * len(queries)
+            if self.use_cache:
+                for n, query in enumerate(queries):
+                    keys[n] = self._result_key(
+                        query, embeddings[n], candidate_k, final_k, document_ids, reranker
+                    )
+                    cached = _results.get(keys[n])
+                    if cached is not None:
+                        results[n] = copy.deepcopy(cached)
+
+            todo = [n for n, r in enumerate(results) if r is None]
+            for batch_start in range(0, len(todo), QUERY_BATCH_SIZE):
+                batch = todo[batch_start:batch_start + QUERY_BATCH_SIZE]
+                batch_results = self._search_batch(
+                    [queries[n] for n in batch],
+                    [intents[n] for n in batch],
+                    embeddings[batch],
+                    candidate_k, final_k, document_ids, reranker, timings,
+                )
+                for n, r in zip(batch, batch_results):
+                    results[n] = r
+                    if keys[n] is not None:
+                        _results.put(keys[n], copy.deepcopy(r))
+
+            s.set(cached=len(queries) - len(todo))
+
+        timings["total"] = _ms_since(start)
+        return {"results": results, "timings": timings, "cached": len(queries) - len(todo)}
+
+    def _search_batch(self, queries, intents, embeddings, candidate_k, final_k,
+                      document_ids, reranker, timings):
+        candidate_sets = self._candidates_many(
+            queries, embeddings, candidate_k, document_ids, timings
         )
 
-        results = []
-        for text, meta, dist in zip(
-            raw["documents"][0],
-            raw["metadatas"][0],
-            raw["distances"][0]
-        ):
-            score = self._score(query, intent, text, meta, dist)
-            results.append({
-                "text": text,
-                "pages": meta.get("pages", "").split(","),
-                "section_id": meta.get("section_id"),
-                "section_title": meta.get("section_id"),
-                "confidence": round(score, 3)
+        with _stage(timings, "rerank", reranker=reranker.name):
+            requests = [
+                (query, intent, candidates)
+                for query, intent, candidates in zip(queries, intents, candidate_sets)
+            ]
+            score_many = getattr(reranker, "score_many", None)
+            if score_many is not None:
+                all_scores = score_many(requests)
+            else:
+                all_scores = [reranker.score(*request) for request in requests]
+
+            results = []
+            for candidates, scores in zip(candidate_sets, all_scores):
+                scores = np.asarray(scores, dtype=np.float64)
+                # Stable, like sorted(): ties keep candidate order
+                top = np.argsort(-scores, kind="stable")[:final_k]
+                results.append([self._format(candidates[i], scores[i]) for i in top])
+
+        return results
+
+    def get_section(self, section_id: str, document_ids=None):
+        """
+        All chunks of a section (and its subsections) straight from the
+        section index: no embedding, no similarity search. Results are in
+        document order, per document, with the same shape as search().
+        """
+        with span("retriever.get_section", section_id=section_id) as s:
+            results = self._get_section(section_id, document_ids)
+            s.set(results=len(results))
+        return results
+
+    def _get_section(self, section_id, document_ids):
+        sections = load_sections(self.vector_dir)
+        wanted = document_ids or sorted(sections)
+
+        ordered_ids = []
+        for document_id in wanted:
+            tree = sections.get(document_id)
+            if tree:
+                ordered_ids.extend(section_chunk_ids(tree, section_id))
+
+        if not ordered_ids:
+            return []
+
+        raw = self.collection.get(ids=ordered_ids, include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: {"id": chunk_id, "text": text, "meta": meta}
+            for chunk_id, text, meta in zip(raw["ids"], raw["documents"], raw["metadatas"])
+        }
+
+        return [
+            self._format(by_id[chunk_id], 1.0)
+            for chunk_id in ordered_ids if chunk_id in by_id
+        ]
+
+    def _embed(self, query: str):
+        if not self.use_cache:
+            return self.embedder.encode(query, normalize_embeddings=True)
+
+        key = (EMBEDDING_MODEL, normalize_query(query))
+        embedding = _query_embeddings.get(key)
+        if embedding is None:
+            embedding = self.embedder.encode(query, normalize_embeddings=True)
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding.setflags(write=False)
+            _query_embeddings.put(key, embedding)
+        return embedding
+
+    def _embed_many(self, queries):
+        """
+        (len(queries), dim) float32; cache misses are encoded in one call.
+        """
+        if not self.use_cache:
+            return np.asarray(
+                self.embedder.encode(queries, batch_size=ENCODE_BATCH_SIZE, normalize_embeddings=True),
+                dtype=np.float32,
+            )
+
+        keys = [(EMBEDDING_MODEL, normalize_query(q)) for q in queries]
+        found = {key: _query_embeddings.get(key) for key in set(keys)}
+
+        # One encode per distinct normalized query
+        missing = {}
+        for key, query in zip(keys, queries):
+            if found[key] is None:
+                missing.setdefault(key, query)
+
+        if missing:
+            encoded = np.asarray(
+                self.embedder.encode(list(missing.values()), batch_size=ENCODE_BATCH_SIZE,
+                                     normalize_embeddings=True),
+                dtype=np.float32,
+            )
+            for key, embedding in zip(missing, encoded):
+                embedding.setflags(write=False)
+                _query_embeddings.put(key, embedding)
+                found[key] = embedding
+
+        return np.stack([found[key] for key in keys])
+
+    def _candidates_many(self, queries, embeddings, candidate_k, document_ids, timings):
+        """
+        _candidates() for a batch of queries: one collection.query for
+        all of them and one fetch for every lexical-only hit, scored
+        against all query embeddings with a single matrix product.
+        Returns one candidate list per query, in the same order.
+        """
+        with _stage(timings, "vector_query", queries=len(queries)):
+            raw = self._dense(embeddings, candidate_k, document_ids)
+
+        candidate_sets = []
+        dense_rankings = []
+        for n in range(len(queries)):
+            candidate_sets.append({
+                chunk_id: {"id": chunk_id, "text": text, "meta": meta, "distance": dist}
+                for chunk_id, text, meta, dist in zip(
+                    raw["ids"][n],
+                    raw["documents"][n],
+                    raw["metadatas"][n],
+                    raw["distances"][n]
+                )
             })
+            dense_rankings.append(raw["ids"][n])
+
+        lexical_rankings = [[] for _ in queries]
+        with _stage(timings, "lexical"):
+            if self.hybrid:
+                lexical = load_lexical_index(self.vector_dir)
+                lexical_rankings = [
+                    [chunk_id for chunk_id, _ in lexical.search(query, candidate_k, document_ids)]
+                    for query in queries
+                ]
+
+        with _stage(timings, "fetch"):
+            missing = list(dict.fromkeys(
+                chunk_id
+                for candidates, ranking in zip(candidate_sets, lexical_rankings)
+                for chunk_id in ranking if chunk_id not in candidates
+            ))
+            if missing:
+                extra = self.collection.get(
+                    ids=missing, include=["documents", "metadatas", "embeddings"]
+                )
+                row = {chunk_id: i for i, chunk_id in enumerate(extra["ids"])}
+                vectors = np.asarray(extra["embeddings"], dtype=np.float32)
+                similarity = embeddings @ vectors.T  # (queries, fetched)
+
+                for n, (candidates, ranking) in enumerate(zip(candidate_sets, lexical_rankings)):
+                    for chunk_id in ranking:
+                        i = row.get(chunk_id)
+                        if i is None or chunk_id in candidates:
+                            continue
+                        candidates[chunk_id] = {
+                            "id": chunk_id,
+                            "text": extra["documents"][i],
+                            "meta": extra["metadatas"][i],
+                            "distance": 1.0 - float(similarity[n, i]),
+                        }
+
+        out = []
+        for candidates, dense, lexical_ranking in zip(candidate_sets, dense_rankings, lexical_rankings):
+            fused = reciprocal_rank_fusion([dense, lexical_ranking], RRF_K)
+            for chunk_id, c in candidates.items():
+                c["fused"] = fused.get(chunk_id, 0.0)
+            out.append(list(candidates.values()))
+        return out
+
+    def _result_key(self, query, query_embedding, candidate_k, final_k, document_ids, reranker):
+        return (
+            str(self.vector_dir),
+            hashlib.sha1(query_embedding.tobytes()).hexdigest(),
+            normalize_query(query),
+            index_version(self.vector_dir),
+            corpus_version(self.vector_dir),
+            candidate_k,
+            final_k,
+            tuple(sorted(document_ids or ())),
+            reranker.name,
+            self.hybrid,
+            self.use_ann and self.nprobe,
+        )
+
+    def _dense(self, embeddings, candidate_k, document_ids):
+        """
+        Dense top-`candidate_k` per query row of `embeddings`, in the
+        collection.query() result shape (ids / documents / metadatas /
+        distances, one list per query).
+        """
+        ann = load_ann_index(self.vector_dir) if self.use_ann else None
+        if ann is None:
+            return self.collection.query(
+                query_embeddings=embeddings.tolist(),
+                n_results=candidate_k,
+                where=document_filter(document_ids),
+                include=["documents", "metadatas", "distances"]
+            )
+
+        with span("retriever.ann", nprobe=self.nprobe, queries=len(embeddings)):
+            hits = [
+                [chunk_id for chunk_id, _ in ann.search(
+                    q, candidate_k * RESCORE, self.nprobe, document_ids
+                )]
+                for q in embeddings
+            ]
+
+        # One fetch for every query's hits: text, metadata and the stored
+        # vectors for exact re-scoring
+        wanted = list(dict.fromkeys(chunk_id for ids in hits for chunk_id in ids))
+        stored = self.collection.get(
+            ids=wanted, include=["documents", "metadatas", "embeddings"]
+        ) if wanted else {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        row = {chunk_id: i for i, chunk_id in enumerate(stored["ids"])}
+        vectors = np.asarray(stored["embeddings"], dtype=np.float32)
+
+        raw = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q, ids in zip(embeddings, hits):
+            # Ids deleted from the collection since the index was saved drop out here
+            rows = [row[chunk_id] for chunk_id in ids if chunk_id in row]
+            top = rescore(q, rows, vectors[rows], candidate_k) if rows else []
+            raw["ids"].append([stored["ids"][i] for i, _ in top])
+            raw["documents"].append([stored["documents"][i] for i, _ in top])
+            raw["metadatas"].append([stored["metadatas"][i] for i, _ in top])
+            raw["distances"].append([dist for _, dist in top])
+        return raw
+
+    def _candidates(self, query, query_embedding, candidate_k, document_ids, timings):
+        with _stage(timings, "vector_query"):
+            raw = self._dense(query_embedding[None, :], candidate_k, document_ids)
+
+        candidates = {
+            chunk_id: {"id": chunk_id, "text": text, "meta": meta, "distance": dist}
+            for chunk_id, text, meta, dist in zip(
+                raw["ids"][0],
+                raw["documents"][0],
+                raw["metadatas"][0],
+                raw["distances"][0]
+            )
+        }
+        dense_ranking = raw["ids"][0]
+
+        lexical_ranking = []
+        with _stage(timings, "lexical"):
+            if self.hybrid:
+                lexical = load_lexical_index(self.vector_dir)
+                lexical_ranking = [
+                    chunk_id for chunk_id, _ in lexical.search(query, candidate_k, document_ids)
+                ]
+
+        fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking], RRF_K)
+
+        # Lexical-only hits: fetch text and vectors to score them like the rest
+        with _stage(timings, "fetch"):
+            missing = [chunk_id for chunk_id in lexical_ranking if chunk_id not in candidates]
+            if missing:
+                extra = self.collection.get(
+                    ids=missing, include=["documents", "metadatas", "embeddings"]
+                )
+                for chunk_id, text, meta, emb in zip(
+                    extra["ids"], extra["documents"], extra["metadatas"], extra["embeddings"]
+                ):
+                    dist = 1.0 - float(np.dot(query_embedding, np.asarray(emb, dtype=np.float32)))
+                    candidates[chunk_id] = {
+                        "id": chunk_id, "text": text, "meta": meta, "distance": dist
+                    }
 
-        results.sort(key=lambda x: x["confidence"], reverse=True)
-        return results[:5]
+        for chunk_id, c in candidates.items():
+            c["fused"] = fused.get(chunk_id, 0.0)
 
-    def _score(self, query, intent, text, meta, distance):
-        # Base semantic score
-        semantic = 1.0 - distance
+        return list(candidates.values())
 
-        score = 0.65 * semantic
+    @staticmethod
+    def _format(candidate, score):
+        meta = candidate["meta"]
+        return {
+            "id": candidate["id"],
+            "text": candidate["text"],
+            "pages": meta.get("pages", "").split(","),
+            "section_id": meta.get("section_id"),
+            "section_title": meta.get("section_id"),
+            "document_id": meta.get("document_id", ""),
+            "source": meta.get("source", "document"),
+            "position": int(meta.get("position", -1)),
+            "confidence": round(float(score), 3)
+        }
 
-        # Intent bonus
-        if intent == QueryIntent.DEFINITION and "is" in text.lower():
-            score += 0.15
-        elif intent == QueryIntent.WHY and "because" in text.lower():
-            score += 0.15
-        elif intent == QueryIntent.SECTION:
-            score += 0.10
 
-        # Structure bias (soft, never dominant)
-        section_id = meta.get("section_id", "")
-        if intent == QueryIntent.SECTION and section_id and section_id in query:
-            score += 0.15
+@contextmanager
+def _stage(timings, name, **attrs):
+    # Fills the timings dict returned to callers and, when a trace is
+    # active, records the same stage as a span. Stages run once per
+    # QUERY_BATCH_SIZE batch in search_many(), so times add up.
+    t = time.perf_counter()
+    with span(f"retriever.{name}", **attrs):
+        yield
+    timings[name] = round(timings.get(name, 0.0) + _ms_since(t), 3)
 
-        # Penalize references unless explicitly asked
-        if section_id and section_id.lower().startswith("9"):
-            score -= 0.25
 
-        return max(score, 0.0)
+def _ms_since(t: float) -> float:
+    return round((time.perf_counter() - t) * 1000, 3)
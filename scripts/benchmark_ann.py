@@ -0,0 +1,192 @@
+"""
+IVF-PQ index benchmark: recall and latency against exact search.
+
+Synthetic normalized embeddings with a topic -> document -> chunk
+hierarchy (neighbours of a query are mostly chunks of the same
+document), so no model or PDF is needed:
+
+    python -m scripts.benchmark_ann
+    python -m scripts.benchmark_ann --rows 200000 --nprobe 4 8 16 32 64 --m 24 48
+
+For each corpus size and sub-quantizer count: train / encode time and
+bytes per vector, then per nprobe the recall@k of the raw PQ ranking and
+of the exactly re-scored top k * rescore (what the Retriever returns),
+with p50/p95 latency of both next to the exact brute-force baseline.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from retrieval.ann_index import NPROBE, PQ_M, RESCORE, IVFPQIndex, rescore
+
+# ---------------- CONFIG ---------------- #
+
+ROWS = [100_000]
+DIM = 384
+TOPICS = 50
+CHUNKS_PER_DOCUMENT = 20
+SPREAD = 0.6        # noise at each level of the hierarchy
+
+M = [PQ_M]
+NPROBES = [4, 8, NPROBE, 32, 64]
+QUERIES = 200
+TOP_K = 10
+SEED = 7
+
+OUTPUT_FILE = Path("data/bench/ann.json")
+
+# ---------------------------------------- #
+
+
+def _normalize(x):
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def hierarchical_vectors(rng, n: int, dim: int, queries: int):
+    topics = rng.standard_normal((TOPICS, dim), dtype=np.float32)
+    documents = topics[rng.integers(0, TOPICS, size=max(1, n // CHUNKS_PER_DOCUMENT))]
+    documents += SPREAD * rng.standard_normal(documents.shape, dtype=np.float32)
+
+    def sample(count):
+        labels = rng.integers(0, len(documents), size=count)
+        noise = SPREAD * rng.standard_normal((count, dim), dtype=np.float32)
+        return _normalize(documents[labels] + noise), labels
+
+    vectors, labels = sample(n)
+    return vectors, labels, sample(queries)[0]
+
+
+def _percentiles(samples_ms):
+    arr = np.asarray(samples_ms)
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+    }
+
+
+def _recall(found, truth, k):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return round(hits / (len(truth) * k), 4)
+
+
+def exact_search(vectors, queries, k):
+    latencies = []
+    truth = []
+    for q in queries:
+        t = time.perf_counter()
+        scores = vectors @ q
+        top = np.argpartition(-scores, k - 1)[:k]
+        truth.append(top[np.argsort(-scores[top])].tolist())
+        latencies.append((time.perf_counter() - t) * 1000)
+    return truth, latencies
+
+
+def benchmark_index(vectors, labels, queries, truth, m, nprobes, k, rescore_factor):
+    ids = [str(i) for i in range(len(vectors))]
+
+    t = time.perf_counter()
+    index = IVFPQIndex.train(vectors, m=m)
+    train_seconds = time.perf_counter() - t
+
+    t = time.perf_counter()
+    index.add(ids, vectors, [str(d) for d in labels])
+    encode_seconds = time.perf_counter() - t
+
+    sweep = []
+    for nprobe in nprobes:
+        pq_found, pq_ms = [], []
+        found, rescored_ms = [], []
+        for q in queries:
+            t = time.perf_counter()
+            hits = index.search(q, k * rescore_factor, nprobe)
+            pq_ms.append((time.perf_counter() - t) * 1000)
+            rows = [int(chunk_id) for chunk_id, _ in hits]
+            top = rescore(q, rows, vectors[rows], k)
+            rescored_ms.append((time.perf_counter() - t) * 1000)
+
+            pq_found.append(rows[:k])
+            found.append([row for row, _ in top])
+
+        sweep.append({
+            "nprobe": nprobe,
+            f"pq_recall@{k}": _recall(pq_found, truth, k),
+            f"recall@{k}": _recall(found, truth, k),
+            "pq_ms": _percentiles(pq_ms),
+            "rescored_ms": _percentiles(rescored_ms),
+        })
+
+    stats = index.stats()
+    return {
+        "rows": len(vectors),
+        "m": index.m,
+        "nlist": index.nlist,
+        "bytes_per_vector": stats["bytes_per_vector"],
+        "float32_bytes_per_vector": vectors.shape[1] * 4,
+        "train_seconds": round(train_seconds, 2),
+        "encode_seconds": round(encode_seconds, 2),
+        "sweep": sweep,
+    }
+
+
+def print_report(result, exact_ms, k):
+    print(
+        f"\n{result['rows']} rows, m={result['m']}, nlist={result['nlist']}: "
+        f"{result['bytes_per_vector']} B/vector (float32 {result['float32_bytes_per_vector']}), "
+        f"train {result['train_seconds']}s, encode {result['encode_seconds']}s, "
+        f"exact p50 {exact_ms['p50']:.2f} ms"
+    )
+    print(f"{'nprobe':>7}{f'PQ R@{k}':>10}{f'R@{k}':>8}{'PQ p50':>9}{'PQ p95':>9}{'p50':>9}{'p95':>9}")
+    for s in result["sweep"]:
+        print(
+            f"{s['nprobe']:>7}{s[f'pq_recall@{k}']:>10.3f}{s[f'recall@{k}']:>8.3f}"
+            f"{s['pq_ms']['p50']:>9.2f}{s['pq_ms']['p95']:>9.2f}"
+            f"{s['rescored_ms']['p50']:>9.2f}{s['rescored_ms']['p95']:>9.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF-PQ recall / latency vs exact search")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS)
+    parser.add_argument("--dim", type=int, default=DIM)
+    parser.add_argument("--m", type=int, nargs="+", default=M)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=NPROBES)
+    parser.add_argument("--rescore", type=int, default=RESCORE)
+    parser.add_argument("--queries", type=int, default=QUERIES)
+    parser.add_argument("-k", type=int, default=TOP_K)
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(SEED)
+
+    results = []
+    for rows in args.rows:
+        vectors, labels, queries = hierarchical_vectors(rng, rows, args.dim, args.queries)
+        truth, exact_ms = exact_search(vectors, queries, args.k)
+        exact_ms = _percentiles(exact_ms)
+
+        for m in args.m:
+            print(f"Training m={m} on {rows} rows...")
+            result = benchmark_index(
+                vectors, labels, queries, truth, m, args.nprobe, args.k, args.rescore
+            )
+            result["exact_ms"] = exact_ms
+            print_report(result, exact_ms, args.k)
+            results.append(result)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "dim": args.dim,
+            "queries": args.queries,
+            "rescore": args.rescore,
+            "results": results,
+        }, f, indent=2)
+    print(f"\nSaved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
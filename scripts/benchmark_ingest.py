@@ -0,0 +1,271 @@
+"""
+Ingest throughput benchmark across document sizes.
+
+Generates synthetic PDFs (10 to 5000 pages by default) with PyMuPDF and
+times each ingest stage separately:
+
+    extract  ingest.pdf_loader.extract_pdf_pages
+    chunk    preprocessing.chunker.chunk_pages
+    index    indexing.index_chunks.main (embed + Chroma upsert + BM25 / sections)
+
+For every stage: wall time, pages/sec, chunks/sec and peak RSS; for
+the index stage also the vector DB size on disk and the embed / upsert
+split. The dominant stage at each size is marked.
+
+    python -m scripts.benchmark_ingest
+    python -m scripts.benchmark_ingest --sizes 10 100 1000 --workers 4
+
+Each size is indexed into its own fresh directory with the embedding
+cache disabled, so repeated runs measure real encoding.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from embeddings.registry import invalidate_index
+from indexing import index_chunks
+from ingest.pdf_loader import compute_document_id, extract_pdf_pages
+from preprocessing.chunker import chunk_pages
+from preprocessing.records import RecordWriter, record_path
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+# ---------------- CONFIG ---------------- #
+
+SIZES = [10, 100, 1000, 5000]
+BENCH_DIR = Path("data/bench/ingest")
+OUTPUT_FILE = Path("data/bench/ingest.json")
+
+WORDS_PER_PAGE = 380
+PAGES_PER_SECTION = 5
+SEED = 13
+
+RSS_SAMPLE_SECONDS = 0.01
+
+# ---------------------------------------- #
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "qu", "di", "fo", "gu", "he"]
+
+
+# ---------------- Synthetic PDFs ---------------- #
+
+def _vocabulary(rng, size=2000):
+    return ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def _sentence(rng, vocab):
+    # Lower-case words, no digits: only real headings look like sections
+    words = [rng.choice(vocab) for _ in range(rng.randint(8, 22))]
+    return " ".join(words).capitalize() + "."
+
+
+def generate_pdf(path: Path, pages: int, seed: int = SEED):
+    """
+    Deterministic text-only PDF: a numbered section heading every
+    PAGES_PER_SECTION pages, prose-like sentences elsewhere.
+    """
+    rng = random.Random(seed + pages)
+    vocab = _vocabulary(rng)
+
+    doc = fitz.open()
+    section = 0
+    for n in range(pages):
+        page = doc.new_page()
+
+        heading = ""
+        if n % PAGES_PER_SECTION == 0:
+            section += 1
+            heading = f"{section} {rng.choice(vocab).capitalize()} Overview\n"
+
+        sentences = []
+        words = 0
+        while words < WORDS_PER_PAGE:
+            sentence = _sentence(rng, vocab)
+            words += sentence.count(" ") + 1
+            sentences.append(sentence)
+
+        page.insert_textbox(fitz.Rect(50, 50, 545, 800), heading + " ".join(sentences), fontsize=9)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(str(path), garbage=3, deflate=True)
+    doc.close()
+
+
+# ---------------- Measurement ---------------- #
+
+def current_rss() -> int:
+    """
+    Resident set size in bytes (Linux /proc); 0 where unavailable.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def max_rss() -> int:
+    # Process-lifetime high-water mark: the fallback when sampling is unavailable
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRSS:
+    """
+    Samples RSS in a background thread while a stage runs, so each stage
+    gets its own peak instead of the process-wide high-water mark.
+    Child processes (parallel extraction workers) are not included.
+    """
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss()) or max_rss()
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def _stage(name, pages, chunks, seconds, peak_rss, **extra):
+    return {
+        "stage": name,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(pages / seconds, 1) if seconds else None,
+        "chunks_per_sec": round(chunks / seconds, 1) if seconds else None,
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+        **extra,
+    }
+
+
+def benchmark_size(pages: int, workers: int) -> dict:
+    pdf_path = BENCH_DIR / "pdfs" / f"synthetic_{pages}.pdf"
+    if not pdf_path.exists():
+        t = time.perf_counter()
+        generate_pdf(pdf_path, pages)
+        print(f"  generated {pdf_path} in {time.perf_counter() - t:.1f}s")
+
+    document_id = compute_document_id(pdf_path)
+    vector_dir = BENCH_DIR / f"vector_db_{pages}"
+    if vector_dir.exists():
+        shutil.rmtree(vector_dir)
+    invalidate_index(vector_dir)
+
+    stages = []
+
+    with PeakRSS() as rss:
+        t = time.perf_counter()
+        page_records = extract_pdf_pages(pdf_path, workers=workers)
+        seconds = time.perf_counter() - t
+    stages.append(_stage("extract", pages, 0, seconds, rss.peak))
+
+    with PeakRSS() as rss:
+        t = time.perf_counter()
+        chunks = chunk_pages(page_records, document_id, pdf_path.name)
+        seconds = time.perf_counter() - t
+    stages.append(_stage("chunk", pages, len(chunks), seconds, rss.peak))
+
+    chunks_file = record_path(BENCH_DIR / f"chunks_{pages}")
+    with RecordWriter(chunks_file) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    del page_records, chunks
+
+    with PeakRSS() as rss:
+        t = time.perf_counter()
+        stats = index_chunks.main(chunks_file, vector_dir=vector_dir, use_cache=False)
+        seconds = time.perf_counter() - t
+    stages.append(_stage(
+        "index", pages, stats["chunks"], seconds, rss.peak,
+        embed_seconds=stats["embed_seconds"],
+        upsert_seconds=stats["upsert_seconds"],
+        lexical_seconds=stats["lexical_seconds"],
+        db_size_mb=round(dir_size(vector_dir) / 2**20, 2),
+    ))
+
+    total = sum(s["seconds"] for s in stages)
+    dominant = max(stages, key=lambda s: s["seconds"])
+    for s in stages:
+        s["share"] = round(s["seconds"] / total, 3) if total else 0.0
+
+    return {
+        "pages": pages,
+        "pdf_size_mb": round(pdf_path.stat().st_size / 2**20, 2),
+        "chunks": stats["chunks"],
+        "total_seconds": round(total, 3),
+        "dominant_stage": dominant["stage"],
+        "stages": stages,
+    }
+
+
+def print_table(results):
+    print(
+        f"\n{'pages':>6} {'stage':<8}{'seconds':>10}{'share':>8}{'pages/s':>10}"
+        f"{'chunks/s':>10}{'peak MB':>9}{'DB MB':>8}"
+    )
+    for r in results:
+        for s in r["stages"]:
+            marker = " <" if s["stage"] == r["dominant_stage"] else ""
+            print(
+                f"{r['pages']:>6} {s['stage']:<8}{s['seconds']:>10.2f}{s['share']:>8.0%}"
+                f"{s['pages_per_sec'] or 0:>10.1f}{s['chunks_per_sec'] or 0:>10.1f}"
+                f"{s['peak_rss_mb']:>9.1f}{s.get('db_size_mb', ''):>8}{marker}"
+            )
+        index = r["stages"][-1]
+        print(
+            f"{'':>6} {'':<8}index = embed {index['embed_seconds']}s"
+            f" + upsert {index['upsert_seconds']}s + bm25 {index['lexical_seconds']}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest throughput benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="page counts")
+    parser.add_argument("--workers", type=int, default=1, help="extraction processes")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    results = []
+    for pages in args.sizes:
+        print(f"\n=== {pages} pages ===")
+        results.append(benchmark_size(pages, args.workers))
+
+    print_table(results)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "workers": args.workers,
+            "embed_processes": index_chunks.ENCODE_PROCESSES,
+            "results": results,
+        }, f, indent=2)
+    print(f"\nSaved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Retrieval benchmark: latency per stage and retrieval quality.
+
+Builds (or reuses) an index from a set of PDFs in its own directory,
+replays a query file and reports p50/p95/p99 per stage plus recall@k,
+hit@k and MRR, and the throughput of search() in a loop against one
+search_many() call over the same queries. Runs fully offline: the answer stage uses the
+deterministic fake backend, and the embedding model must already be in
+the local Hugging Face cache.
+
+    python -m scripts.benchmark_retrieval
+    python -m scripts.benchmark_retrieval --pdf setup.pdf --pdf paper.pdf \\
+        --queries my_queries.json --output bench.json --compare baseline.json
+
+Query file: a JSON list of
+
+    {"query": "...", "expected_pages": ["2"], "expected_sections": ["6"]}
+
+A result counts as relevant if one of its pages or its section (or a
+subsection of it) is expected.
+"""
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embeddings.registry import invalidate_index
+from indexing.corpus import is_indexed, load_corpus
+from indexing.pipeline import ingest_pdf
+from ingest.pdf_loader import compute_document_id
+from llm.registry import create_backend
+from retrieval.aggregation import aggregate_global, aggregate_section, in_section
+from retrieval.query_intent import QueryIntent, detect_intent, section_id_from_query
+from retrieval.rerankers import get_reranker
+from retrieval.retriever import Retriever, clear_caches
+
+# ---------------- CONFIG ---------------- #
+
+DEFAULT_PDFS = [Path("setup.pdf")]
+DEFAULT_QUERIES = Path("scripts/benchmark_queries.json")
+INDEX_DIR = Path("data/bench/vector_db")
+OUTPUT_FILE = Path("data/bench/retrieval.json")
+
+TOP_K = 10
+REPEAT = 5
+WARMUP = 1          # untimed passes over the queries (model warm-up)
+
+STAGES = ["intent", "embed", "vector_query", "lexical", "fetch", "rerank",
+          "section_lookup", "aggregate", "answer", "total"]
+PERCENTILES = [50, 95, 99]
+
+# ---------------------------------------- #
+
+
+def build_index(pdfs, index_dir: Path, rebuild: bool) -> dict:
+    if rebuild and index_dir.exists():
+        shutil.rmtree(index_dir)
+        invalidate_index(index_dir)
+
+    stats = {}
+    for pdf in pdfs:
+        document_id = compute_document_id(pdf)
+        if is_indexed(document_id, index_dir):
+            print(f"Index: {pdf.name} already indexed")
+            continue
+
+        print(f"Index: ingesting {pdf.name}")
+        result = ingest_pdf(pdf, document_id=document_id, vector_dir=index_dir)
+        stats[pdf.name] = {
+            "pages": result["pages"],
+            "chunks": result["chunks"],
+            "seconds": result["seconds"],
+        }
+    return stats
+
+
+def is_relevant(result, expected_pages, expected_sections) -> bool:
+    if expected_pages and set(map(str, result["pages"])) & expected_pages:
+        return True
+    return any(in_section(result.get("section_id"), s) for s in expected_sections)
+
+
+def run_query(retriever, llm, query: str, k: int):
+    """
+    Same flow as app.py: section lookup for section queries, otherwise
+    hybrid search; then context packing and the (stubbed) answer.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    intent = detect_intent(query)
+    section_id = section_id_from_query(query) if intent == QueryIntent.SECTION else None
+
+    results = []
+    if section_id:
+        t = time.perf_counter()
+        results = retriever.get_section(section_id)
+        timings["section_lookup"] = _ms_since(t)
+
+    if not results:
+        out = retriever.search_with_timings(query, candidate_k=k * 2, final_k=k)
+        results = out["results"]
+        timings.update(out["timings"])
+        timings.pop("total", None)
+
+    t = time.perf_counter()
+    if section_id:
+        agg = aggregate_section(results, section_id, max_chunks=None,
+                                token_budget=llm.context_budget, count_tokens=llm.count_tokens)
+    else:
+        agg = aggregate_global(results, token_budget=llm.context_budget,
+                               count_tokens=llm.count_tokens)
+    timings["aggregate"] = _ms_since(t)
+
+    t = time.perf_counter()
+    llm.answer(query, agg["text"], intent.name)
+    timings["answer"] = _ms_since(t)
+
+    timings["total"] = _ms_since(start)
+    return results[:k], timings
+
+
+def score_query(results, expected_pages, expected_sections, k: int) -> dict:
+    relevant = [is_relevant(r, expected_pages, expected_sections) for r in results[:k]]
+    first = relevant.index(True) + 1 if True in relevant else None
+
+    covered = set()
+    for r in results[:k]:
+        covered.update(set(map(str, r["pages"])) & expected_pages)
+
+    return {
+        "hit": first is not None,
+        "reciprocal_rank": 1.0 / first if first else 0.0,
+        "page_recall": len(covered) / len(expected_pages) if expected_pages else float(first is not None),
+        "first_relevant_rank": first,
+    }
+
+
+def measure_throughput(retriever, queries, k: int, repeat: int) -> dict:
+    """
+    Queries/second of search() one by one vs one search_many() call,
+    both with cold caches; the query list is repeated to make the batch
+    big enough to matter.
+    """
+    batch = [q["query"] for q in queries] * repeat
+
+    clear_caches()
+    t = time.perf_counter()
+    for query in batch:
+        retriever.search(query, k=k)
+    loop_seconds = time.perf_counter() - t
+
+    clear_caches()
+    t = time.perf_counter()
+    retriever.search_many(batch, k=k)
+    batch_seconds = time.perf_counter() - t
+
+    return {
+        "queries": len(batch),
+        "loop_qps": round(len(batch) / loop_seconds, 1),
+        "search_many_qps": round(len(batch) / batch_seconds, 1),
+        "speedup": round(loop_seconds / batch_seconds, 2),
+    }
+
+
+def summarize_latency(samples: dict) -> dict:
+    summary = {}
+    for stage in STAGES:
+        values = samples.get(stage)
+        if not values:
+            continue
+        arr = np.asarray(values, dtype=np.float64)
+        summary[stage] = {
+            **{f"p{p}": round(float(np.percentile(arr, p)), 3) for p in PERCENTILES},
+            "mean": round(float(arr.mean()), 3),
+            "n": len(values),
+        }
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def print_report(report: dict):
+    k = report["config"]["k"]
+
+    print("\nLatency (ms)")
+    print(f"{'stage':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}{'n':>8}")
+    for stage, s in report["latency_ms"].items():
+        print(f"{stage:<16}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['p99']:>10.2f}{s['mean']:>10.2f}{s['n']:>8}")
+
+    t = report["throughput"]
+    print(f"\nThroughput ({t['queries']} queries)")
+    print(f"  search() loop : {t['loop_qps']:.1f} q/s")
+    print(f"  search_many() : {t['search_many_qps']:.1f} q/s  ({t['speedup']:.2f}x)")
+
+    q = report["quality"]
+    print("\nQuality")
+    print(f"  recall@{k}: {q[f'recall@{k}']:.3f}")
+    print(f"  hit@{k}   : {q[f'hit@{k}']:.3f}")
+    print(f"  MRR      : {q['mrr']:.3f}")
+
+
+def print_comparison(report: dict, baseline: dict):
+    print(f"\nVs baseline ({baseline['meta'].get('commit', '?')})")
+    for stage, s in report["latency_ms"].items():
+        base = baseline["latency_ms"].get(stage)
+        if not base:
+            continue
+        deltas = []
+        for p in ("p50", "p95"):
+            change = (s[p] - base[p]) / base[p] * 100 if base[p] else 0.0
+            deltas.append(f"{p} {base[p]:.2f} -> {s[p]:.2f} ({change:+.1f}%)")
+        print(f"  {stage:<16}" + "   ".join(deltas))
+
+    base = baseline.get("throughput")
+    if base:
+        print(f"  {'search_many q/s':<16}{base['search_many_qps']:.1f} -> {report['throughput']['search_many_qps']:.1f}")
+
+    for metric, value in report["quality"].items():
+        base = baseline["quality"].get(metric)
+        if base is not None:
+            print(f"  {metric:<16}{base:.3f} -> {value:.3f} ({value - base:+.3f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval latency / quality benchmark")
+    parser.add_argument("--pdf", action="append", type=Path, help="PDF to index (repeatable)")
+    parser.add_argument("--queries", type=Path, default=DEFAULT_QUERIES)
+    parser.add_argument("--index-dir", type=Path, default=INDEX_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="delete and rebuild the index")
+    parser.add_argument("-k", type=int, default=TOP_K)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--reranker", default="heuristic")
+    parser.add_argument("--lexical", choices=["on", "off"], default="on", help="hybrid BM25 stage")
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="keep query/result caches between repeats (default: measure cold)")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    parser.add_argument("--compare", type=Path, help="previous output to diff against")
+    args = parser.parse_args()
+
+    pdfs = args.pdf or DEFAULT_PDFS
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    build_stats = build_index(pdfs, args.index_dir, args.rebuild)
+
+    retriever = Retriever(
+        hybrid=args.lexical == "on",
+        reranker=get_reranker(args.reranker),
+        use_cache=args.warm_cache,
+        vector_dir=args.index_dir,
+    )
+    llm = create_backend("fake")
+
+    for _ in range(WARMUP):
+        for q in queries:
+            run_query(retriever, llm, q["query"], args.k)
+
+    samples = {}
+    per_query = []
+
+    for q in queries:
+        expected_pages = set(map(str, q.get("expected_pages", [])))
+        expected_sections = q.get("expected_sections", [])
+
+        totals = []
+        for _ in range(args.repeat):
+            if not args.warm_cache:
+                clear_caches()
+            results, timings = run_query(retriever, llm, q["query"], args.k)
+            for stage, ms in timings.items():
+                samples.setdefault(stage, []).append(ms)
+            totals.append(timings["total"])
+
+        per_query.append({
+            "query": q["query"],
+            **score_query(results, expected_pages, expected_sections, args.k),
+            "top_pages": [r["pages"] for r in results[:3]],
+            "total_ms_p50": round(float(np.median(totals)), 3),
+        })
+
+    throughput = measure_throughput(retriever, queries, args.k, args.repeat)
+
+    n = len(per_query) or 1
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "config": {
+            "pdfs": [str(p) for p in pdfs],
+            "queries": str(args.queries),
+            "k": args.k,
+            "repeat": args.repeat,
+            "reranker": args.reranker,
+            "hybrid": args.lexical == "on",
+            "warm_cache": args.warm_cache,
+            "index_chunks": sum(d["num_chunks"] for d in load_corpus(args.index_dir).values()),
+        },
+        "index_build": build_stats,
+        "latency_ms": summarize_latency(samples),
+        "throughput": throughput,
+        "quality": {
+            f"recall@{args.k}": round(sum(p["page_recall"] for p in per_query) / n, 4),
+            f"hit@{args.k}": round(sum(p["hit"] for p in per_query) / n, 4),
+            "mrr": round(sum(p["reciprocal_rank"] for p in per_query) / n, 4),
+        },
+        "per_query": per_query,
+    }
+
+    print_report(report)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved to {args.output}")
+
+
+def _ms_since(t: float) -> float:
+    return round((time.perf_counter() - t) * 1000, 3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Vector store benchmark: Chroma vs the NumPy store (float32 and int8).
+
+Synthetic clustered, normalized embeddings (all-MiniLM-L6-v2 sized by
+default) with a document_id on every row, so no model or PDF is needed:
+
+    python -m scripts.benchmark_vector_store
+    python -m scripts.benchmark_vector_store --rows 10000 100000 --backends numpy numpy-int8
+
+For each backend and corpus size: build time, cold open (fresh handle +
+first query), single-query p50/p95, batched query throughput, filtered
+query p50 (two documents) and disk size. Recall@k is measured against
+exact brute-force search on the same vectors: 1.0 for the exact NumPy
+store, below 1.0 where quantization (int8) or the HNSW graph (Chroma)
+trades accuracy for speed or memory.
+"""
+import argparse
+import json
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embeddings.numpy_store import NumpyClient
+from embeddings.registry import (
+    get_collection,
+    invalidate_index,
+    register_vector_backend,
+    use_vector_backend,
+)
+
+# ---------------- CONFIG ---------------- #
+
+ROWS = [10_000, 100_000]
+DIM = 384
+DOCUMENTS = 20
+CLUSTERS = 200
+BACKENDS = ["chroma", "numpy", "numpy-int8"]
+
+QUERIES = 200
+BATCH = 32
+TOP_K = 10
+UPSERT_BATCH = 1000
+SEED = 7
+
+BENCH_DIR = Path("data/bench/vector_store")
+OUTPUT_FILE = Path("data/bench/vector_store.json")
+COLLECTION_NAME = "documents"
+
+# ---------------------------------------- #
+
+register_vector_backend("numpy-int8", lambda path: NumpyClient(path, dtype="int8"))
+
+
+def synthetic_vectors(rng, n: int, dim: int, centers: np.ndarray) -> np.ndarray:
+    # Chunk embeddings cluster by topic: a center plus noise, normalized
+    labels = rng.integers(0, len(centers), size=n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors, queries, k, mask=None):
+    scores = queries @ vectors.T
+    if mask is not None:
+        scores[:, ~mask] = -np.inf
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def _percentiles(samples_ms):
+    arr = np.asarray(samples_ms)
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+    }
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def benchmark_backend(backend, vectors, metadatas, queries, truth, filtered_truth, k):
+    directory = BENCH_DIR / f"{backend}_{len(vectors)}"
+    if directory.exists():
+        shutil.rmtree(directory)
+    use_vector_backend(directory, backend)
+
+    ids = [f"c{i}" for i in range(len(vectors))]
+
+    t = time.perf_counter()
+    collection = get_collection(directory, COLLECTION_NAME, create=True)
+    for start in range(0, len(vectors), UPSERT_BATCH):
+        stop = start + UPSERT_BATCH
+        collection.upsert(
+            ids=ids[start:stop],
+            embeddings=vectors[start:stop].tolist(),
+            metadatas=metadatas[start:stop],
+            documents=[""] * len(ids[start:stop]),
+        )
+    build_seconds = time.perf_counter() - t
+
+    # Cold: drop every cached handle, reopen, answer one query
+    invalidate_index(directory)
+    t = time.perf_counter()
+    collection = get_collection(directory, COLLECTION_NAME)
+    collection.query(query_embeddings=queries[:1].tolist(), n_results=k, include=["distances"])
+    open_ms = (time.perf_counter() - t) * 1000
+
+    single = []
+    found = []
+    for q in queries:
+        t = time.perf_counter()
+        raw = collection.query(query_embeddings=[q.tolist()], n_results=k, include=["distances"])
+        single.append((time.perf_counter() - t) * 1000)
+        found.append(raw["ids"][0])
+
+    t = time.perf_counter()
+    for start in range(0, len(queries), BATCH):
+        collection.query(query_embeddings=queries[start:start + BATCH].tolist(),
+                         n_results=k, include=["distances"])
+    batch_qps = len(queries) / (time.perf_counter() - t)
+
+    where = {"document_id": {"$in": ["doc0", "doc1"]}}
+    filtered = []
+    filtered_found = []
+    for q in queries:
+        t = time.perf_counter()
+        raw = collection.query(query_embeddings=[q.tolist()], n_results=k, where=where,
+                               include=["distances"])
+        filtered.append((time.perf_counter() - t) * 1000)
+        filtered_found.append(raw["ids"][0])
+
+    def recall(results, expected):
+        hits = sum(len(set(r) & {ids[j] for j in e}) for r, e in zip(results, expected))
+        return round(hits / (len(expected) * k), 4)
+
+    return {
+        "backend": backend,
+        "rows": len(vectors),
+        "build_seconds": round(build_seconds, 2),
+        "open_ms": round(open_ms, 1),
+        "query_ms": _percentiles(single),
+        "batch_qps": round(batch_qps, 1),
+        "filtered_query_ms": _percentiles(filtered),
+        f"recall@{k}": recall(found, truth),
+        f"filtered_recall@{k}": recall(filtered_found, filtered_truth),
+        "disk_mb": round(dir_size(directory) / 2**20, 1),
+    }
+
+
+def print_table(results, k):
+    print(
+        f"\n{'backend':<12}{'rows':>9}{'build s':>9}{'open ms':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'batch q/s':>11}{'filt p50':>10}{f'R@{k}':>8}{'disk MB':>9}"
+    )
+    for r in results:
+        print(
+            f"{r['backend']:<12}{r['rows']:>9}{r['build_seconds']:>9.2f}{r['open_ms']:>9.1f}"
+            f"{r['query_ms']['p50']:>9.2f}{r['query_ms']['p95']:>9.2f}{r['batch_qps']:>11.1f}"
+            f"{r['filtered_query_ms']['p50']:>10.2f}{r[f'recall@{k}']:>8.3f}{r['disk_mb']:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma vs NumPy vector store")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS)
+    parser.add_argument("--dim", type=int, default=DIM)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS)
+    parser.add_argument("--queries", type=int, default=QUERIES)
+    parser.add_argument("-k", type=int, default=TOP_K)
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(SEED)
+    centers = rng.standard_normal((CLUSTERS, args.dim), dtype=np.float32)
+
+    results = []
+    for rows in args.rows:
+        vectors = synthetic_vectors(rng, rows, args.dim, centers)
+        documents = rng.integers(0, DOCUMENTS, size=rows)
+        metadatas = [{"document_id": f"doc{d}"} for d in documents]
+        queries = synthetic_vectors(rng, args.queries, args.dim, centers)
+
+        truth = exact_top_k(vectors, queries, args.k)
+        filtered_truth = exact_top_k(vectors, queries, args.k, mask=documents < 2)
+
+        for backend in args.backends:
+            print(f"{backend}: {rows} rows")
+            try:
+                results.append(benchmark_backend(
+                    backend, vectors, metadatas, queries, truth, filtered_truth, args.k
+                ))
+            except ImportError as e:
+                print(f"  skipped ({e})")
+
+    print_table(results, args.k)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "dim": args.dim,
+            "queries": args.queries,
+            "results": results,
+        }, f, indent=2)
+    print(f"\nSaved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
-import json
 from embeddings.embedder import Embedder
 from embeddings.vector_store import VectorStore
+from preprocessing.records import find_records, iter_records
 
 
 def build_index():
     """Build the vector index from precomputed chunks.
 
-    Expects `data/processed/chunks.json` to contain items of the form::
+    Expects `data/processed/chunks.jsonl` (or a legacy `chunks.json`) to
+    contain items of the form::
 
         {
             "id": "chunk_00000",
@@ -17,8 +18,10 @@ def build_index():
     We preserve the chunk `id` and `pages` so downstream retrieval and the UI
     can provide page-level traceability back into the PDF.
     """
-    with open("data/processed/chunks.json", "r", encoding="utf-8") as f:
-        chunks = json.load(f)
+    path = find_records("data/processed/chunks.jsonl")
+    if path is None:
+        raise FileNotFoundError("chunks.jsonl not found. Run chunker first.")
+    chunks = list(iter_records(path))
 
     # Use existing chunk IDs when present; fall back to a generated one for
     # backwards compatibility with older chunk formats.
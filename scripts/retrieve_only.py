@@ -1,6 +1,6 @@
 from pathlib import Path
-import chromadb
-from sentence_transformers import SentenceTransformer
+
+from embeddings.registry import get_collection, get_embedding_model
 
 # ---------------- CONFIG ---------------- #
 
@@ -15,11 +15,10 @@ TOP_K = 5
 
 def main():
     # ---- Init Chroma ----
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-    collection = client.get_collection(COLLECTION_NAME)
+    collection = get_collection(CHROMA_DIR, COLLECTION_NAME)
 
     # ---- Load embedder ----
-    embedder = SentenceTransformer(EMBEDDING_MODEL)
+    embedder = get_embedding_model(EMBEDDING_MODEL)
 
     print("\nDocument Retrieval Test")
     print("-" * 40)
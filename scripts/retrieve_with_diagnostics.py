@@ -1,15 +1,17 @@
 import sys
 
 from retrieval.retriever import Retriever
-from retrieval.query_intent import detect_intent, QueryIntent
+from retrieval.query_intent import detect_intent, section_id_from_query, QueryIntent
 from retrieval.aggregation import aggregate_section, aggregate_global
+from retrieval.context_packer import DEFAULT_TOKEN_BUDGET, pack_context
+from preprocessing.section_index import section_sort_key
 
-from llm.offline_ollama import OfflineLLM
-from llm.online_gemini import OnlineGeminiLLM
+from llm.registry import available_backends, get_backend
+from observability.tracing import format_trace, start_trace
 
 
 
-def aggregate_section(results, section_id):
+def aggregate_section(results, section_id, token_budget=DEFAULT_TOKEN_BUDGET, count_tokens=None):
     """
     Robust section aggregation:
     1. Force-include the root section chunk (exact match)
@@ -19,7 +21,6 @@ def aggregate_section(results, section_id):
 
     root_chunks = []
     sub_chunks = []
-    pages = set()
 
     for r in results:
         sid = r.get("section_id")
@@ -32,20 +33,17 @@ def aggregate_section(results, section_id):
             sub_chunks.append(r)
 
     # Sort subsections numerically (3.1 < 3.2 < 3.10)
-    sub_chunks.sort(key=lambda x: x["section_id"])
+    sub_chunks.sort(key=lambda x: section_sort_key(x["section_id"]))
 
     ordered = root_chunks + sub_chunks
-
-    texts = []
-    for r in ordered[:8]:
-        texts.append(r["text"])
-        pages.update(r["pages"])
+    packed = pack_context(ordered, token_budget, count_tokens, max_chunks=8)
 
     return {
         "section": section_id,
-        "pages": sorted(pages),
-        "chunks_used": len(texts),
-        "text": "\n\n".join(texts),
+        "pages": packed["pages"],
+        "chunks_used": packed["chunks_used"],
+        "tokens": packed["tokens"],
+        "text": packed["text"],
     }
 
 def aggregate_document_summary(results):
@@ -100,90 +98,112 @@ def main():
 
     print("\nDocument Intelligence Copilot")
     print("-" * 45)
+    backends = list(available_backends().items())
+
     print("Choose mode:")
     print("1 → Retrieval only (Non-LLM)")
-    print("2 → Offline LLM (LLaMA-3 via Ollama)")
-    print("3 → Online LLM (Gemini)")
-    mode = input("Enter choice [1/2/3]: ").strip()
+    for i, (_, label) in enumerate(backends, start=2):
+        print(f"{i} → {label}")
+    mode = input(f"Enter choice [1-{len(backends) + 1}]: ").strip()
 
     retriever = Retriever()
     llm = None
 
-    if mode == "2":
-        llm = OfflineLLM()
-        print("\nRunning in OFFLINE LLaMA-3 mode")
-    elif mode == "3":
-        llm = OnlineGeminiLLM()
-        print("\nRunning in ONLINE GEMINI mode")
+    if mode.isdigit() and 2 <= int(mode) <= len(backends) + 1:
+        name, label = backends[int(mode) - 2]
+        llm = get_backend(name)
+        print(f"\nRunning in {label} mode")
     else:
         print("\nRunning in NON-LLM mode")
 
+    packing = {
+        "token_budget": llm.context_budget if llm else DEFAULT_TOKEN_BUDGET,
+        "count_tokens": llm.count_tokens if llm else None,
+    }
+
     while True:
         query = input("\nEnter a query (or 'exit'): ").strip()
         if query.lower() == "exit":
             break
 
-        intent = detect_intent(query)
-        print(f"\nDetected intent: {intent.name}")
+        # Each question is traced: request id + one span per stage
+        with start_trace("diagnostics", force=True) as trace:
+            answer_query(query, retriever, llm, packing)
+        print("\n=== Timings ===")
+        print(format_trace(trace))
 
-        results = retriever.search(query, k=30)
-        if not results:
-            print("No results found.")
-            continue
 
-        # ---------- SECTION QUERIES ---------- #
-        if intent == QueryIntent.SECTION:
-            section_id = "".join(c for c in query if c.isdigit() or c == ".").strip(".")
-            if not section_id:
-                print("Could not detect section number.")
-                continue
+def answer_query(query, retriever, llm, packing):
+    intent = detect_intent(query)
+    print(f"\nDetected intent: {intent.name}")
 
-            agg = aggregate_section(results, section_id)
+    # ---------- SECTION QUERIES ---------- #
+    if intent == QueryIntent.SECTION:
+        section_id = section_id_from_query(query)
+        if not section_id:
+            print("Could not detect section number.")
+            return
 
-            print("\n=== Section Retrieval ===")
-            print(f"Section    : {agg['section']}")
-            print(f"Pages      : {agg['pages']}")
-            print(f"Chunks used: {agg['chunks_used']}\n")
+        # Direct lookup in the section index, semantic search as fallback
+        results = retriever.get_section(section_id)
+        print(f"Section index hits: {len(results)}")
+        if not results:
+            results = retriever.search(query, k=30)
 
-            if agg["chunks_used"] == 0:
-                print("No content found for this section.")
-                continue
+        agg = aggregate_section(results, section_id, **packing)
 
-            if llm is None:
-                print(agg["text"])
-            else:
-                context = f"SECTION {section_id}\n\n{agg['text']}"
-                print("\nQuerying LLM...\n")
-                print(llm.answer(query, context, intent.name))
+        print("\n=== Section Retrieval ===")
+        print(f"Section    : {agg['section']}")
+        print(f"Pages      : {agg['pages']}")
+        print(f"Chunks used: {agg['chunks_used']}")
+        print(f"Tokens     : {agg['tokens']} / {packing['token_budget']}\n")
 
-            print("-" * 60)
-            continue
+        if agg["chunks_used"] == 0:
+            print("No content found for this section.")
+            return
 
-        # ---------- DOCUMENT SUMMARY ---------- #
-        if intent == QueryIntent.DOCUMENT_SUMMARY:
-            agg = aggregate_document_summary(results)
+        if llm is None:
+            print(agg["text"])
+        else:
+            context = f"SECTION {section_id}\n\n{agg['text']}"
+            print("\nQuerying LLM...\n")
+            print(llm.answer(query, context, intent.name))
 
-            if llm is None:
-                print("\n=== Retrieved Context ===\n")
-                print(agg["text"])
-            else:
-                print("\nQuerying LLM...\n")
-                print(llm.answer(query, agg["text"], intent.name))
+        print("-" * 60)
+        return
 
-            print("\n" + "-" * 60)
-            continue
+    results = retriever.search(query, k=30)
+    if not results:
+        print("No results found.")
+        return
 
-        # ---------- GENERAL / FACT / WHY / COMPARISON ---------- #
-        context = "\n\n".join(r["text"] for r in results[:8])
+    # ---------- DOCUMENT SUMMARY ---------- #
+    if intent == QueryIntent.DOCUMENT_SUMMARY:
+        agg = aggregate_document_summary(results)
 
         if llm is None:
             print("\n=== Retrieved Context ===\n")
-            print(context)
+            print(agg["text"])
         else:
             print("\nQuerying LLM...\n")
-            print(llm.answer(query, context, intent.name))
+            print(llm.answer(query, agg["text"], intent.name))
 
         print("\n" + "-" * 60)
+        return
+
+    # ---------- GENERAL / FACT / WHY / COMPARISON ---------- #
+    agg = aggregate_global(results, max_chunks=8, **packing)
+    context = agg["text"]
+    print(f"Context: {agg['chunks_used']} chunks, {agg['tokens']} / {packing['token_budget']} tokens")
+
+    if llm is None:
+        print("\n=== Retrieved Context ===\n")
+        print(context)
+    else:
+        print("\nQuerying LLM...\n")
+        print(llm.answer(query, context, intent.name))
+
+    print("\n" + "-" * 60)
 
 
 if __name__ == "__main__":
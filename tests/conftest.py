@@ -0,0 +1,37 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+DIM = 16
+
+
+class HashModel:
+    """
+    Stand-in for a SentenceTransformer: one vector per text hash, and a
+    record of every text it was asked to encode.
+    """
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        digests = [hashlib.sha256(t.encode("utf-8")).digest()[:DIM] for t in texts]
+        return np.array([list(d) for d in digests], dtype=np.float32) + 1.0
+
+
+@pytest.fixture
+def hash_model(tmp_path, monkeypatch):
+    """
+    A HashModel served for every embedding model name; the test runs in
+    its own directory, so the embedding cache starts empty.
+    """
+    import embeddings.engine
+    import retrieval.retriever
+
+    monkeypatch.chdir(tmp_path)
+    model = HashModel()
+    for module in (embeddings.engine, retrieval.retriever):
+        monkeypatch.setattr(module, "get_embedding_model", lambda *a, **k: model)
+    return model
@@ -0,0 +1,159 @@
+"""
+Re-ingesting an edited PDF replaces the previous version of the document:
+only the chunks whose text changed are embedded, vanished ones are gone.
+
+Runs the real pipeline on the NumPy vector store with a small
+deterministic embedding model, so no model download is needed:
+
+    python -m pytest tests/test_incremental_ingest.py
+"""
+import fitz  # PyMuPDF
+import pytest
+
+from embeddings.registry import get_collection, use_vector_backend
+from indexing import index_chunks
+from indexing.corpus import is_indexed, load_corpus
+from indexing.index_chunks import COLLECTION_NAME
+from indexing.pipeline import DocumentConflict, ingest_pdf
+from ingest import pdf_loader
+from ingest.pdf_loader import compute_document_id, compute_document_version
+from preprocessing import chunker
+
+PAGES = 6
+EDITED_PAGE = 2
+
+
+def paragraph(n: int) -> str:
+    return f"Paragraph {n}. " + "The pump must be primed before first use. " * 4 + f"End of {n}."
+
+
+def write_manual(path, edited: bool):
+    doc = fitz.open()
+    for page in range(PAGES):
+        base = 900 if edited and page == EDITED_PAGE else page * 10
+        text = "\n\n".join(paragraph(base + i) for i in range(3))
+        doc.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def indexed_chunks(vector_dir, document_id: str) -> dict:
+    collection = get_collection(vector_dir, COLLECTION_NAME, create=True)
+    raw = collection.get(where={"document_id": document_id}, include=["documents"])
+    return dict(zip(raw["ids"], raw["documents"]))
+
+
+def test_reingesting_edited_pdf_only_embeds_changed_chunks(tmp_path, hash_model):
+    vector_dir = tmp_path / "vector_db"
+    use_vector_backend(vector_dir, "numpy")
+    pdf_path = tmp_path / "manual.pdf"
+
+    write_manual(pdf_path, edited=False)
+    first = ingest_pdf(pdf_path, vector_dir=vector_dir)
+    before = indexed_chunks(vector_dir, first["document_id"])
+    assert len(before) == first["chunks"] == first["vectors"] > 0
+
+    write_manual(pdf_path, edited=True)
+    hash_model.encoded.clear()
+    second = ingest_pdf(pdf_path, vector_dir=vector_dir)
+    after = indexed_chunks(vector_dir, second["document_id"])
+
+    # Same file name: same document, new version
+    assert second["document_id"] == first["document_id"]
+    assert second["version"] != first["version"]
+
+    new_ids = set(after) - set(before)
+    gone_ids = set(before) - set(after)
+    assert new_ids and gone_ids
+    assert len(new_ids) < len(after)
+
+    # Only the edited page's chunks went through the model
+    assert second["vectors"] == len(new_ids)
+    assert sorted(hash_model.encoded) == sorted(after[i] for i in new_ids)
+    assert all("Paragraph 9" in after[i] for i in new_ids)
+
+    # The previous version's vanished chunks are deleted, nothing is duplicated
+    assert second["removed"] == len(gone_ids)
+    collection = get_collection(vector_dir, COLLECTION_NAME)
+    assert collection.count() == len(after) == second["chunks"]
+
+    corpus = load_corpus(vector_dir)
+    assert list(corpus) == [second["document_id"]]
+    assert corpus[second["document_id"]]["version"] == second["version"]
+    assert is_indexed(second["document_id"], vector_dir, version=second["version"])
+    assert not is_indexed(second["document_id"], vector_dir, version=first["version"])
+
+
+def test_reingesting_same_pdf_embeds_nothing(tmp_path, hash_model):
+    vector_dir = tmp_path / "vector_db"
+    use_vector_backend(vector_dir, "numpy")
+    pdf_path = tmp_path / "manual.pdf"
+
+    write_manual(pdf_path, edited=False)
+    first = ingest_pdf(pdf_path, vector_dir=vector_dir)
+    hash_model.encoded.clear()
+    second = ingest_pdf(pdf_path, vector_dir=vector_dir)
+
+    assert second["version"] == first["version"]
+    assert second["vectors"] == second["removed"] == 0
+    assert hash_model.encoded == []
+    assert indexed_chunks(vector_dir, first["document_id"]).keys() == \
+        indexed_chunks(vector_dir, second["document_id"]).keys()
+
+
+def test_same_name_from_different_sources_stays_separate(tmp_path, hash_model):
+    vector_dir = tmp_path / "vector_db"
+    use_vector_backend(vector_dir, "numpy")
+    for folder, edited in (("vendor_a", False), ("vendor_b", True)):
+        (tmp_path / folder).mkdir()
+        write_manual(tmp_path / folder / "manual.pdf", edited=edited)
+
+    a_id = compute_document_id("manual.pdf", key="vendor_a")
+    b_id = compute_document_id("manual.pdf", key="vendor_b")
+    assert a_id != b_id
+
+    first = ingest_pdf(tmp_path / "vendor_a" / "manual.pdf", document_id=a_id, vector_dir=vector_dir)
+    second = ingest_pdf(tmp_path / "vendor_b" / "manual.pdf", document_id=b_id, vector_dir=vector_dir)
+
+    assert set(load_corpus(vector_dir)) == {a_id, b_id}
+    assert len(indexed_chunks(vector_dir, a_id)) == first["chunks"]
+    assert len(indexed_chunks(vector_dir, b_id)) == second["chunks"]
+
+
+def test_reusing_an_id_for_another_file_is_refused(tmp_path, hash_model):
+    vector_dir = tmp_path / "vector_db"
+    use_vector_backend(vector_dir, "numpy")
+    write_manual(tmp_path / "manual.pdf", edited=False)
+    write_manual(tmp_path / "other.pdf", edited=True)
+
+    first = ingest_pdf(tmp_path / "manual.pdf", document_id="doc", vector_dir=vector_dir)
+    with pytest.raises(DocumentConflict):
+        ingest_pdf(tmp_path / "other.pdf", document_id="doc", vector_dir=vector_dir)
+
+    assert load_corpus(vector_dir)["doc"]["filename"] == "manual.pdf"
+    assert len(indexed_chunks(vector_dir, "doc")) == first["chunks"]
+
+
+def test_cli_and_upload_write_the_same_manifest_entry(tmp_path, hash_model):
+    # hash_model runs the test in tmp_path, where the CLI's data/ paths live
+    vector_dir = tmp_path / "vector_db"
+    use_vector_backend(vector_dir, "numpy")
+    pdf_path = tmp_path / "data" / "raw" / "manual.pdf"
+    pdf_path.parent.mkdir(parents=True)
+    (tmp_path / "data" / "processed").mkdir()
+    write_manual(pdf_path, edited=False)
+
+    pdf_loader.main()
+    chunker.main()
+    index_chunks.main(vector_dir=vector_dir, use_cache=False)
+
+    document_id = compute_document_id(pdf_path)
+    version = compute_document_version(pdf_path)
+    assert load_corpus(vector_dir)[document_id]["version"] == version
+    assert is_indexed(document_id, vector_dir, version=version)
+
+    hash_model.encoded.clear()
+    again = ingest_pdf(pdf_path, vector_dir=vector_dir)
+    assert again["document_id"] == document_id
+    assert again["vectors"] == again["removed"] == 0
+    assert hash_model.encoded == []
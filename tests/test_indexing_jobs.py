@@ -0,0 +1,59 @@
+"""
+IndexingJobQueue with several versions of one document: the same version
+is deduplicated, a new one runs after the active job, and only the file
+of the latest successful version ends up under its final name.
+"""
+import threading
+
+import indexing.jobs as jobs_module
+from indexing.jobs import CANCELLED, DONE, FAILED, IndexingJobQueue
+
+
+def test_versions_of_one_document_run_in_order(tmp_path, monkeypatch):
+    release_v1 = threading.Event()
+    v1_running = threading.Event()
+    runs = []
+
+    def fake_ingest(pdf_path, document_id=None, version=None, **kwargs):
+        runs.append((version, pdf_path.read_text()))
+        v1_running.set()
+        if version == "v1":
+            release_v1.wait(5)
+        if version == "broken":
+            raise RuntimeError("corrupt PDF")
+        return {"chunks": 1}
+
+    monkeypatch.setattr(jobs_module, "ingest_pdf", fake_ingest)
+
+    def upload(version):
+        path = tmp_path / f"manual.{version}.pdf"
+        path.write_text(version)
+        return path
+
+    final = tmp_path / "manual.pdf"
+    queue = IndexingJobQueue(workers=2)
+    try:
+        def submit(version):
+            return queue.submit(upload(version), "doc", "manual.pdf", version=version, keep_as=final)
+
+        v1 = submit("v1")
+        assert submit("v1") is v1
+        assert v1_running.wait(5)
+        v2 = submit("v2")
+        v3 = submit("v3")     # v2 is still queued: superseded, cancelled
+
+        release_v1.set()
+        for job in (v1, v2, v3):
+            assert job.finished.wait(5)
+
+        assert (v1.state, v2.state, v3.state) == (DONE, CANCELLED, DONE)
+        assert runs == [("v1", "v1"), ("v3", "v3")]
+        assert final.read_text() == "v3"
+
+        broken = submit("broken")
+        assert broken.finished.wait(5)
+        assert broken.state == FAILED
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["manual.pdf"]
+    finally:
+        release_v1.set()
+        queue.shutdown()
@@ -0,0 +1,56 @@
+"""
+ingest_pdf stages new chunks on disk until it commits: nothing reaches
+the collection before that, and the staging directory is removed
+whether the run commits or is cancelled.
+"""
+import threading
+
+import pytest
+
+from embeddings.registry import get_collection, use_vector_backend
+from indexing.index_chunks import COLLECTION_NAME
+from indexing.pipeline import STAGING_DIRNAME, IngestCancelled, ingest_pdf
+from test_incremental_ingest import indexed_chunks, write_manual
+
+
+def staging_dirs(vector_dir):
+    root = vector_dir / STAGING_DIRNAME
+    return list(root.iterdir()) if root.is_dir() else []
+
+
+def test_staged_batches_are_committed_and_cleaned_up(tmp_path, hash_model):
+    vector_dir = tmp_path / "vector_db"
+    use_vector_backend(vector_dir, "numpy")
+    write_manual(tmp_path / "manual.pdf", edited=False)
+
+    # One chunk per batch: every chunk goes through its own staged file
+    stats = ingest_pdf(tmp_path / "manual.pdf", batch_size=1, vector_dir=vector_dir)
+
+    chunks = indexed_chunks(vector_dir, stats["document_id"])
+    assert len(chunks) == stats["chunks"] == stats["vectors"] > 1
+    assert sorted(chunks.values()) == sorted(hash_model.encoded)
+    assert staging_dirs(vector_dir) == []
+
+
+def test_cancelled_run_leaves_collection_and_staging_empty(tmp_path, hash_model):
+    vector_dir = tmp_path / "vector_db"
+    use_vector_backend(vector_dir, "numpy")
+    write_manual(tmp_path / "manual.pdf", edited=False)
+
+    collection = get_collection(vector_dir, COLLECTION_NAME, create=True)
+    cancel = threading.Event()
+    staged_counts = []
+
+    def progress(snapshot):
+        if snapshot["vectors"] >= 2 and not cancel.is_set():
+            # Batches are embedded and staged, none is visible yet
+            staged_counts.append((snapshot["vectors"], collection.count()))
+            cancel.set()
+
+    with pytest.raises(IngestCancelled):
+        ingest_pdf(tmp_path / "manual.pdf", batch_size=1, vector_dir=vector_dir,
+                   progress=progress, cancel=cancel)
+
+    assert staged_counts == [(2, 0)]
+    assert collection.count() == 0
+    assert staging_dirs(vector_dir) == []
@@ -0,0 +1,52 @@
+"""
+Retriever.search_many_with_timings on more queries than one
+QUERY_BATCH_SIZE batch: stage timings add up over every batch.
+"""
+import time
+
+from embeddings.registry import get_collection, use_vector_backend
+from retrieval import retriever as retriever_module
+from retrieval.rerankers import HeuristicReranker
+from retrieval.retriever import COLLECTION_NAME, QUERY_BATCH_SIZE, Retriever
+
+RERANK_SLEEP = 0.05   # seconds per rerank call, i.e. per batch
+
+
+class SlowReranker(HeuristicReranker):
+    name = "slow"
+
+    def __init__(self):
+        self.calls = 0
+
+    def score_many(self, requests):
+        self.calls += 1
+        time.sleep(RERANK_SLEEP)
+        return super().score_many(requests)
+
+
+def test_stage_timings_add_up_over_batches(tmp_path, hash_model):
+    vector_dir = tmp_path / "vector_db"
+    use_vector_backend(vector_dir, "numpy")
+
+    texts = [f"Chunk {i} about pump priming and valve {i % 7}." for i in range(50)]
+    collection = get_collection(vector_dir, COLLECTION_NAME, create=True)
+    collection.add(
+        ids=[f"doc_chunk_{i}" for i in range(len(texts))],
+        documents=texts,
+        embeddings=hash_model.encode(texts).tolist(),
+        metadatas=[{"document_id": "doc", "source": "doc.pdf", "pages": "1"} for _ in texts],
+    )
+
+    reranker = SlowReranker()
+    retriever = Retriever(hybrid=False, reranker=reranker, use_cache=False, vector_dir=vector_dir)
+    queries = [f"how to prime pump {i}" for i in range(QUERY_BATCH_SIZE + 10)]
+    retriever_module.clear_caches()
+
+    out = retriever.search_many_with_timings(queries, candidate_k=10, final_k=5)
+
+    assert len(out["results"]) == len(queries)
+    assert all(len(r) == 5 for r in out["results"])
+    assert reranker.calls == 2
+    # Both batches are counted, not just the last one
+    assert out["timings"]["rerank"] >= 2 * RERANK_SLEEP * 1000
+    assert out["timings"]["total"] >= out["timings"]["rerank"]